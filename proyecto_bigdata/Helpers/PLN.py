@@ -1,3 +1,51 @@
+# proyecto_bigdata/Helpers/PLN.py
+import os
+import re
+import json
+import math
+import time
+import sqlite3
+import hashlib
+import logging
+import unicodedata
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Etapa de PLN de la carga (palabras clave y resumen de cada libro).
+# PLN_ACTIVO=0 la salta
+PLN_ACTIVO = os.getenv("PLN_ACTIVO", "1") == "1"
+
+# Resultados ya calculados, por huella del texto analizado (SQLite). Vacío =
+# sin caché: cada carga vuelve a procesar todos los libros
+PLN_CACHE_RUTA = os.getenv(
+    "PLN_CACHE_RUTA",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pln.sqlite"),
+)
+
+# Caracteres del texto de cada libro que se analizan (además del título)
+PLN_MAX_CARACTERES = int(os.getenv("PLN_MAX_CARACTERES", "50000"))
+
+# Palabras clave por libro, frases y largo máximo del resumen
+PLN_PALABRAS_CLAVE = int(os.getenv("PLN_PALABRAS_CLAVE", "10"))
+PLN_RESUMEN_FRASES = int(os.getenv("PLN_RESUMEN_FRASES", "3"))
+PLN_RESUMEN_CARACTERES = int(os.getenv("PLN_RESUMEN_CARACTERES", "400"))
+
+# Procesos del pool y libros por tarea; con menos de dos tareas pendientes
+# (o un solo proceso) se procesa en el propio proceso. En la app la carga
+# corre dentro de un worker de gunicorn y un pool por CPU en cada worker se
+# multiplicaría: por defecto no hay pool (los scripts usan todas las CPUs)
+PLN_PROCESOS = int(os.getenv("PLN_PROCESOS", "1"))
+PLN_TRAMO = int(os.getenv("PLN_TRAMO", "200"))
+
+
 def resumir_texto(texto: str | None, max_chars: int = 350) -> str:
     """
     """
@@ -13,3 +61,381 @@ def resumir_texto(texto: str | None, max_chars: int = 350) -> str:
         corte = max_chars
 
     return texto[:corte] + "…"
+
+
+def dividir_pasajes(
+    texto_paginas: Optional[List[str]],
+    max_chars: int = 2000,
+) -> List[Dict[str, Any]]:
+    """
+    Parte el texto de cada página en pasajes de como mucho `max_chars`
+    caracteres (cortando en un espacio y con los espacios compactados).
+    Devuelve [{"pagina": 1, "texto": "..."}, ...]; las páginas se numeran
+    desde 1 y las vacías no generan pasajes.
+    """
+    pasajes: List[Dict[str, Any]] = []
+    for numero, texto in enumerate(texto_paginas or [], start=1):
+        texto = " ".join((texto or "").split())
+        while texto:
+            if len(texto) <= max_chars:
+                corte = len(texto)
+            else:
+                corte = texto.rfind(" ", 0, max_chars + 1)
+                if corte <= 0:
+                    corte = max_chars
+            pasajes.append({"pagina": numero, "texto": texto[:corte]})
+            texto = texto[corte:].lstrip()
+    return pasajes
+
+
+# ---------------------------------------------------------------------
+# Análisis de texto en español (equivalente al analizador "espanol" del
+# índice de Elasticsearch: minúsculas, sin tildes, stopwords y stemming ligero)
+# ---------------------------------------------------------------------
+# Stopwords "_spanish_" de Elasticsearch (lista de Snowball), ya sin tildes
+STOPWORDS_ES = frozenset(
+    """
+    de la que el en y a los del se las por un para con no una su al lo como mas
+    pero sus le ya o este si porque esta entre cuando muy sin sobre tambien me
+    hasta hay donde quien desde todo nos durante todos uno les ni contra otros
+    ese eso ante ellos e esto mi antes algunos que unos yo otro otras otra el
+    tanto esa estos mucho quienes nada muchos cual poco ella estar estas
+    algunas algo nosotros mi mis tu te ti tu tus ellas nosotras vosotros
+    vosotras os mio mia mios mias tuyo tuya tuyos tuyas suyo suya suyos suyas
+    nuestro nuestra nuestros nuestras vuestro vuestra vuestros vuestras esos
+    esas estoy estas esta estamos estais estan este estes estemos esteis esten
+    estare estaras estara estaremos estareis estaran estaria estarias
+    estariamos estariais estarian estaba estabas estabamos estabais estaban
+    estuve estuviste estuvo estuvimos estuvisteis estuvieron estuviera
+    estuvieras estuvieramos estuvierais estuvieran estuviese estuvieses
+    estuviesemos estuvieseis estuviesen estando estado estada estados estadas
+    estad he has ha hemos habeis han haya hayas hayamos hayais hayan habre
+    habras habra habremos habreis habran habria habrias habriamos habriais
+    habrian habia habias habiamos habiais habian hube hubiste hubo hubimos
+    hubisteis hubieron hubiera hubieras hubieramos hubierais hubieran hubiese
+    hubieses hubiesemos hubieseis hubiesen habiendo habido habida habidos
+    habidas soy eres es somos sois son sea seas seamos seais sean sere seras
+    sera seremos sereis seran seria serias seriamos seriais serian era eras
+    eramos erais eran fui fuiste fue fuimos fuisteis fueron fuera fueras
+    fueramos fuerais fueran fuese fueses fuesemos fueseis fuesen siendo sido
+    tengo tienes tiene tenemos teneis tienen tenga tengas tengamos tengais
+    tengan tendre tendras tendra tendremos tendreis tendran tendria tendrias
+    tendriamos tendriais tendrian tenia tenias teniamos teniais tenian tuve
+    tuviste tuvo tuvimos tuvisteis tuvieron tuviera tuvieras tuvieramos
+    tuvierais tuvieran tuviese tuvieses tuviesemos tuvieseis tuviesen teniendo
+    tenido tenida tenidos tenidas tened
+    """.split()
+)
+
+# Como el tokenizer "standard": letras/dígitos/guion bajo, unidos por punto o
+# apóstrofo (p. ej. "libro_1.pdf" es un solo token)
+_PATRON_TOKEN = re.compile(r"[0-9a-z_]+(?:[.'][0-9a-z_]+)*")
+
+
+def plegar_acentos(texto: str) -> str:
+    """
+    Minúsculas y sin tildes ni diéresis ("Canción" -> "cancion").
+    """
+    texto = (texto or "").lower()
+    if texto.isascii():
+        return texto
+    descompuesto = unicodedata.normalize("NFKD", texto)
+    # Se borran de una vez las marcas que aparecen (pocas distintas) en lugar
+    # de mirar carácter a carácter
+    marcas = "".join(c for c in set(descompuesto) if unicodedata.combining(c))
+    if not marcas:
+        return descompuesto
+    return re.sub(f"[{re.escape(marcas)}]", "", descompuesto)
+
+
+def raiz_ligera(token: str) -> str:
+    """
+    Stemmer "light_spanish" de Elasticsearch: quita plurales y la vocal
+    final de las palabras de 5 letras o más.
+    """
+    n = len(token)
+    if n < 5:
+        return token
+    final = token[-1]
+    if final in "aeo":
+        return token[:-1]
+    if final == "s":
+        if token.endswith("eses"):
+            return token[:-2]
+        if token.endswith("ces"):
+            return token[:-3] + "z"
+        if token[-2] in "aeo":
+            return token[:-2]
+    return token
+
+
+def tokenizar(texto: str, stopwords: frozenset = STOPWORDS_ES) -> List[str]:
+    """
+    Tokens de `texto` tal como los indexa el analizador "espanol".
+    """
+    return [
+        raiz_ligera(token)
+        for token in _PATRON_TOKEN.findall(plegar_acentos(texto))
+        if token not in stopwords
+    ]
+
+
+# ---------------------------------------------------------------------
+# Palabras clave y resumen
+# ---------------------------------------------------------------------
+# Palabras de texto (sin números ni nombres de archivo) candidatas a clave
+_PATRON_PALABRA = re.compile(r"[a-zñ]{4,}")
+
+# Final de frase: punto, cierre de interrogación/exclamación o salto de párrafo
+_PATRON_FRASE = re.compile(r"(?<=[.!?])\s+(?=[A-ZÁÉÍÓÚÑ¿¡\"«(0-9])|\n\s*\n")
+
+# Guion de fin de línea de los PDFs ("pala-\nbra")
+_PATRON_GUION = re.compile(r"(\w)-\s*\n\s*(\w)")
+
+# Se cambia si cambian los algoritmos: los resultados guardados dejan de valer
+_VERSION_PLN = "1"
+
+
+def normalizar_texto(texto: Optional[str]) -> str:
+    """
+    Texto extraído de un PDF listo para analizar: forma Unicode NFKC
+    (ligaduras "ﬁ" -> "fi"), palabras cortadas por guion al final de línea
+    unidas y espacios compactados (los saltos de párrafo se conservan).
+    """
+    texto = unicodedata.normalize("NFKC", texto or "")
+    texto = _PATRON_GUION.sub(r"\1\2", texto)
+    parrafos = re.split(r"\n\s*\n", texto)
+    return "\n\n".join(" ".join(p.split()) for p in parrafos if p.strip())
+
+
+def palabras_clave(texto: str, titulo: str = "", n: int = PLN_PALABRAS_CLAVE) -> List[str]:
+    """
+    Las `n` palabras más frecuentes del texto sin stopwords, agrupando las
+    variantes de la misma raíz (raiz_ligera) y contando triple las del
+    título. Cada una sale en la forma más repetida, sin tildes.
+    """
+    palabras = Counter(_PATRON_PALABRA.findall(plegar_acentos(texto)))
+    for palabra in _PATRON_PALABRA.findall(plegar_acentos(titulo)):
+        palabras[palabra] += 3
+
+    raices: Counter = Counter()
+    formas: Dict[str, Tuple[int, str]] = {}
+    for palabra, veces in palabras.items():
+        if palabra in STOPWORDS_ES:
+            continue
+        raiz = raiz_ligera(palabra)
+        raices[raiz] += veces
+        formas[raiz] = max(formas.get(raiz, (0, "")), (veces, palabra))
+    return [formas[raiz][1] for raiz, _ in raices.most_common(n)]
+
+
+def dividir_frases(texto: str) -> List[str]:
+    """
+    Frases de `texto` (corta tras . ! ? seguidos de mayúscula y en los
+    saltos de párrafo).
+    """
+    return [f.strip() for f in _PATRON_FRASE.split(texto) if f and f.strip()]
+
+
+def resumen_extractivo(
+    texto: str,
+    frases: int = PLN_RESUMEN_FRASES,
+    max_chars: int = PLN_RESUMEN_CARACTERES,
+) -> str:
+    """
+    Resumen con las `frases` frases del texto que más palabras frecuentes
+    contienen (puntuación de Luhn: suma de las frecuencias de sus raíces
+    entre la raíz del número de palabras), en su orden original y recortado
+    con resumir_texto.
+    """
+    candidatas = [f for f in dividir_frases(texto) if len(f) >= 20]
+    if not candidatas:
+        return resumir_texto(texto, max_chars)
+    tokens = [tokenizar(f) for f in candidatas]
+    frecuencias = Counter(t for ts in tokens for t in ts)
+    puntos = [
+        sum(frecuencias[t] for t in ts) / math.sqrt(len(ts)) if ts else 0.0
+        for ts in tokens
+    ]
+    elegidas = sorted(sorted(range(len(candidatas)), key=lambda i: -puntos[i])[:frases])
+    return resumir_texto(" ".join(candidatas[i] for i in elegidas), max_chars)
+
+
+def analizar_texto(titulo: str, texto: str) -> Dict[str, Any]:
+    """
+    Palabras clave y resumen de un libro (texto ya normalizado).
+    """
+    return {
+        "palabras_clave": palabras_clave(texto, titulo),
+        "resumen": resumen_extractivo(texto),
+    }
+
+
+# ---------------------------------------------------------------------
+# Etapa por lotes de la carga (con caché y pool de procesos)
+# ---------------------------------------------------------------------
+def _texto_libro(libro: Dict[str, Any]) -> Tuple[str, str]:
+    # Título y primeros PLN_MAX_CARACTERES del texto de sus pasajes
+    partes: List[str] = []
+    restantes = PLN_MAX_CARACTERES
+    pagina = None
+    for pasaje in libro.get("pasajes") or []:
+        if restantes <= 0:
+            break
+        # Cada página empieza párrafo (las frases no cruzan páginas)
+        if pagina is not None and pasaje["pagina"] != pagina:
+            partes.append("\n\n")
+        pagina = pasaje["pagina"]
+        partes.append(pasaje["texto"][:restantes] + " ")
+        restantes -= len(pasaje["texto"])
+    return normalizar_texto(libro.get("titulo")), normalizar_texto("".join(partes))
+
+
+def _analizar_tramo(entradas: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    # Lo que corre en cada proceso del pool
+    return [analizar_texto(titulo, texto) for titulo, texto in entradas]
+
+
+def _clave_cache(titulo: str, texto: str) -> str:
+    datos = f"{_VERSION_PLN}:{PLN_PALABRAS_CLAVE}:{PLN_RESUMEN_FRASES}:{PLN_RESUMEN_CARACTERES}\x00{titulo}\x00{texto}"
+    return hashlib.sha1(datos.encode("utf-8")).hexdigest()
+
+
+class TuberiaPLN:
+    """
+    Etapa de PLN para lotes de libros normalizados: a cada libro le pone
+    "palabras_clave" y "resumen". Los resultados se guardan por huella del
+    texto analizado en `ruta_cache` (SQLite), así que un libro que no cambió
+    no se vuelve a procesar; los que faltan se reparten por tramos entre
+    `procesos` procesos. Hay que cerrarla (o usarla con `with`).
+    """
+
+    def __init__(self, ruta_cache: str = PLN_CACHE_RUTA, procesos: int = PLN_PROCESOS):
+        self.procesos = max(procesos, 1)
+        self.db: Optional[sqlite3.Connection] = None
+        if ruta_cache:
+            self.db = sqlite3.connect(ruta_cache, timeout=30)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS pln (clave TEXT PRIMARY KEY, resultado TEXT)")
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.libros = 0
+        self.procesados = 0
+        self.segundos = 0.0
+
+    def __enter__(self) -> "TuberiaPLN":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.cerrar()
+
+    def cerrar(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def _leer_cache(self, claves: List[str]) -> Dict[str, Dict[str, Any]]:
+        if self.db is None:
+            return {}
+        encontrados: Dict[str, Dict[str, Any]] = {}
+        unicas = list(set(claves))
+        for i in range(0, len(unicas), 500):
+            trozo = unicas[i:i + 500]
+            filas = self.db.execute(
+                f"SELECT clave, resultado FROM pln WHERE clave IN ({','.join('?' * len(trozo))})", trozo
+            )
+            encontrados.update((clave, json.loads(resultado)) for clave, resultado in filas)
+        return encontrados
+
+    def _analizar(self, entradas: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        tramos = [entradas[i:i + PLN_TRAMO] for i in range(0, len(entradas), max(PLN_TRAMO, 1))]
+        if len(tramos) <= 1 or self.procesos <= 1:
+            return [r for t in tramos for r in _analizar_tramo(t)]
+        if self._pool is None:
+            # spawn: la carga corre en un hilo de un worker con más hilos
+            contexto = multiprocessing.get_context("spawn")
+            self._pool = ProcessPoolExecutor(max_workers=self.procesos, mp_context=contexto)
+        return [r for parte in self._pool.map(_analizar_tramo, tramos) for r in parte]
+
+    def procesar_lote(self, lote: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Pone "palabras_clave" y "resumen" a cada libro del lote. Devuelve
+        {"libros", "procesados", "en_cache", "segundos", "docs_por_segundo"}
+        de este lote.
+        """
+        inicio = time.monotonic()
+        entradas = [_texto_libro(libro) for libro in lote]
+        claves = [_clave_cache(titulo, texto) for titulo, texto in entradas]
+        resultados = self._leer_cache(claves)
+
+        pendientes = {}
+        for clave, entrada in zip(claves, entradas):
+            if clave not in resultados:
+                pendientes.setdefault(clave, entrada)
+        if pendientes:
+            nuevos = dict(zip(pendientes, self._analizar(list(pendientes.values()))))
+            resultados.update(nuevos)
+            if self.db is not None:
+                with self.db:
+                    self.db.executemany(
+                        "INSERT OR REPLACE INTO pln (clave, resultado) VALUES (?, ?)",
+                        ((c, json.dumps(r, ensure_ascii=False)) for c, r in nuevos.items()),
+                    )
+
+        for libro, clave in zip(lote, claves):
+            libro.update(resultados[clave])
+
+        segundos = time.monotonic() - inicio
+        self.libros += len(lote)
+        self.procesados += len(pendientes)
+        self.segundos += segundos
+        return {
+            "libros": len(lote),
+            "procesados": len(pendientes),
+            "en_cache": len(lote) - len(pendientes),
+            "segundos": round(segundos, 3),
+            "docs_por_segundo": round(len(lote) / segundos, 1) if segundos > 0 else 0.0,
+        }
+
+    def resumen(self) -> Dict[str, Any]:
+        """
+        Totales desde que se creó la tubería.
+        """
+        return {
+            "libros": self.libros,
+            "procesados": self.procesados,
+            "en_cache": self.libros - self.procesados,
+            "segundos": round(self.segundos, 3),
+            "docs_por_segundo": round(self.libros / self.segundos, 1) if self.segundos > 0 else 0.0,
+        }
+
+
+def procesar_libros(
+    libros: Iterable[Dict[str, Any]],
+    tamano_lote: int = 1000,
+    tuberia: Optional[TuberiaPLN] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Recorre `libros` (normalizados) en lotes de `tamano_lote` y los devuelve
+    con "palabras_clave" y "resumen". Sin `tuberia` crea una y la cierra al
+    terminar.
+    """
+    propia = tuberia is None
+    tuberia = tuberia or TuberiaPLN()
+    try:
+        lote: List[Dict[str, Any]] = []
+        for libro in libros:
+            lote.append(libro)
+            if len(lote) >= tamano_lote:
+                tuberia.procesar_lote(lote)
+                yield from lote
+                lote = []
+        if lote:
+            tuberia.procesar_lote(lote)
+            yield from lote
+    finally:
+        if propia:
+            tuberia.cerrar()
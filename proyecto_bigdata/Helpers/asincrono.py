@@ -0,0 +1,72 @@
+# proyecto_bigdata/Helpers/asincrono.py
+import os
+import asyncio
+import atexit
+import threading
+from typing import Any, Awaitable, Callable, List, Optional
+
+# Un event loop por proceso, en su propio hilo. Los clientes asíncronos de
+# Elasticsearch y MongoDB viven en este loop, así que sus pools se reutilizan
+# entre peticiones (Flask no mantiene un loop propio entre una vista y otra).
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_pid: Optional[int] = None
+_lock = threading.Lock()
+
+# Funciones async que se ejecutan en el loop antes de pararlo (cerrar clientes)
+_al_cerrar: List[Callable[[], Awaitable[None]]] = []
+
+
+def _arrancar_loop() -> asyncio.AbstractEventLoop:
+    loop = asyncio.new_event_loop()
+    hilo = threading.Thread(target=loop.run_forever, name="asincrono", daemon=True)
+    hilo.start()
+    return loop
+
+
+def obtener_loop() -> asyncio.AbstractEventLoop:
+    """
+    Devuelve el loop compartido del proceso (se crea al primer uso y de nuevo
+    tras un fork, porque el hilo del loop no sobrevive al fork).
+    """
+    global _loop, _loop_pid
+    if _loop is not None and _loop_pid == os.getpid():
+        return _loop
+    with _lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = _arrancar_loop()
+            _loop_pid = os.getpid()
+    return _loop
+
+
+def ejecutar(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """
+    Ejecuta una corrutina en el loop compartido y espera su resultado desde
+    código síncrono (vistas de Flask, hilos de ingesta...).
+    """
+    return asyncio.run_coroutine_threadsafe(coro, obtener_loop()).result(timeout)
+
+
+def al_cerrar(funcion: Callable[[], Awaitable[None]]) -> None:
+    """
+    Registra una corrutina (sin argumentos) para liberar recursos al salir.
+    """
+    _al_cerrar.append(funcion)
+
+
+def cerrar_loop() -> None:
+    """
+    Cierra los clientes registrados y para el loop de este proceso.
+    """
+    global _loop
+    if _loop is None or _loop_pid != os.getpid():
+        return
+    for funcion in _al_cerrar:
+        try:
+            ejecutar(funcion(), timeout=10)
+        except Exception:
+            pass
+    _loop.call_soon_threadsafe(_loop.stop)
+    _loop = None
+
+
+atexit.register(cerrar_loop)
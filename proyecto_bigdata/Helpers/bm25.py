@@ -0,0 +1,433 @@
+# proyecto_bigdata/Helpers/bm25.py
+# Buscador local (índice invertido + BM25) para cuando Elasticsearch no
+# responde o para despliegues pequeños sin cluster. Puntúa igual que
+# _build_search_query: multi_match best_fields sobre titulo^3 y ruta_pdf.
+import os
+import json
+import math
+import mmap
+import time
+import struct
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from collections.abc import Sequence as SecuenciaBase
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from dotenv import load_dotenv
+
+from Helpers.PLN import tokenizar
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Archivo del índice local. Vacío = sin buscador local
+BM25_RUTA = os.getenv("BM25_RUTA", "")
+
+# Parámetros BM25 (los de Elasticsearch por defecto)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Campos buscados y su peso, como en _build_search_query
+CAMPOS_BUSQUEDA: Dict[str, float] = {"titulo": 3.0, "ruta_pdf": 1.0}
+
+# Cabecera del archivo: firma + longitud del bloque JSON (solo la posición
+# de cada sección; libros y términos van en secciones mapeadas)
+_FIRMA = b"BM25LIB2"
+_CABECERA = struct.Struct("<8sQ")
+
+
+class _TerminosMapeados:
+    """
+    Diccionario de términos de un campo en un índice cargado de disco. Los
+    términos (UTF-8, ordenados) van seguidos en `textos` y el i-ésimo ocupa
+    [despl[i], despl[i + 1]); sus postings, [inicios[i], inicios[i + 1]).
+    Se busca por bisección, sin pasar el diccionario a objetos de Python.
+    """
+
+    def __init__(self, textos: memoryview, despl: Sequence[int], inicios: Sequence[int]):
+        self.textos = textos
+        self.despl = despl
+        self.inicios = inicios
+
+    def __len__(self) -> int:
+        return len(self.despl) - 1
+
+    def __getitem__(self, i: int) -> bytes:
+        return bytes(self.textos[self.despl[i]:self.despl[i + 1]])
+
+    def get(self, token: str, defecto: Optional[Tuple[int, int]] = None) -> Optional[Tuple[int, int]]:
+        clave = token.encode("utf-8")
+        i = bisect_left(self, clave)
+        if i < len(self) and self[i] == clave:
+            return self.inicios[i], self.inicios[i + 1] - self.inicios[i]
+        return defecto
+
+
+class _FilasMapeadas(SecuenciaBase):
+    """
+    Libros de un índice cargado de disco: el JSON de cada uno se lee del
+    archivo mapeado al pedirlo.
+    """
+
+    def __init__(self, textos: memoryview, despl: Sequence[int]):
+        self.textos = textos
+        self.despl = despl
+
+    def __len__(self) -> int:
+        return len(self.despl) - 1
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return json.loads(bytes(self.textos[self.despl[i]:self.despl[i + 1]]))
+
+
+class IndiceBM25:
+    """
+    Índice invertido por campo. Los postings de cada término son dos tramos
+    de arrays planos (ids internos de documento y frecuencias) y la longitud
+    de cada documento va en otro array; en un índice cargado de disco todos
+    son vistas sobre el archivo mapeado en memoria, igual que los libros y
+    el diccionario de términos.
+    """
+
+    def __init__(
+        self,
+        libros: Sequence[Dict[str, Any]],
+        terminos: Dict[str, Union[Dict[str, Tuple[int, int]], _TerminosMapeados]],
+        docs: Dict[str, Sequence[int]],
+        frecuencias: Dict[str, Sequence[int]],
+        longitudes: Dict[str, Sequence[int]],
+    ):
+        # libros[i] = {"id_libro", "titulo", "ruta_pdf"} del documento interno i
+        self.libros = libros
+        self.terminos = terminos
+        self.docs = docs
+        self.frecuencias = frecuencias
+        self.longitudes = longitudes
+        self.promedios = {
+            campo: (sum(longitudes[campo]) / len(libros)) if libros else 0.0
+            for campo in CAMPOS_BUSQUEDA
+        }
+        self._mapa: Optional[mmap.mmap] = None
+        self._vistas: List[memoryview] = []
+
+    def __len__(self) -> int:
+        return len(self.libros)
+
+    def cerrar(self) -> None:
+        """
+        Suelta las vistas y cierra el archivo mapeado (si se cargó de disco).
+        El índice deja de poder usarse.
+        """
+        for vista in reversed(self._vistas):
+            vista.release()
+        self._vistas = []
+        if self._mapa is not None:
+            self._mapa.close()
+            self._mapa = None
+
+    # -----------------------------------------------------------------
+    # Construcción
+    # -----------------------------------------------------------------
+    @classmethod
+    def construir(cls, libros: Iterable[Dict[str, Any]]) -> "IndiceBM25":
+        """
+        Construye el índice a partir de libros normalizados (los mismos
+        registros que produce parsear_json_libros / normalizar_libro).
+        """
+        filas: List[Dict[str, Any]] = []
+        postings: Dict[str, Dict[str, List[Tuple[int, int]]]] = {c: {} for c in CAMPOS_BUSQUEDA}
+        longitudes = {campo: array("I") for campo in CAMPOS_BUSQUEDA}
+
+        # Ordenados por id_libro: el desempate del orden de resultados es el
+        # id interno, igual que id_libro asc en Elasticsearch
+        for libro in sorted(libros, key=lambda l: _clave_id(l.get("id_libro"))):
+            interno = len(filas)
+            filas.append(
+                {
+                    "id_libro": libro.get("id_libro"),
+                    "titulo": libro.get("titulo"),
+                    "ruta_pdf": libro.get("ruta_pdf"),
+                }
+            )
+            for campo in CAMPOS_BUSQUEDA:
+                tokens = tokenizar(str(libro.get(campo) or ""))
+                longitudes[campo].append(len(tokens))
+                conteo: Dict[str, int] = {}
+                for token in tokens:
+                    conteo[token] = conteo.get(token, 0) + 1
+                for token, tf in conteo.items():
+                    postings[campo].setdefault(token, []).append((interno, tf))
+
+        terminos: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        docs: Dict[str, array] = {}
+        frecuencias: Dict[str, array] = {}
+        for campo, por_termino in postings.items():
+            terminos[campo] = {}
+            docs[campo] = array("I")
+            frecuencias[campo] = array("I")
+            for token in sorted(por_termino):
+                lista = por_termino[token]
+                terminos[campo][token] = (len(docs[campo]), len(lista))
+                docs[campo].extend(d for d, _ in lista)
+                frecuencias[campo].extend(tf for _, tf in lista)
+
+        return cls(filas, terminos, docs, frecuencias, longitudes)
+
+    # -----------------------------------------------------------------
+    # Persistencia
+    # -----------------------------------------------------------------
+    def guardar(self, ruta: str) -> None:
+        """
+        Escribe un índice construido en `ruta` (de forma atómica): cabecera
+        JSON con la posición de cada sección y después las secciones tal
+        cual (arrays, textos de los términos y JSON de cada libro).
+        """
+        secciones: List[Tuple[str, Union[bytes, array]]] = []
+        secciones += _secciones_textos(
+            "libros",
+            [json.dumps(l, ensure_ascii=False, separators=(",", ":")).encode("utf-8") for l in self.libros],
+        )
+        for campo in CAMPOS_BUSQUEDA:
+            ordenados = sorted(self.terminos[campo].items())
+            inicios = array("I", (inicio for _, (inicio, _df) in ordenados))
+            inicios.append(len(self.docs[campo]))
+            secciones += _secciones_textos(f"{campo}.terminos", [t.encode("utf-8") for t, _ in ordenados])
+            secciones += [
+                (f"{campo}.inicios", inicios),
+                (f"{campo}.docs", self.docs[campo]),
+                (f"{campo}.frecuencias", self.frecuencias[campo]),
+                (f"{campo}.longitudes", self.longitudes[campo]),
+            ]
+
+        # Cada sección empieza alineada a 4 bytes (los arrays se leen tal cual)
+        datos = [d if isinstance(d, (bytes, array)) else array("I", d) for _, d in secciones]
+        desplazamiento = 0
+        tramos = {}
+        for (nombre, _), bloque in zip(secciones, datos):
+            largo = len(bloque) * bloque.itemsize if isinstance(bloque, array) else len(bloque)
+            tramos[nombre] = [desplazamiento, largo]
+            desplazamiento += largo + (-largo % 4)
+
+        meta = json.dumps({"tramos": tramos}, separators=(",", ":")).encode("utf-8")
+        meta += b" " * (-len(meta) % 4)
+
+        temporal = ruta + ".tmp"
+        with open(temporal, "wb") as f:
+            f.write(_CABECERA.pack(_FIRMA, len(meta)))
+            f.write(meta)
+            for bloque in datos:
+                if isinstance(bloque, array):
+                    bloque.tofile(f)
+                else:
+                    f.write(bloque)
+                    f.write(b"\0" * (-len(bloque) % 4))
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar(cls, ruta: str) -> "IndiceBM25":
+        """
+        Abre un índice guardado con guardar(). Nada se copia a memoria:
+        postings, términos y libros se leen del archivo mapeado (mmap) según
+        se consultan.
+        """
+        with open(ruta, "rb") as f:
+            mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        firma, largo_meta = _CABECERA.unpack_from(mapa, 0)
+        if firma != _FIRMA:
+            mapa.close()
+            raise ValueError(f"{ruta} no es un índice BM25 válido.")
+
+        inicio_meta = _CABECERA.size
+        tramos = json.loads(bytes(mapa[inicio_meta:inicio_meta + largo_meta]))["tramos"]
+        base = inicio_meta + largo_meta
+        vista = memoryview(mapa)
+        vistas = [vista]
+
+        def _bytes(nombre: str) -> memoryview:
+            desplazamiento, largo = tramos[nombre]
+            parte = vista[base + desplazamiento:base + desplazamiento + largo]
+            vistas.append(parte)
+            return parte
+
+        def _array(nombre: str) -> Sequence[int]:
+            parte = _bytes(nombre).cast("I")
+            vistas.append(parte)
+            return parte
+
+        indice = cls(
+            _FilasMapeadas(_bytes("libros.textos"), _array("libros.despl")),
+            {
+                c: _TerminosMapeados(_bytes(f"{c}.terminos.textos"), _array(f"{c}.terminos.despl"), _array(f"{c}.inicios"))
+                for c in CAMPOS_BUSQUEDA
+            },
+            {c: _array(f"{c}.docs") for c in CAMPOS_BUSQUEDA},
+            {c: _array(f"{c}.frecuencias") for c in CAMPOS_BUSQUEDA},
+            {c: _array(f"{c}.longitudes") for c in CAMPOS_BUSQUEDA},
+        )
+        indice._mapa = mapa
+        indice._vistas = vistas
+        return indice
+
+    # -----------------------------------------------------------------
+    # Búsqueda
+    # -----------------------------------------------------------------
+    def _puntuar_campo(self, campo: str, tokens: List[str]) -> Dict[int, float]:
+        n_docs = len(self.libros)
+        promedio = self.promedios[campo] or 1.0
+        docs, frecuencias, longitudes = self.docs[campo], self.frecuencias[campo], self.longitudes[campo]
+
+        puntos: Dict[int, float] = {}
+        for token in tokens:
+            tramo = self.terminos[campo].get(token)
+            if tramo is None:
+                continue
+            inicio, df = tramo
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for i in range(inicio, inicio + df):
+                doc, tf = docs[i], frecuencias[i]
+                norma = BM25_K1 * (1 - BM25_B + BM25_B * longitudes[doc] / promedio)
+                puntos[doc] = puntos.get(doc, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norma)
+        return puntos
+
+    def buscar(
+        self,
+        texto: str = "",
+        tamano: int = 50,
+        despues_de: Optional[Sequence[Any]] = None,
+    ) -> Tuple[List[Dict[str, Any]], int, Optional[List[Any]]]:
+        """
+        Devuelve (resultados, total, orden_ultimo) ordenados por score desc e
+        id_libro asc. `despues_de` es el `orden_ultimo` de la página anterior
+        ([score, id interno]), como search_after.
+        """
+        tokens = tokenizar(texto or "")
+        if (texto or "").strip():
+            # best_fields: para cada libro cuenta el mejor campo (con su peso)
+            puntos: Dict[int, float] = {}
+            for campo, peso in CAMPOS_BUSQUEDA.items():
+                for doc, valor in self._puntuar_campo(campo, tokens).items():
+                    puntos[doc] = max(puntos.get(doc, 0.0), peso * valor)
+            candidatos = sorted(puntos.items(), key=lambda p: (-p[1], p[0]))
+        else:
+            # Sin texto: todos los libros con score 1.0 (match_all)
+            candidatos = [(doc, 1.0) for doc in range(len(self.libros))]
+
+        total = len(candidatos)
+        if despues_de:
+            score_previo, doc_previo = float(despues_de[0]), int(despues_de[1])
+            candidatos = [
+                (doc, score)
+                for doc, score in candidatos
+                if (-score, doc) > (-score_previo, doc_previo)
+            ]
+
+        pagina = candidatos[:tamano]
+        resultados = [{**self.libros[doc], "score": round(score, 6)} for doc, score in pagina]
+        orden_ultimo = [pagina[-1][1], pagina[-1][0]] if len(pagina) == tamano else None
+        return resultados, total, orden_ultimo
+
+
+def _clave_id(id_libro: Any) -> Tuple[int, Any]:
+    # Enteros antes que textos, para poder ordenar catálogos mixtos
+    return (0, id_libro) if isinstance(id_libro, int) else (1, str(id_libro))
+
+
+def _secciones_textos(nombre: str, textos: List[bytes]) -> List[Tuple[str, Union[bytes, array]]]:
+    # Textos seguidos y dónde empieza cada uno (con el final al cierre)
+    despl = array("I", [0])
+    for texto in textos:
+        despl.append(despl[-1] + len(texto))
+    return [(f"{nombre}.textos", b"".join(textos)), (f"{nombre}.despl", despl)]
+
+
+# ---------------------------------------------------------------------
+# Índice local del proceso
+# ---------------------------------------------------------------------
+_indice: Optional[IndiceBM25] = None
+_indice_mtime: Optional[float] = None
+# El índice sustituido en la última recarga: se cierra en la siguiente, así
+# las búsquedas que aún lo usaban han tenido tiempo de terminar
+_indice_anterior: Optional[IndiceBM25] = None
+_indice_lock = threading.Lock()
+
+
+def obtener_indice_local(ruta: str = BM25_RUTA) -> Optional[IndiceBM25]:
+    """
+    Devuelve el índice local mapeado desde `ruta`, o None si no hay. Si el
+    archivo cambió (otra carga lo reescribió) se vuelve a mapear.
+    """
+    global _indice, _indice_mtime, _indice_anterior
+    if not ruta:
+        return None
+    try:
+        mtime = os.stat(ruta).st_mtime
+    except OSError:
+        return None
+
+    if _indice is not None and _indice_mtime == mtime:
+        return _indice
+    with _indice_lock:
+        if _indice is None or _indice_mtime != mtime:
+            try:
+                nuevo = IndiceBM25.cargar(ruta)
+            except Exception:
+                logger.exception("No se pudo abrir el índice local %s", ruta)
+                return None
+            if _indice_anterior is not None:
+                _indice_anterior.cerrar()
+            _indice_anterior, _indice, _indice_mtime = _indice, nuevo, mtime
+    return _indice
+
+
+def reconstruir_indice_local(
+    libros: Iterable[Dict[str, Any]],
+    ruta: str = BM25_RUTA,
+) -> Optional[Dict[str, Any]]:
+    """
+    Construye el índice local con `libros` y lo guarda en `ruta`. Devuelve
+    {"libros", "segundos"} o None si no hay BM25_RUTA.
+    """
+    if not ruta:
+        return None
+    inicio = time.monotonic()
+    indice = IndiceBM25.construir(libros)
+    indice.guardar(ruta)
+    return {"libros": len(indice), "segundos": round(time.monotonic() - inicio, 3)}
+
+
+def actualizar_indice_local(
+    cambios: Dict[Any, Optional[Dict[str, Any]]],
+    ruta: str = BM25_RUTA,
+) -> Optional[Dict[str, Any]]:
+    """
+    Rehace el índice local a partir del que ya está en `ruta` (sus libros
+    guardan todo lo que se indexa) con `cambios` aplicados: {id_libro: libro
+    nuevo o modificado, o None para quitarlo}. Así una carga incremental no
+    tiene que leer el catálogo entero de Mongo. Devuelve lo mismo que
+    reconstruir_indice_local, o None si no hay BM25_RUTA o no se puede abrir
+    el índice anterior (hay que reconstruirlo entero).
+    """
+    if not ruta:
+        return None
+    try:
+        anterior = IndiceBM25.cargar(ruta)
+    except (OSError, ValueError, struct.error):
+        return None
+    try:
+        libros = [l for l in anterior.libros if l["id_libro"] not in cambios]
+        libros += [
+            {"id_libro": l["id_libro"], "titulo": l.get("titulo"), "ruta_pdf": l.get("ruta_pdf")}
+            for l in cambios.values()
+            if l is not None
+        ]
+    finally:
+        anterior.cerrar()
+    return reconstruir_indice_local(libros, ruta)
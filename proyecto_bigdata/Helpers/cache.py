@@ -0,0 +1,368 @@
+# proyecto_bigdata/Helpers/cache.py
+import os
+import json
+import time
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Tamaño máximo (entradas) y vida (segundos) de la caché de búsquedas
+CACHE_BUSQUEDAS_MAX = int(os.getenv("CACHE_BUSQUEDAS_MAX", "2000"))
+CACHE_BUSQUEDAS_TTL = float(os.getenv("CACHE_BUSQUEDAS_TTL", "300"))
+
+# Última respuesta buena de cada búsqueda, que se sirve si Elasticsearch
+# falla; no depende de la generación, así que sobrevive a las cargas
+CACHE_RESPALDO_MAX = int(os.getenv("CACHE_RESPALDO_MAX", str(CACHE_BUSQUEDAS_MAX)))
+CACHE_RESPALDO_TTL = float(os.getenv("CACHE_RESPALDO_TTL", "86400"))
+
+# Si se indica, las cachés y el contador de generación se guardan en este
+# archivo SQLite y los comparten todos los workers de gunicorn de la máquina.
+CACHE_RUTA = os.getenv("CACHE_RUTA", "")
+
+# Cada cuántos segundos mira cada proceso la generación compartida (la marca
+# que deja cada carga en el índice activo, ver registrar_generacion_compartida)
+CACHE_GENERACION_REVISAR = float(os.getenv("CACHE_GENERACION_REVISAR", "5"))
+
+# Cada cuántas escrituras se recorta la tabla SQLite al máximo de entradas
+_RECORTE_CADA = 100
+
+
+# ---------------------------------------------------------------------
+# Contador de generación del catálogo
+# ---------------------------------------------------------------------
+# Cada carga que termina avanza la generación. Las claves de caché incluyen
+# la generación, así que todo lo cacheado antes de la carga deja de servirse.
+# La carga puede correr en otro worker, en otra máquina o en un script: por
+# eso la generación sale de un estado que ven todos (la marca del índice
+# activo en Elasticsearch, que registra Helpers/elastic.py) y un hilo de cada
+# proceso la relee cada CACHE_GENERACION_REVISAR segundos: las peticiones solo
+# leen el último valor, nunca esperan a Elasticsearch. El contador local (o el
+# de CACHE_RUTA) solo se usa mientras no se ha podido leer esa marca.
+_generacion_local = 0
+_generacion_lock = threading.Lock()
+
+# Cachés en memoria de este proceso: se vacían al avanzar la generación
+_caches_locales: list = []
+
+# Lectura y escritura de la marca compartida, y su último valor leído
+_leer_compartida: Optional[Callable[[], int]] = None
+_marcar_compartida: Optional[Callable[[], None]] = None
+_compartida: Optional[int] = None
+_compartida_lock = threading.Lock()
+_revisor: Optional[threading.Thread] = None
+_revisor_pid: Optional[int] = None
+
+
+def registrar_generacion_compartida(leer: Callable[[], int], marcar: Callable[[], None]) -> None:
+    """
+    Indica de dónde sale la generación compartida: `leer` devuelve la marca
+    actual del catálogo y `marcar` pone una nueva (al terminar una carga).
+    Si `leer` falla se sigue con el último valor leído.
+    """
+    global _leer_compartida, _marcar_compartida
+    _leer_compartida, _marcar_compartida = leer, marcar
+
+
+def _releer_compartida() -> None:
+    # Lee la marca y, si cambió, vacía las cachés locales de este proceso
+    global _compartida
+    if _leer_compartida is None:
+        return
+    valor = _leer_compartida()
+    with _compartida_lock:
+        if valor != _compartida:
+            if _compartida is not None:
+                _limpiar_locales()
+            _compartida = valor
+
+
+def _bucle_compartida() -> None:
+    while True:
+        try:
+            _releer_compartida()
+        except Exception:
+            logger.debug("No se pudo leer la generación compartida", exc_info=True)
+        time.sleep(CACHE_GENERACION_REVISAR)
+
+
+def _asegurar_revisor() -> None:
+    # Un hilo por proceso; con gunicorn se arranca en cada worker tras el fork
+    global _revisor, _revisor_pid
+    if _revisor is not None and _revisor_pid == os.getpid() and _revisor.is_alive():
+        return
+    with _compartida_lock:
+        if _revisor is None or _revisor_pid != os.getpid() or not _revisor.is_alive():
+            _revisor = threading.Thread(target=_bucle_compartida, name="generacion", daemon=True)
+            _revisor.start()
+            _revisor_pid = os.getpid()
+
+
+def _generacion_compartida() -> Optional[int]:
+    # Solo el último valor leído por el hilo: None hasta la primera lectura
+    if _leer_compartida is None:
+        return None
+    _asegurar_revisor()
+    return _compartida
+
+
+def _limpiar_locales() -> None:
+    for cache in _caches_locales:
+        cache.limpiar()
+
+
+def generacion_actual() -> int:
+    """
+    Devuelve la generación actual del catálogo: la marca compartida si hay
+    una registrada y se pudo leer; si no, el contador de CACHE_RUTA o el de
+    este proceso.
+    """
+    compartida = _generacion_compartida()
+    if compartida is not None:
+        return compartida
+    if CACHE_RUTA:
+        con = _conexion_sqlite()
+        with _sqlite_lock:
+            fila = con.execute(
+                "SELECT valor FROM meta WHERE clave = 'generacion'"
+            ).fetchone()
+        return int(fila[0]) if fila else 0
+    return _generacion_local
+
+
+def avanzar_generacion() -> int:
+    """
+    Marca que terminó una carga del catálogo. Devuelve la nueva generación.
+    """
+    global _generacion_local
+    if _marcar_compartida is not None:
+        try:
+            _marcar_compartida()
+        except Exception:
+            logger.exception("No se pudo marcar la nueva generación del catálogo")
+        # Este proceso la ve ya; los demás en CACHE_GENERACION_REVISAR segundos
+        try:
+            _releer_compartida()
+        except Exception:
+            logger.warning("No se pudo releer la generación compartida tras la carga")
+    if CACHE_RUTA:
+        con = _conexion_sqlite()
+        with _sqlite_lock, con:
+            con.execute(
+                "INSERT INTO meta (clave, valor) VALUES ('generacion', 1) "
+                "ON CONFLICT(clave) DO UPDATE SET valor = valor + 1"
+            )
+        return generacion_actual()
+
+    with _generacion_lock:
+        _generacion_local += 1
+        _limpiar_locales()
+    return generacion_actual()
+
+
+# ---------------------------------------------------------------------
+# Caché LRU con TTL en memoria del proceso
+# ---------------------------------------------------------------------
+class CacheLRU:
+    """
+    Caché en memoria con un máximo de entradas (se expulsa la menos usada)
+    y caducidad por TTL. Es segura entre hilos.
+    """
+
+    def __init__(self, max_entradas: int, ttl: float):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._datos: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.expirados = 0
+
+    def obtener(self, clave: Hashable) -> Optional[Any]:
+        """Devuelve el valor cacheado o None si no está o caducó."""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+
+            valor, expira = entrada
+            if expira < time.monotonic():
+                del self._datos[clave]
+                self.expirados += 1
+                self.fallos += 1
+                return None
+
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def guardar(self, clave: Hashable, valor: Any) -> None:
+        with self._lock:
+            self._datos[clave] = (valor, time.monotonic() + self.ttl)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        consultas = self.aciertos + self.fallos
+        return {
+            "entradas": len(self),
+            "max_entradas": self.max_entradas,
+            "ttl": self.ttl,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "desalojos": self.desalojos,
+            "expirados": self.expirados,
+            "ratio_aciertos": round(self.aciertos / consultas, 3) if consultas else 0.0,
+        }
+
+
+# ---------------------------------------------------------------------
+# Caché compartida entre workers (SQLite local)
+# ---------------------------------------------------------------------
+_sqlite_con: Optional[sqlite3.Connection] = None
+_sqlite_pid: Optional[int] = None
+_sqlite_lock = threading.Lock()
+
+
+def _conexion_sqlite() -> sqlite3.Connection:
+    """
+    Conexión al archivo CACHE_RUTA, una por proceso (se recrea tras un fork).
+    """
+    global _sqlite_con, _sqlite_pid
+    if _sqlite_con is None or _sqlite_pid != os.getpid():
+        con = sqlite3.connect(CACHE_RUTA, timeout=5, check_same_thread=False)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor INTEGER)"
+        )
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " tabla TEXT, clave TEXT, valor TEXT, expira REAL, usado REAL,"
+            " PRIMARY KEY (tabla, clave))"
+        )
+        con.execute("CREATE INDEX IF NOT EXISTS cache_usado ON cache (tabla, usado)")
+        con.commit()
+        _sqlite_con, _sqlite_pid = con, os.getpid()
+    return _sqlite_con
+
+
+class CacheSQLite(CacheLRU):
+    """
+    Misma interfaz que CacheLRU pero guardando las entradas (en JSON) en el
+    archivo CACHE_RUTA, compartido por todos los procesos de la máquina.
+    Los contadores de aciertos/fallos son de este proceso.
+    """
+
+    def __init__(self, nombre: str, max_entradas: int, ttl: float):
+        super().__init__(max_entradas, ttl)
+        self.nombre = nombre
+        self._escrituras = 0
+
+    @staticmethod
+    def _clave(clave: Hashable) -> str:
+        return json.dumps(clave, ensure_ascii=False, default=str)
+
+    def obtener(self, clave: Hashable) -> Optional[Any]:
+        con = _conexion_sqlite()
+        ahora = time.time()
+        with _sqlite_lock:
+            fila = con.execute(
+                "SELECT valor, expira FROM cache WHERE tabla = ? AND clave = ?",
+                (self.nombre, self._clave(clave)),
+            ).fetchone()
+            if fila is None or fila[1] < ahora:
+                self.fallos += 1
+                if fila is not None:
+                    self.expirados += 1
+                return None
+            with con:
+                con.execute(
+                    "UPDATE cache SET usado = ? WHERE tabla = ? AND clave = ?",
+                    (ahora, self.nombre, self._clave(clave)),
+                )
+        self.aciertos += 1
+        return json.loads(fila[0])
+
+    def guardar(self, clave: Hashable, valor: Any) -> None:
+        con = _conexion_sqlite()
+        ahora = time.time()
+        with _sqlite_lock, con:
+            con.execute(
+                "INSERT OR REPLACE INTO cache (tabla, clave, valor, expira, usado) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    self.nombre,
+                    self._clave(clave),
+                    json.dumps(valor, ensure_ascii=False, default=str),
+                    ahora + self.ttl,
+                    ahora,
+                ),
+            )
+            self._escrituras += 1
+            if self._escrituras % _RECORTE_CADA == 0:
+                cur = con.execute(
+                    "DELETE FROM cache WHERE tabla = ? AND (expira < ? OR clave IN ("
+                    " SELECT clave FROM cache WHERE tabla = ?"
+                    " ORDER BY usado DESC LIMIT -1 OFFSET ?))",
+                    (self.nombre, ahora, self.nombre, self.max_entradas),
+                )
+                self.desalojos += cur.rowcount
+
+    def limpiar(self) -> None:
+        con = _conexion_sqlite()
+        with _sqlite_lock, con:
+            con.execute("DELETE FROM cache WHERE tabla = ?", (self.nombre,))
+
+    def __len__(self) -> int:
+        con = _conexion_sqlite()
+        with _sqlite_lock:
+            fila = con.execute(
+                "SELECT COUNT(*) FROM cache WHERE tabla = ?", (self.nombre,)
+            ).fetchone()
+        return int(fila[0])
+
+
+def crear_cache(
+    nombre: str,
+    max_entradas: int,
+    ttl: float,
+    por_generacion: bool = True,
+) -> CacheLRU:
+    """
+    Devuelve una caché SQLite compartida si hay CACHE_RUTA, o una en memoria.
+    Las claves deben incluir generacion_actual() para invalidarse solas
+    cuando termina una carga. Con `por_generacion=False` la caché en memoria
+    tampoco se vacía al avanzar la generación (solo caduca por TTL).
+    """
+    if CACHE_RUTA:
+        return CacheSQLite(nombre, max_entradas, ttl)
+    cache = CacheLRU(max_entradas, ttl)
+    if por_generacion:
+        _caches_locales.append(cache)
+    return cache
+
+
+def normalizar_consulta(texto: str) -> str:
+    """
+    Normaliza el texto de una búsqueda para usarlo como clave de caché.
+    """
+    return " ".join((texto or "").lower().split())
@@ -0,0 +1,284 @@
+# proyecto_bigdata/Helpers/descargas.py
+# Entrega de los PDFs del catálogo y de sus miniaturas (primera página).
+# Las respuestas admiten peticiones Range (206) y GET condicional (ETag /
+# Last-Modified, 304), y el cuerpo es el propio archivo: gunicorn lo envía
+# con sendfile sin pasar los bytes por Python. Detrás de nginx, con
+# PDFS_X_ACCEL, el worker solo contesta la cabecera X-Accel-Redirect y es
+# nginx quien sirve el archivo.
+# Las miniaturas se generan durante la carga con pdftoppm (poppler-utils);
+# si no está instalado, la carga sigue sin miniaturas.
+import os
+import re
+import shutil
+import hashlib
+import logging
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+from urllib.parse import quote
+
+from dotenv import load_dotenv
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import wrap_file
+
+from Helpers.cache import crear_cache, generacion_actual
+from Helpers.mongoDB import obtener_libro_mongo
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Carpeta con los PDFs en esta máquina. Solo se sirven archivos de dentro;
+# vacío = sin descargas
+PDFS_RAIZ = os.getenv("PDFS_RAIZ", "")
+
+# Prefijo de ruta_pdf en el catálogo (la carpeta donde se generó, p. ej. en
+# Colab) que se cambia por PDFS_RAIZ. Las rutas relativas cuelgan de PDFS_RAIZ
+PDFS_PREFIJO_CATALOGO = os.getenv("PDFS_PREFIJO_CATALOGO", "")
+
+# Location interna de nginx que apunta a PDFS_RAIZ. Si se indica, los PDFs
+# los sirve nginx (X-Accel-Redirect) en vez del worker
+PDFS_X_ACCEL = os.getenv("PDFS_X_ACCEL", "")
+
+# Segundos que el navegador puede reutilizar un PDF o una miniatura sin
+# preguntar (después revalida con ETag / Last-Modified)
+PDFS_MAX_AGE = int(os.getenv("PDFS_MAX_AGE", "3600"))
+
+# Carpeta de las miniaturas (JPEG de la primera página); vacío = sin miniaturas
+MINIATURAS_DIR = os.getenv("MINIATURAS_DIR", "")
+
+# Ancho en píxeles de las miniaturas y renders a la vez durante la carga
+MINIATURAS_ANCHO = int(os.getenv("MINIATURAS_ANCHO", "160"))
+MINIATURAS_HILOS = int(os.getenv("MINIATURAS_HILOS", str(os.cpu_count() or 1)))
+
+# Segundos como mucho por render (un PDF roto no bloquea la carga)
+_RENDER_TIMEOUT = 60
+
+# Bloque de lectura cuando el servidor no puede usar sendfile
+_BLOQUE = 64 * 1024
+
+_NOMBRE_SEGURO = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# id_libro -> ruta_pdf del catálogo, para no consultar Mongo en cada tramo
+# que pide el visor (por generación: se vacía al terminar una carga)
+_cache_rutas = crear_cache("rutas_pdf", 10000, 300)
+
+
+# ---------------------------------------------------------------------
+# Rutas en disco
+# ---------------------------------------------------------------------
+def resolver_pdf(ruta_pdf: Optional[str]) -> Optional[str]:
+    """
+    Ruta real en esta máquina del PDF de un libro (`ruta_pdf` del
+    catálogo), o None si no hay PDFS_RAIZ, el archivo no existe o queda
+    fuera de PDFS_RAIZ (rutas con "..", enlaces simbólicos, etc.).
+    """
+    if not PDFS_RAIZ or not ruta_pdf:
+        return None
+    ruta = ruta_pdf
+    if PDFS_PREFIJO_CATALOGO and ruta.startswith(PDFS_PREFIJO_CATALOGO):
+        ruta = ruta[len(PDFS_PREFIJO_CATALOGO):].lstrip("/\\")
+    raiz = os.path.realpath(PDFS_RAIZ)
+    ruta = os.path.realpath(os.path.join(raiz, ruta))
+    if os.path.commonpath([raiz, ruta]) != raiz or not os.path.isfile(ruta):
+        return None
+    return ruta
+
+
+def pdf_de_libro(id_libro: str) -> Optional[str]:
+    """
+    Ruta real del PDF del libro `id_libro` (ver resolver_pdf), o None.
+    """
+    clave = (generacion_actual(), str(id_libro))
+    ruta_pdf = _cache_rutas.obtener(clave)
+    if ruta_pdf is None:
+        libro = obtener_libro_mongo(str(id_libro), ["ruta_pdf"])
+        ruta_pdf = (libro or {}).get("ruta_pdf") or ""
+        _cache_rutas.guardar(clave, ruta_pdf)
+    return resolver_pdf(ruta_pdf)
+
+
+def ruta_x_accel(ruta: str) -> str:
+    """
+    URI interna de nginx (PDFS_X_ACCEL) de un PDF ya resuelto.
+    """
+    relativa = os.path.relpath(ruta, os.path.realpath(PDFS_RAIZ)).replace(os.sep, "/")
+    return PDFS_X_ACCEL.rstrip("/") + "/" + quote(relativa)
+
+
+def ruta_miniatura(id_libro: Any) -> str:
+    """
+    Archivo de la miniatura de un libro dentro de MINIATURAS_DIR. Los ids
+    con caracteres raros se cambian por su hash para no salir de la carpeta.
+    """
+    nombre = str(id_libro)
+    if not _NOMBRE_SEGURO.match(nombre):
+        nombre = hashlib.blake2b(nombre.encode("utf-8"), digest_size=16).hexdigest()
+    return os.path.join(MINIATURAS_DIR, f"{nombre}.jpg")
+
+
+def miniaturas_disponibles(ids: Iterable[Any]) -> Set[str]:
+    """
+    Ids (como texto) de los libros de `ids` que tienen miniatura en disco.
+    """
+    if not MINIATURAS_DIR:
+        return set()
+    return {str(i) for i in ids if os.path.isfile(ruta_miniatura(i))}
+
+
+# ---------------------------------------------------------------------
+# Respuestas HTTP
+# ---------------------------------------------------------------------
+def _leer_tramo(archivo, largo: int) -> Iterator[bytes]:
+    with archivo:
+        while largo > 0:
+            bloque = archivo.read(min(_BLOQUE, largo))
+            if not bloque:
+                break
+            largo -= len(bloque)
+            yield bloque
+
+
+def respuesta_archivo(
+    environ: Dict[str, Any],
+    ruta: str,
+    mimetype: str,
+    nombre: Optional[str] = None,
+    max_age: int = PDFS_MAX_AGE,
+) -> Response:
+    """
+    Respuesta con el archivo `ruta`: 304 si el cliente ya lo tiene (ETag o
+    Last-Modified), 206 con el tramo pedido en Range, o 200 con el archivo
+    entero. El cuerpo va en wsgi.file_wrapper con el archivo posicionado
+    al inicio del tramo, así que gunicorn lo manda con sendfile (respeta el
+    desplazamiento y el Content-Length). Lanza RequestedRangeNotSatisfiable
+    (416) si el rango no es válido.
+    """
+    st = os.stat(ruta)
+    respuesta = Response(mimetype=mimetype)
+    respuesta.set_etag(f"{st.st_mtime_ns:x}-{st.st_size:x}")
+    respuesta.last_modified = int(st.st_mtime)
+    respuesta.cache_control.public = True
+    respuesta.cache_control.max_age = max_age
+    respuesta.content_length = st.st_size
+    if nombre:
+        respuesta.headers.set("Content-Disposition", "inline", filename=nombre)
+
+    # Decide 304 / 206 / 200 y las cabeceras; el cuerpo se pone después
+    respuesta.make_conditional(environ, accept_ranges=True, complete_length=st.st_size)
+    if respuesta.status_code not in (200, 206) or environ.get("REQUEST_METHOD") == "HEAD":
+        return respuesta
+
+    archivo = open(ruta, "rb")
+    largo = st.st_size
+    if respuesta.status_code == 206:
+        archivo.seek(respuesta.content_range.start)
+        largo = respuesta.content_length
+    gunicorn = environ.get("SERVER_SOFTWARE", "").startswith("gunicorn") and "wsgi.file_wrapper" in environ
+    if respuesta.status_code == 200 or gunicorn:
+        respuesta.response = wrap_file(environ, archivo, _BLOQUE)
+    else:
+        # Otros servidores leerían el file_wrapper hasta el final del archivo
+        respuesta.response = _leer_tramo(archivo, largo)
+    respuesta.direct_passthrough = True
+    return respuesta
+
+
+def respuesta_x_accel(ruta: str, mimetype: str, nombre: Optional[str] = None) -> Response:
+    """
+    Respuesta vacía que le pide a nginx servir el PDF (con sus propios
+    Range, ETag y sendfile).
+    """
+    respuesta = Response(mimetype=mimetype)
+    respuesta.headers["X-Accel-Redirect"] = ruta_x_accel(ruta)
+    respuesta.cache_control.public = True
+    respuesta.cache_control.max_age = PDFS_MAX_AGE
+    if nombre:
+        respuesta.headers.set("Content-Disposition", "inline", filename=nombre)
+    return respuesta
+
+
+# ---------------------------------------------------------------------
+# Miniaturas
+# ---------------------------------------------------------------------
+def generar_miniatura(ruta_pdf: str, destino: str, ancho: int = MINIATURAS_ANCHO) -> bool:
+    """
+    Dibuja la primera página de `ruta_pdf` como JPEG de `ancho` píxeles en
+    `destino` (se escribe aparte y se renombra, así que nunca se sirve a
+    medias). Devuelve False si pdftoppm no está o falla.
+    """
+    pdftoppm = shutil.which("pdftoppm")
+    if not pdftoppm:
+        return False
+    carpeta = os.path.dirname(destino) or "."
+    with tempfile.TemporaryDirectory(dir=carpeta) as temporal:
+        prefijo = os.path.join(temporal, "pagina")
+        try:
+            subprocess.run(
+                [pdftoppm, "-f", "1", "-l", "1", "-singlefile", "-jpeg",
+                 "-scale-to-x", str(ancho), "-scale-to-y", "-1", ruta_pdf, prefijo],
+                check=True,
+                capture_output=True,
+                timeout=_RENDER_TIMEOUT,
+            )
+            os.replace(prefijo + ".jpg", destino)
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.debug("Sin miniatura para %s: %s", ruta_pdf, e)
+            return False
+    return True
+
+
+class GeneradorMiniaturas:
+    """
+    Genera durante una carga las miniaturas que faltan o que son más viejas
+    que su PDF, con MINIATURAS_HILOS renders a la vez (cada render es un
+    pdftoppm aparte, así que bastan hilos).
+    """
+
+    def __init__(self, carpeta: str = MINIATURAS_DIR, hilos: int = MINIATURAS_HILOS):
+        self.activo = bool(carpeta) and bool(PDFS_RAIZ) and shutil.which("pdftoppm") is not None
+        if carpeta and not self.activo:
+            logger.warning("Miniaturas desactivadas: hacen falta PDFS_RAIZ y pdftoppm (poppler-utils).")
+        self._pool = None
+        if self.activo:
+            os.makedirs(carpeta, exist_ok=True)
+            self._pool = ThreadPoolExecutor(max_workers=max(hilos, 1), thread_name_prefix="miniaturas")
+
+    def cerrar(self) -> None:
+        if self._pool:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def __enter__(self) -> "GeneradorMiniaturas":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.cerrar()
+
+    def generar_lote(self, lote: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Devuelve {"generadas", "al_dia", "sin_pdf", "fallidas"} del lote.
+        """
+        resultado = {"generadas": 0, "al_dia": 0, "sin_pdf": 0, "fallidas": 0}
+        if not self.activo:
+            return resultado
+
+        pendientes = []
+        for libro in lote:
+            ruta = resolver_pdf(libro.get("ruta_pdf"))
+            if ruta is None:
+                resultado["sin_pdf"] += 1
+                continue
+            destino = ruta_miniatura(libro["id_libro"])
+            try:
+                if os.stat(destino).st_mtime >= os.stat(ruta).st_mtime:
+                    resultado["al_dia"] += 1
+                    continue
+            except OSError:
+                pass
+            pendientes.append((ruta, destino))
+
+        for hecha in self._pool.map(lambda p: generar_miniatura(*p), pendientes):
+            resultado["generadas" if hecha else "fallidas"] += 1
+        return resultado
@@ -0,0 +1,439 @@
+# proyecto_bigdata/Helpers/duplicados.py
+# Libros casi duplicados (el mismo libro con otro nombre de archivo u otra
+# edición) detectados durante la carga con MinHash + LSH: cada libro tiene
+# una firma MinHash de sus trigramas de palabras (título y comienzo del
+# texto), que se parte en bandas; solo se comparan los libros que coinciden
+# en alguna banda, así que el coste crece con el número de libros y no con
+# el de parejas. Los grupos y su libro canónico se guardan en un archivo
+# SQLite (las firmas no se recalculan si el libro no cambió) y cada libro
+# lleva "id_canonico" en Elasticsearch y MongoDB para plegar los resultados.
+import os
+import json
+import time
+import zlib
+import random
+import sqlite3
+import hashlib
+import logging
+from array import array
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+from dotenv import load_dotenv
+
+from Helpers.PLN import tokenizar
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Archivo SQLite con las firmas y los grupos. Vacío = sin detección
+DUPLICADOS_RUTA = os.getenv("DUPLICADOS_RUTA", "")
+
+# Fracción de la firma que tiene que coincidir (estimación de la similitud
+# de Jaccard entre los trigramas) para considerar dos libros el mismo
+DUPLICADOS_UMBRAL = float(os.getenv("DUPLICADOS_UMBRAL", "0.7"))
+
+# Caracteres del texto de cada libro que se leen (además del título)
+DUPLICADOS_MAX_CARACTERES = int(os.getenv("DUPLICADOS_MAX_CARACTERES", "20000"))
+
+# Candidatos que se verifican por libro como mucho (una cubeta enorme, p. ej.
+# de títulos genéricos sin texto, no debe hacer la carga cuadrática)
+DUPLICADOS_MAX_CANDIDATOS = int(os.getenv("DUPLICADOS_MAX_CANDIDATOS", "200"))
+
+# Firma de 128 valores en 32 bandas de 4: dos libros con similitud 0,7
+# coinciden en alguna banda con probabilidad > 0,99; con 0,3, el 23 %
+PERMUTACIONES = 128
+BANDAS = 32
+_FILAS_BANDA = PERMUTACIONES // BANDAS
+
+# "One permutation hashing": un solo hash universal (a * x + b) mod p sobre
+# el crc32 de cada trigrama reparte los trigramas en PERMUTACIONES cubos y
+# cada valor de la firma es el mínimo de su cubo (una pasada por libro en
+# lugar de una por permutación). Los cubos vacíos copian el siguiente lleno
+# más un salto que depende de la distancia ("densificación")
+_PRIMO = 4294967291
+_azar = random.Random(20251)
+_A, _B = _azar.randrange(1, _PRIMO), _azar.randrange(0, _PRIMO)
+_VACIO = 0xFFFFFFFF
+_SALTO = _PRIMO // PERMUTACIONES // PERMUTACIONES
+
+# Se cambia si cambia cómo se calculan las firmas: invalida el archivo
+_VERSION = f"2:{PERMUTACIONES}:{BANDAS}:{DUPLICADOS_MAX_CARACTERES}"
+
+_ESQUEMA = (
+    "CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT)",
+    # clave = id_libro en JSON (conserva si era número o texto); orden = el
+    # primero que se vio es el canónico de su grupo; publicado = id_canonico
+    # que tienen guardado Elasticsearch y MongoDB; movido = carga en la que
+    # cambió de grupo
+    "CREATE TABLE IF NOT EXISTS libros ("
+    " clave TEXT PRIMARY KEY, orden INTEGER, huella TEXT, firma BLOB,"
+    " canonico TEXT, publicado TEXT, movido INTEGER, carga INTEGER,"
+    " titulo TEXT, ruta_pdf TEXT)",
+    "CREATE INDEX IF NOT EXISTS libros_canonico ON libros (canonico)",
+    "CREATE TABLE IF NOT EXISTS cubetas (cubeta INTEGER, clave TEXT)",
+    "CREATE INDEX IF NOT EXISTS cubetas_cubeta ON cubetas (cubeta, clave)",
+)
+
+
+# ---------------------------------------------------------------------
+# Firmas MinHash
+# ---------------------------------------------------------------------
+def _trigramas(libro: Dict[str, Any]) -> Set[int]:
+    partes = [libro.get("titulo") or ""]
+    restantes = DUPLICADOS_MAX_CARACTERES
+    for pasaje in libro.get("pasajes") or []:
+        if restantes <= 0:
+            break
+        partes.append(pasaje["texto"][:restantes])
+        restantes -= len(pasaje["texto"])
+    tokens = tokenizar(" ".join(partes))
+    if len(tokens) < 3:
+        # Títulos muy cortos sin texto: cada palabra cuenta sola
+        return {zlib.crc32(t.encode("utf-8")) for t in tokens}
+    return {zlib.crc32(" ".join(tokens[i:i + 3]).encode("utf-8")) for i in range(len(tokens) - 2)}
+
+
+def firma_minhash(libro: Dict[str, Any]) -> Optional[array]:
+    """
+    Firma MinHash (PERMUTACIONES enteros de 32 bits) de un libro normalizado,
+    o None si no tiene ni título ni texto.
+    """
+    trigramas = _trigramas(libro)
+    if not trigramas:
+        return None
+    firma = array("I", [_VACIO]) * PERMUTACIONES
+    for x in trigramas:
+        cubo, valor = divmod((_A * x + _B) % _PRIMO, _PRIMO // PERMUTACIONES + 1)
+        if valor < firma[cubo]:
+            firma[cubo] = valor
+    llenos = [i for i, v in enumerate(firma) if v != _VACIO]
+    if len(llenos) < PERMUTACIONES:
+        for i in range(PERMUTACIONES):
+            if firma[i] == _VACIO:
+                # Siguiente cubo lleno (dando la vuelta)
+                j = next((c for c in llenos if c > i), llenos[0])
+                distancia = (j - i) % PERMUTACIONES
+                firma[i] = (firma[j] + distancia * _SALTO) % _VACIO
+    return firma
+
+
+def similitud_firmas(a: array, b: array) -> float:
+    """
+    Fracción de posiciones iguales: estima la similitud de Jaccard.
+    """
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def _cubetas(firma: array) -> List[int]:
+    # Una clave de 63 bits por banda (el número de banda va dentro)
+    claves = []
+    for banda in range(BANDAS):
+        trozo = firma[banda * _FILAS_BANDA:(banda + 1) * _FILAS_BANDA]
+        resumen = hashlib.blake2b(trozo.tobytes() + bytes([banda]), digest_size=8).digest()
+        claves.append(int.from_bytes(resumen, "little") >> 1)
+    return claves
+
+
+# ---------------------------------------------------------------------
+# Detector (lo usa la ingesta, un lote cada vez)
+# ---------------------------------------------------------------------
+class DetectorDuplicados:
+    """
+    Grupos de casi duplicados guardados en el SQLite de `ruta`. La memoria
+    usada no depende del tamaño del catálogo: firmas, cubetas y grupos
+    están en el archivo y se consultan libro a libro.
+
+    Cada carga: marcar_lote() por cada lote (pone "id_canonico" y
+    "duplicado" en los libros antes de enviarlos), confirmar() con los que
+    llegaron a ambos almacenes y, al final, terminar() y pendientes() para
+    corregir los libros que cambiaron de grupo después de enviarse.
+    """
+
+    def __init__(self, ruta: str = DUPLICADOS_RUTA):
+        self.ruta = ruta
+        self.db = sqlite3.connect(ruta, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.db:
+            for sentencia in _ESQUEMA:
+                self.db.execute(sentencia)
+            version = self._meta("version")
+            if version is not None and version != _VERSION:
+                # Firmas de otra configuración: no se pueden comparar con las nuevas
+                logger.info("Duplicados: cambió la configuración de las firmas, se recalculan todas")
+                self.db.execute("DELETE FROM cubetas")
+                self.db.execute("UPDATE libros SET huella = NULL, firma = NULL, canonico = clave")
+            self._guardar_meta("version", _VERSION)
+            self.carga = int(self._meta("carga") or 0) + 1
+            self._guardar_meta("carga", self.carga)
+        self.orden = int(self._meta("orden") or 0)
+        self.firmados = 0
+        self.reagrupados = 0
+
+    def _meta(self, clave: str) -> Optional[str]:
+        fila = self.db.execute("SELECT valor FROM meta WHERE clave = ?", (clave,)).fetchone()
+        return fila[0] if fila else None
+
+    def _guardar_meta(self, clave: str, valor: Any) -> None:
+        self.db.execute(
+            "INSERT INTO meta (clave, valor) VALUES (?, ?) ON CONFLICT(clave) DO UPDATE SET valor = excluded.valor",
+            (clave, str(valor)),
+        )
+
+    def cerrar(self) -> None:
+        self.db.close()
+
+    # -- grupos --------------------------------------------------------
+    def _mover_grupo(self, de: str, a: str) -> None:
+        movidos = self.db.execute(
+            "UPDATE libros SET canonico = ?, movido = ? WHERE canonico = ?", (a, self.carga, de)
+        ).rowcount
+        self.reagrupados += movidos
+
+    def _quitar(self, clave: str) -> None:
+        """
+        Saca un libro de las cubetas y de su grupo. Si era el canónico, pasa
+        a serlo el siguiente miembro más antiguo.
+        """
+        fila = self.db.execute("SELECT firma FROM libros WHERE clave = ?", (clave,)).fetchone()
+        if fila and fila[0]:
+            self.db.executemany(
+                "DELETE FROM cubetas WHERE cubeta = ? AND clave = ?",
+                ((cubeta, clave) for cubeta in _cubetas(array("I", fila[0]))),
+            )
+        siguiente = self.db.execute(
+            "SELECT clave FROM libros WHERE canonico = ? AND clave != ? ORDER BY orden LIMIT 1", (clave, clave)
+        ).fetchone()
+        if siguiente:
+            self._mover_grupo(clave, siguiente[0])
+        self.db.execute("UPDATE libros SET canonico = clave WHERE clave = ?", (clave,))
+
+    def _candidatos(self, clave: str, cubetas: List[int]) -> List[str]:
+        marcas = ",".join("?" * len(cubetas))
+        filas = self.db.execute(
+            f"SELECT DISTINCT clave FROM cubetas WHERE cubeta IN ({marcas}) AND clave != ? LIMIT ?",
+            (*cubetas, clave, DUPLICADOS_MAX_CANDIDATOS),
+        )
+        return [f[0] for f in filas]
+
+    def _agrupar(self, clave: str, firma: array) -> None:
+        cubetas = _cubetas(firma)
+        grupos = {clave}
+        for candidato in self._candidatos(clave, cubetas):
+            otro, canonico = self.db.execute(
+                "SELECT firma, canonico FROM libros WHERE clave = ?", (candidato,)
+            ).fetchone()
+            if canonico not in grupos and similitud_firmas(firma, array("I", otro)) >= DUPLICADOS_UMBRAL:
+                grupos.add(canonico)
+
+        if len(grupos) > 1:
+            # El canónico del grupo unido es el libro visto primero
+            marcas = ",".join("?" * len(grupos))
+            canonico = self.db.execute(
+                f"SELECT clave FROM libros WHERE clave IN ({marcas}) ORDER BY orden LIMIT 1", tuple(grupos)
+            ).fetchone()[0]
+            for grupo in grupos - {canonico}:
+                self._mover_grupo(grupo, canonico)
+        self.db.executemany("INSERT INTO cubetas (cubeta, clave) VALUES (?, ?)", ((c, clave) for c in cubetas))
+
+    def marcar_lote(self, lote: List[Dict[str, Any]]) -> int:
+        """
+        Firma los libros nuevos o modificados del lote, los agrupa con sus
+        casi duplicados y pone en cada libro "id_canonico" (el id del primer
+        libro visto de su grupo) y "duplicado" (si no es ese). Devuelve
+        cuántos libros del lote son duplicados.
+        """
+        with self.db:
+            for libro in lote:
+                clave = json.dumps(libro["id_libro"])
+                fila = self.db.execute("SELECT orden, huella FROM libros WHERE clave = ?", (clave,)).fetchone()
+                if fila and fila[1] is not None and fila[1] == libro.get("huella"):
+                    self.db.execute("UPDATE libros SET carga = ? WHERE clave = ?", (self.carga, clave))
+                    continue
+
+                if fila:
+                    self._quitar(clave)
+                    orden = fila[0]
+                else:
+                    self.orden += 1
+                    orden = self.orden
+                firma = firma_minhash(libro)
+                self.firmados += 1
+                self.db.execute(
+                    "INSERT INTO libros (clave, orden, huella, firma, canonico, carga, titulo, ruta_pdf)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(clave) DO UPDATE SET"
+                    " huella = excluded.huella, firma = excluded.firma, carga = excluded.carga,"
+                    " titulo = excluded.titulo, ruta_pdf = excluded.ruta_pdf",
+                    (
+                        clave, orden, libro.get("huella"), firma.tobytes() if firma is not None else None,
+                        clave, self.carga, libro.get("titulo"), libro.get("ruta_pdf"),
+                    ),
+                )
+                if firma is not None:
+                    self._agrupar(clave, firma)
+            self._guardar_meta("orden", self.orden)
+
+            # Se leen al final: un libro del lote puede haber unido grupos
+            duplicados = 0
+            for libro in lote:
+                canonico = self.db.execute(
+                    "SELECT canonico FROM libros WHERE clave = ?", (json.dumps(libro["id_libro"]),)
+                ).fetchone()[0]
+                libro["id_canonico"] = json.loads(canonico)
+                libro["duplicado"] = libro["id_canonico"] != libro["id_libro"]
+                duplicados += libro["duplicado"]
+        return duplicados
+
+    def confirmar(self, libros: Iterable[Dict[str, Any]]) -> None:
+        """
+        Anota que estos libros ya se guardaron con su "id_canonico" en
+        Elasticsearch y en MongoDB.
+        """
+        with self.db:
+            self.db.executemany(
+                "UPDATE libros SET publicado = ?, movido = NULL WHERE clave = ?",
+                ((json.dumps(l["id_canonico"]), json.dumps(l["id_libro"])) for l in libros if "id_canonico" in l),
+            )
+
+    def terminar(self, eliminar_no_vistos: bool) -> int:
+        """
+        Con `eliminar_no_vistos`, saca de los grupos los libros que no
+        venían en esta carga. Devuelve cuántos se sacaron.
+        """
+        if not eliminar_no_vistos:
+            return 0
+        eliminados = 0
+        while True:
+            with self.db:
+                claves = [
+                    f[0] for f in self.db.execute(
+                        "SELECT clave FROM libros WHERE carga != ? LIMIT 1000", (self.carga,)
+                    )
+                ]
+                for clave in claves:
+                    self._quitar(clave)
+                    self.db.execute("DELETE FROM libros WHERE clave = ?", (clave,))
+            eliminados += len(claves)
+            if not claves:
+                return eliminados
+
+    def contar(self) -> Dict[str, int]:
+        """
+        Libros, grupos con más de un libro y libros que no son el canónico.
+        """
+        libros, duplicados = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(canonico != clave), 0) FROM libros"
+        ).fetchone()
+        grupos = self.db.execute(
+            "SELECT COUNT(DISTINCT canonico) FROM libros WHERE canonico != clave"
+        ).fetchone()[0]
+        return {"libros": libros, "grupos": grupos, "duplicados": duplicados}
+
+    def pendientes(self, tamano_lote: int) -> Iterator[Dict[Any, Any]]:
+        """
+        Lotes {id_libro: id_canonico} de los libros cuyo canónico no es el
+        que tienen guardado los almacenes (cambiaron de grupo después de
+        enviarse). Cada lote se da por publicado al pedir el siguiente.
+        """
+        while True:
+            filas = self.db.execute(
+                "SELECT clave, canonico FROM libros"
+                " WHERE canonico != COALESCE(publicado, clave) OR movido = ? LIMIT ?",
+                (self.carga, tamano_lote),
+            ).fetchall()
+            if not filas:
+                return
+            yield {json.loads(clave): json.loads(canonico) for clave, canonico in filas}
+            with self.db:
+                self.db.executemany(
+                    "UPDATE libros SET publicado = canonico, movido = NULL WHERE clave = ?",
+                    ((clave,) for clave, _ in filas),
+                )
+
+
+# ---------------------------------------------------------------------
+# Informe para revisar los grupos
+# ---------------------------------------------------------------------
+def informe_duplicados(ruta: str = DUPLICADOS_RUTA, minimo: int = 2) -> Iterator[Dict[str, Any]]:
+    """
+    Recorre los grupos con al menos `minimo` libros, de mayor a menor:
+    {"id_canonico", "libros": [{"id_libro", "titulo", "ruta_pdf"}, ...]}
+    con el canónico primero.
+    """
+    db = sqlite3.connect(ruta, timeout=30)
+    try:
+        grupos = db.execute(
+            "SELECT canonico FROM libros GROUP BY canonico HAVING COUNT(*) >= ? ORDER BY COUNT(*) DESC, canonico",
+            (max(minimo, 1),),
+        ).fetchall()
+        for (canonico,) in grupos:
+            miembros = db.execute(
+                "SELECT clave, titulo, ruta_pdf FROM libros WHERE canonico = ? ORDER BY orden", (canonico,)
+            )
+            yield {
+                "id_canonico": json.loads(canonico),
+                "libros": [
+                    {"id_libro": json.loads(clave), "titulo": titulo, "ruta_pdf": ruta_pdf}
+                    for clave, titulo, ruta_pdf in miembros
+                ],
+            }
+    finally:
+        db.close()
+
+
+def copiar_grupos(destino: str, ruta: str = DUPLICADOS_RUTA) -> bool:
+    """
+    Copia el archivo de grupos en `destino` (con la API de copia de SQLite,
+    así que sale entero aunque haya una carga escribiendo). Devuelve False
+    si todavía no existe.
+    """
+    if not os.path.exists(ruta):
+        return False
+    origen = sqlite3.connect(ruta, timeout=30)
+    copia = sqlite3.connect(destino)
+    try:
+        origen.backup(copia)
+    finally:
+        copia.close()
+        origen.close()
+    return True
+
+
+def marcar_catalogo(
+    libros: Iterable[Dict[str, Any]],
+    ruta: str,
+    tamano_lote: int = 5000,
+    progreso: Optional[Callable[[int], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Agrupa un catálogo entero en el archivo `ruta` sin tocar Elasticsearch
+    ni MongoDB (para el informe). Los libros que no vienen salen de los
+    grupos, así que no debe ser el DUPLICADOS_RUTA de las cargas: usar una
+    copia (ver copiar_grupos).
+    """
+    inicio = time.monotonic()
+    detector = DetectorDuplicados(ruta)
+    leidos = 0
+    try:
+        lote: List[Dict[str, Any]] = []
+        for libro in libros:
+            lote.append(libro)
+            if len(lote) >= tamano_lote:
+                detector.marcar_lote(lote)
+                leidos += len(lote)
+                lote = []
+                if progreso:
+                    progreso(leidos)
+        if lote:
+            detector.marcar_lote(lote)
+            leidos += len(lote)
+        detector.terminar(eliminar_no_vistos=True)
+        conteo = detector.contar()
+    finally:
+        detector.cerrar()
+    return {
+        **conteo,
+        "firmados": detector.firmados,
+        "segundos": round(time.monotonic() - inicio, 3),
+    }
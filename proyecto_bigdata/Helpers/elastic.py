@@ -1,48 +1,340 @@
 # proyecto_bigdata/Helpers/elastic.py
 import os
+import re
 import json
-from typing import Any, Dict, List, Tuple
+import base64
+import hashlib
+import time
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from dotenv import load_dotenv
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import ApiError, Elasticsearch, NotFoundError, TransportError, helpers
+
+from Helpers.PLN import dividir_pasajes, resumir_texto
+from Helpers.bm25 import obtener_indice_local
+from Helpers.cache import (
+    CACHE_BUSQUEDAS_MAX,
+    CACHE_BUSQUEDAS_TTL,
+    CACHE_RESPALDO_MAX,
+    CACHE_RESPALDO_TTL,
+    avanzar_generacion,
+    crear_cache,
+    generacion_actual,
+    normalizar_consulta,
+    registrar_generacion_compartida,
+)
+from Helpers.metricas import medir, observar_bulk, observar_took, registrar_recolector
+from Helpers.resiliencia import ESTADOS_INTERRUPTOR, CircuitoAbierto, Proteccion
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Variables de entorno (Render)
 ES_CLOUD_ID = os.getenv("ES_CLOUD_ID", "")
 ES_API_KEY = os.getenv("ES_API_KEY", "")
 
+# Alternativa a ES_CLOUD_ID: URL de un Elasticsearch propio (p. ej. local)
+ES_URL = os.getenv("ES_URL", "")
+
 # Nombre fijo del índice de libros en Elasticsearch
 INDICE_LIBROS = os.getenv("ES_INDEX_NAME", "libros_bigdata")
 
+# Generaciones del índice que se conservan tras cada carga (para poder revertir)
+ES_RETENER_GENERACIONES = int(os.getenv("ES_RETENER_GENERACIONES", "2"))
+
+# Paginación con search_after (opcionalmente fijada a un point-in-time)
+ES_USAR_PIT = os.getenv("ES_USAR_PIT", "0") == "1"
+ES_PIT_KEEP_ALIVE = os.getenv("ES_PIT_KEEP_ALIVE", "5m")
+ORDEN_RESULTADOS = [{"_score": {"order": "desc"}}, {"id_libro": {"order": "asc"}}]
+
+# Valor del desempate _shard_doc (que añade el PIT) para seguir tras la
+# primera página, buscada sin PIT: id_libro ya es único, así que con el
+# máximo el último libro de esa página queda atrás
+_SHARD_DOC_MAX = 2**63 - 1
+
+# Campos de _source que traen las búsquedas (los que pintan las plantillas)
+CAMPOS_RESULTADO = ["id_libro", "titulo", "ruta_pdf", "resumen", "palabras_clave"]
+
+# Total de resultados: "exacto" (o "true"), "no" (o "false", no se cuenta)
+# o un número N (exacto hasta N; por encima, el total es "N o más", como hace
+# Elasticsearch por defecto con 10000)
+ES_TOTAL_HITS = os.getenv("ES_TOTAL_HITS", "10000")
+
+
+def _track_total_hits(valor: str) -> Any:
+    # Valor de track_total_hits para Elasticsearch; uno no válido no impide
+    # arrancar: se avisa y se usa el tope por defecto
+    valor = valor.strip().lower()
+    if valor in ("exacto", "true", "no", "false"):
+        return valor in ("exacto", "true")
+    try:
+        tope = int(valor)
+    except ValueError:
+        tope = -1
+    if tope < 0:
+        logger.warning("ES_TOTAL_HITS=%r no es válido; se usa 10000", valor)
+        return 10000
+    return tope
+
+
+TOTAL_HITS = _track_total_hits(ES_TOTAL_HITS)
+
+# Solo lo que se usa de cada respuesta de búsqueda
+_FILTRO_RESPUESTA = [
+    "took", "pit_id", "hits.total", "hits.hits._score", "hits.hits._source", "hits.hits.sort", "aggregations",
+    "hits.hits.inner_hits.pasajes.hits.hits._source", "hits.hits.inner_hits.pasajes.hits.hits.highlight",
+]
+
+# Facetas de /buscar: valores por faceta y ancho (años) de cada barra del
+# histograma de años
+FACETAS_TAMANO = int(os.getenv("FACETAS_TAMANO", "10"))
+FACETAS_ANIO_INTERVALO = int(os.getenv("FACETAS_ANIO_INTERVALO", "10"))
+
+# Texto de los libros: cada página se parte en pasajes de como mucho
+# PASAJES_MAX_CARACTERES que se indexan como hijos del libro. Cada resultado
+# trae sus PASAJES_POR_RESULTADO mejores pasajes con un fragmento resaltado
+# de como mucho PASAJES_FRAGMENTO caracteres. BUSCAR_EN_TEXTO=0 busca solo
+# por título y ruta.
+PASAJES_MAX_CARACTERES = int(os.getenv("PASAJES_MAX_CARACTERES", "2000"))
+PASAJES_POR_RESULTADO = int(os.getenv("PASAJES_POR_RESULTADO", "3"))
+PASAJES_FRAGMENTO = int(os.getenv("PASAJES_FRAGMENTO", "240"))
+BUSCAR_EN_TEXTO = os.getenv("BUSCAR_EN_TEXTO", "1") == "1"
+
+# Con la detección de casi duplicados (Helpers/duplicados.py), cada grupo sale
+# una sola vez en /buscar: su canónico si coincide con la consulta y, si no,
+# el duplicado que mejor puntúa. DUPLICADOS_PLEGAR=0 los muestra todos
+DUPLICADOS_PLEGAR = os.getenv("DUPLICADOS_PLEGAR", "1") == "1"
+
+# "elastic" (por defecto; el índice local de Helpers/bm25.py, si existe, se
+# usa solo cuando Elasticsearch falla) o "local" (solo el índice local)
+BUSQUEDA_BACKEND = os.getenv("BUSQUEDA_BACKEND", "elastic")
+
+# Ajustes del índice una vez terminada la carga (durante la carga se usan
+# AJUSTES_CARGA_MASIVA)
+ES_SHARDS = int(os.getenv("ES_SHARDS", "1"))
+ES_REPLICAS = int(os.getenv("ES_REPLICAS", "1"))
+ES_REFRESH_INTERVAL = os.getenv("ES_REFRESH_INTERVAL", "1s")
+ES_FORCEMERGE = os.getenv("ES_FORCEMERGE", "1") == "1"
+ES_TIMEOUT_MANTENIMIENTO = float(os.getenv("ES_TIMEOUT_MANTENIMIENTO", "600"))
+
+# Motor de indexación masiva (ver indexar_documentos)
+ES_BULK_HILOS = int(os.getenv("ES_BULK_HILOS", "4"))
+ES_BULK_DOCS = int(os.getenv("ES_BULK_DOCS", "500"))
+ES_BULK_BYTES = int(os.getenv("ES_BULK_BYTES", str(10 * 1024 * 1024)))
+ES_BULK_REINTENTOS = int(os.getenv("ES_BULK_REINTENTOS", "5"))
+ES_BULK_BACKOFF = float(os.getenv("ES_BULK_BACKOFF", "1"))
+ES_BULK_BACKOFF_MAX = float(os.getenv("ES_BULK_BACKOFF_MAX", "30"))
+# Timeout (segundos) de cada petición _bulk, la envíe el script o una carga
+ES_TIMEOUT_BULK = float(os.getenv("ES_TIMEOUT_BULK", "60"))
+
+# Errores por documento que se guardan en el resultado (el resto solo se cuenta)
+MAX_ERRORES_REPORTADOS = 1000
+
+# Configuración del pool de conexiones del cliente compartido
+ES_POOL_CONEXIONES = int(os.getenv("ES_POOL_CONEXIONES", "10"))
+ES_TIMEOUT = float(os.getenv("ES_TIMEOUT", "10"))
+ES_MAX_REINTENTOS = int(os.getenv("ES_MAX_REINTENTOS", "3"))
+ES_REINTENTAR_TIMEOUT = os.getenv("ES_REINTENTAR_TIMEOUT", "1") == "1"
+ES_KEEPALIVE = os.getenv("ES_KEEPALIVE", "1") == "1"
+
+# Tiempo máximo (segundos) de cada llamada según su tipo: búsquedas, y
+# consultas de estado (ping, count, stats, alias); el resto usa ES_TIMEOUT
+ES_TIMEOUT_BUSQUEDA = float(os.getenv("ES_TIMEOUT_BUSQUEDA", "3"))
+ES_TIMEOUT_ADMIN = float(os.getenv("ES_TIMEOUT_ADMIN", "2"))
+
+# Reintentos (con espera exponencial y jitter) de las lecturas; las
+# escrituras que no son idempotentes no se reintentan
+ES_REINTENTOS_LECTURA = int(os.getenv("ES_REINTENTOS_LECTURA", "1"))
+ES_REINTENTO_BACKOFF = float(os.getenv("ES_REINTENTO_BACKOFF", "0.1"))
+ES_REINTENTO_BACKOFF_MAX = float(os.getenv("ES_REINTENTO_BACKOFF_MAX", "1"))
+
+# Circuito: fallos seguidos para abrirlo y segundos hasta la llamada de prueba
+ES_CIRCUITO_FALLOS = int(os.getenv("ES_CIRCUITO_FALLOS", "5"))
+ES_CIRCUITO_ESPERA = float(os.getenv("ES_CIRCUITO_ESPERA", "15"))
+
+# Llamadas a la vez por proceso y espera (segundos) por un turno libre antes
+# de dar la llamada por perdida
+ES_MAX_CONCURRENTES = int(os.getenv("ES_MAX_CONCURRENTES", str(ES_POOL_CONEXIONES)))
+ES_ESPERA_TURNO = float(os.getenv("ES_ESPERA_TURNO", "0.1"))
+
+# Resultados de buscar_libros por (generación, texto normalizado, tamaño, ...)
+_cache_busquedas = crear_cache("busquedas", CACHE_BUSQUEDAS_MAX, CACHE_BUSQUEDAS_TTL)
+
+# Las mismas páginas sin la generación: lo que se sirve si Elasticsearch falla
+_cache_respaldo = crear_cache("busquedas_respaldo", CACHE_RESPALDO_MAX, CACHE_RESPALDO_TTL, por_generacion=False)
+
+# Un único cliente por proceso (igual que _client en Helpers/mongoDB.py)
+_es_client: Optional[Elasticsearch] = None
+_es_lock = threading.Lock()
+
 
 # ---------------------------------------------------------------------
 # Cliente de Elasticsearch
 # ---------------------------------------------------------------------
 def get_es_client() -> Elasticsearch:
     """
-    Crea el cliente de Elasticsearch usando cloud_id y api_key.
+    Devuelve el cliente compartido de Elasticsearch (cloud_id + api_key, o
+    ES_URL si se indica).
+
+    Se crea de forma perezosa la primera vez que se usa en cada proceso, así
+    que con gunicorn cada worker abre su propio pool después del fork.
     """
+    global _es_client
+    if _es_client is not None:
+        return _es_client
+
+    with _es_lock:
+        if _es_client is None:
+            with medir("elastic", "crear_cliente"):
+                _es_client = Elasticsearch(**_opciones_cliente_es())
+    return _es_client
+
+
+def _opciones_cliente_es() -> Dict[str, Any]:
+    # Conexión y pool, los mismos para el cliente síncrono y el asíncrono
+    # (Helpers/elastic_async.py)
+    return {
+        **_conexion_es(),
+        "connections_per_node": ES_POOL_CONEXIONES,
+        "request_timeout": ES_TIMEOUT,
+        "max_retries": ES_MAX_REINTENTOS,
+        "retry_on_timeout": ES_REINTENTAR_TIMEOUT,
+        "retry_on_status": (429, 502, 503, 504),
+        "headers": {"Connection": "keep-alive" if ES_KEEPALIVE else "close"},
+    }
+
+
+def _conexion_es() -> Dict[str, Any]:
+    if ES_URL:
+        return {"hosts": [ES_URL], "api_key": ES_API_KEY or None}
     if not ES_CLOUD_ID or not ES_API_KEY:
         raise RuntimeError(
             "Faltan ES_CLOUD_ID o ES_API_KEY en las variables de entorno."
         )
+    return {"cloud_id": ES_CLOUD_ID, "api_key": ES_API_KEY}
 
-    client = Elasticsearch(
-        cloud_id=ES_CLOUD_ID,
-        api_key=ES_API_KEY,
-    )
-    return client
+
+def cerrar_es_client() -> None:
+    """
+    Cierra el cliente compartido y libera sus conexiones.
+    Se registra con atexit y se puede llamar desde el hook worker_exit de gunicorn.
+    """
+    global _es_client
+    with _es_lock:
+        if _es_client is not None:
+            try:
+                _es_client.close()
+            finally:
+                _es_client = None
+
+
+def _reiniciar_tras_fork() -> None:
+    # El hijo no debe reutilizar los sockets del padre: se descarta la
+    # referencia (sin cerrarla) y se creará un cliente nuevo al primer uso.
+    global _es_client, _es_lock
+    _es_client = None
+    _es_lock = threading.Lock()
+
+
+atexit.register(cerrar_es_client)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reiniciar_tras_fork)
+
+
+# ---------------------------------------------------------------------
+# Protección de las llamadas (timeouts, reintentos y circuito)
+# ---------------------------------------------------------------------
+def _fallo_del_cluster(error: BaseException) -> bool:
+    # Red, timeouts y 429/5xx son culpa del cluster; un 4xx es un problema
+    # de la petición y no cuenta para el circuito
+    if isinstance(error, TransportError):
+        return True
+    if isinstance(error, ApiError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+_proteccion_es = Proteccion(
+    "Elasticsearch",
+    _fallo_del_cluster,
+    fallos_para_abrir=ES_CIRCUITO_FALLOS,
+    espera_apertura=ES_CIRCUITO_ESPERA,
+    max_concurrentes=ES_MAX_CONCURRENTES,
+    espera_turno=ES_ESPERA_TURNO,
+    backoff=ES_REINTENTO_BACKOFF,
+    backoff_max=ES_REINTENTO_BACKOFF_MAX,
+)
+
+
+def _llamar_es(
+    operacion: str,
+    llamada: Callable[[Elasticsearch], Any],
+    timeout: float = ES_TIMEOUT,
+    reintentos: int = 0,
+    compartimento: bool = True,
+    vigilar: bool = True,
+) -> Any:
+    """
+    Ejecuta `llamada(es)` con el cliente compartido limitado a `timeout`
+    segundos y sin los reintentos propios del transporte: los hace
+    _proteccion_es (hasta `reintentos`, con jitter) y, con el circuito
+    abierto o sin turnos libres, falla enseguida con CircuitoAbierto o
+    Saturado. `compartimento` y `vigilar` son los de Proteccion.proteger.
+    La llamada se mide como ("elastic", operacion).
+    """
+    es = get_es_client().options(request_timeout=timeout, max_retries=0)
+
+    def _una() -> Any:
+        with medir("elastic", operacion):
+            return llamada(es)
+
+    return _proteccion_es.ejecutar(_una, reintentos, compartimento, vigilar)
+
+
+def estado_circuito() -> Dict[str, Any]:
+    """
+    Estado del circuito de Elasticsearch en este proceso ("cerrado",
+    "semiabierto" o "abierto") y sus contadores (se muestra en
+    /admin/elastic).
+    """
+    return _proteccion_es.estadisticas()
+
+
+def _metricas_circuito():
+    datos = estado_circuito()
+    servicio = {"servicio": "elastic"}
+    familias = [
+        ("bigdata_circuito_estado", "gauge", "0 cerrado, 1 semiabierto, 2 abierto.",
+         [(servicio, ESTADOS_INTERRUPTOR.index(datos["estado"]))]),
+    ]
+    for clave, ayuda in (
+        ("aperturas", "Veces que se abrió el circuito."),
+        ("rechazadas", "Llamadas rechazadas con el circuito abierto."),
+        ("saturadas", "Llamadas rechazadas por no quedar turnos libres."),
+        ("reintentos", "Reintentos tras un fallo del cluster."),
+    ):
+        familias.append((f"bigdata_circuito_{clave}_total", "counter", ayuda, [(servicio, datos[clave])]))
+    return familias
+
+
+registrar_recolector(_metricas_circuito)
 
 
 def ping_elastic() -> bool:
     """
-    Devuelve True si Elasticsearch responde al ping, False en caso contrario.
+    Devuelve True si Elasticsearch responde al ping, False en caso contrario
+    (el motivo queda en el log).
     """
     try:
-        es = get_es_client()
-        return es.ping()
-    except Exception:
+        return bool(_llamar_es("ping", lambda es: es.ping(), ES_TIMEOUT_ADMIN))
+    except Exception as e:
+        logger.warning("Elasticsearch no responde al ping: %s", e)
         return False
 
 
@@ -51,16 +343,520 @@ def ping_elastic() -> bool:
 # ---------------------------------------------------------------------
 def contar_documentos(index: str = INDICE_LIBROS) -> int:
     """
-    Devuelve el número de documentos en el índice (0 si no existe o hay error).
+    Devuelve el número de libros en el índice, sin sus pasajes (0 si no
+    existe o hay error; el error queda en el log).
+    """
+    try:
+        resp = _llamar_es(
+            "count", lambda es: es.count(index=index, query=CONSULTA_SOLO_LIBROS), ES_TIMEOUT_ADMIN, ES_REINTENTOS_LECTURA
+        )
+    except NotFoundError:
+        return 0
+    except Exception as e:
+        logger.warning("No se pudieron contar los documentos de %s: %s", index, e)
+        return 0
+    return int(resp.get("count", 0))
+
+
+def estadisticas_indice(index: str = INDICE_LIBROS) -> Dict[str, Any]:
+    """
+    Libros, pasajes, tamaño en disco y segmentos del índice (o alias): los
+    libros con _count y el resto de _stats (que cuenta también los pasajes).
+    Lanza la excepción del cliente si falla.
+    """
+    resp = _llamar_es(
+        "stats",
+        lambda es: es.indices.stats(index=index, metric=["docs", "store", "segments"]),
+        ES_TIMEOUT_ADMIN,
+        ES_REINTENTOS_LECTURA,
+    )
+    libros = _llamar_es(
+        "count", lambda es: es.count(index=index, query=CONSULTA_SOLO_LIBROS), ES_TIMEOUT_ADMIN, ES_REINTENTOS_LECTURA
+    )
+    return leer_estadisticas_indice(resp, libros)
+
+
+def leer_estadisticas_indice(stats: Any, libros: Any) -> Dict[str, Any]:
+    """
+    Resumen de estadisticas_indice a partir de las respuestas de _stats y
+    de _count (con CONSULTA_SOLO_LIBROS).
+    """
+    primarios = stats["_all"]["primaries"]
+    documentos = int(libros.get("count", 0))
+    return {
+        "documentos": documentos,
+        "pasajes": max(int(primarios.get("docs", {}).get("count", 0)) - documentos, 0),
+        "tamano_bytes": int(stats["_all"]["total"].get("store", {}).get("size_in_bytes", 0)),
+        "segmentos": int(primarios.get("segments", {}).get("count", 0)),
+    }
+
+
+# ---------------------------------------------------------------------
+# Definición del índice de libros (settings + mappings)
+# ---------------------------------------------------------------------
+DEFINICION_INDICE_LIBROS: Dict[str, Any] = {
+    "settings": {
+        "number_of_shards": ES_SHARDS,
+        "number_of_replicas": ES_REPLICAS,
+        "refresh_interval": ES_REFRESH_INTERVAL,
+        "analysis": {
+            "filter": {
+                "espanol_stop": {"type": "stop", "stopwords": "_spanish_"},
+                "espanol_stemmer": {"type": "stemmer", "language": "light_spanish"},
+                "prefijos_edge": {"type": "edge_ngram", "min_gram": 1, "max_gram": 20},
+                "prefijos_corte": {"type": "truncate", "length": 20},
+            },
+            "analyzer": {
+                # Minúsculas + sin tildes + stopwords + stemming ligero
+                "espanol": {
+                    "tokenizer": "standard",
+                    "filter": [
+                        "lowercase",
+                        "asciifolding",
+                        "espanol_stop",
+                        "espanol_stemmer",
+                    ],
+                },
+                # Autocompletado: cada palabra se indexa con todos sus
+                # prefijos; la consulta solo se pliega (sin n-grams)
+                "prefijos": {
+                    "tokenizer": "standard",
+                    "filter": ["lowercase", "asciifolding", "prefijos_edge"],
+                },
+                "prefijos_busqueda": {
+                    "tokenizer": "standard",
+                    "filter": ["lowercase", "asciifolding", "prefijos_corte"],
+                },
+            },
+        },
+    },
+    "mappings": {
+        "properties": {
+            "id_libro": {"type": "integer"},
+            "titulo": {
+                "type": "text",
+                "analyzer": "espanol",
+                "fields": {
+                    "keyword": {"type": "keyword", "ignore_above": 256},
+                    "prefijos": {
+                        "type": "text",
+                        "analyzer": "prefijos",
+                        "search_analyzer": "prefijos_busqueda",
+                    },
+                },
+            },
+            "autor": {
+                "type": "text",
+                "analyzer": "espanol",
+                "fields": {"keyword": {"type": "keyword", "ignore_above": 256}},
+            },
+            "anio": {"type": "integer"},
+            "num_paginas": {"type": "integer"},
+            # Carpeta de origen del PDF (ver coleccion_desde_ruta)
+            "coleccion": {"type": "keyword"},
+            "huella": {"type": "keyword", "index": False},
+            # Salida de la etapa de PLN (ver TuberiaPLN): las palabras clave
+            # se pueden filtrar y agregar; el resumen solo se muestra
+            "palabras_clave": {"type": "keyword"},
+            "resumen": {"type": "text", "index": False},
+            # Grupo de casi duplicados (ver Helpers/duplicados.py): id del
+            # libro canónico y si este libro es otro del grupo
+            "id_canonico": {"type": "integer"},
+            "duplicado": {"type": "boolean"},
+            # Se busca por texto (multi_match) y se filtra por la ruta exacta
+            "ruta_pdf": {
+                "type": "text",
+                "analyzer": "espanol",
+                "fields": {"keyword": {"type": "keyword", "ignore_above": 1024}},
+            },
+            # Pasajes del texto: documentos hijos del libro (mismo shard, con
+            # routing = id_libro) que solo tienen id_libro, pagina y texto.
+            # Los vectores de términos con offsets permiten resaltar (fvh)
+            # sin volver a analizar el texto.
+            "relacion": {"type": "join", "relations": {"libro": "pasaje"}},
+            "tipo": {"type": "keyword"},
+            "pagina": {"type": "integer"},
+            "texto": {
+                "type": "text",
+                "analyzer": "espanol",
+                "term_vector": "with_positions_offsets",
+            },
+        }
+    },
+}
+
+# Solo los libros (sin los pasajes, que llevan tipo "pasaje"); en las
+# generaciones sin pasajes es lo mismo que todos los documentos
+CONSULTA_SOLO_LIBROS: Dict[str, Any] = {"bool": {"must_not": [{"term": {"tipo": "pasaje"}}]}}
+
+# Mientras dura una carga: sin refresh ni réplicas
+AJUSTES_CARGA_MASIVA: Dict[str, Any] = {
+    "refresh_interval": "-1",
+    "number_of_replicas": 0,
+}
+
+
+def _ajustes_finales(definicion: Dict[str, Any]) -> Dict[str, Any]:
+    settings = definicion.get("settings", {})
+    return {
+        "refresh_interval": settings.get("refresh_interval", ES_REFRESH_INTERVAL),
+        "number_of_replicas": settings.get("number_of_replicas", ES_REPLICAS),
+    }
+
+
+def optimizar_tras_carga(
+    indice: str,
+    definicion: Dict[str, Any] = DEFINICION_INDICE_LIBROS,
+) -> None:
+    """
+    Restaura refresh_interval y réplicas de la definición, refresca y, si
+    ES_FORCEMERGE está activo, fusiona los segmentos en uno solo.
+    """
+    # Llamadas largas: no ocupan los turnos de las búsquedas
+    def _mantenimiento(operacion: str, llamada: Callable[[Elasticsearch], Any], reintentos: int = 0) -> Any:
+        return _llamar_es(operacion, llamada, ES_TIMEOUT_MANTENIMIENTO, reintentos, compartimento=False)
+
+    ajustes = {"index": _ajustes_finales(definicion)}
+    _mantenimiento("put_settings", lambda es: es.indices.put_settings(index=indice, settings=ajustes), ES_REINTENTOS_LECTURA)
+    _mantenimiento("refresh", lambda es: es.indices.refresh(index=indice), ES_REINTENTOS_LECTURA)
+    if ES_FORCEMERGE:
+        _mantenimiento("forcemerge", lambda es: es.indices.forcemerge(index=indice, max_num_segments=1))
+
+
+@contextmanager
+def modo_carga_masiva(
+    indice: str,
+    definicion: Dict[str, Any] = DEFINICION_INDICE_LIBROS,
+):
     """
+    Context manager para cargas grandes sobre un índice existente: desactiva
+    el refresh y las réplicas mientras dura el bloque y al salir los restaura.
+    Si el bloque termina bien, además refresca y hace forcemerge.
+    """
+    def _ajustar(ajustes: Dict[str, Any]) -> None:
+        _llamar_es(
+            "put_settings",
+            lambda es: es.indices.put_settings(index=indice, settings={"index": ajustes}),
+            reintentos=ES_REINTENTOS_LECTURA,
+            compartimento=False,
+        )
+
+    _ajustar(AJUSTES_CARGA_MASIVA)
     try:
-        es = get_es_client()
-        if not es.indices.exists(index=index):
-            return 0
-        resp = es.count(index=index)
-        return int(resp.get("count", 0))
+        yield indice
+    except BaseException:
+        _ajustar(_ajustes_finales(definicion))
+        raise
+    optimizar_tras_carga(indice, definicion)
+
+
+# ---------------------------------------------------------------------
+# Generaciones del índice (índices físicos versionados detrás de un alias)
+# ---------------------------------------------------------------------
+# INDICE_LIBROS es un alias que apunta a un índice físico
+# "<alias>_v<N>". Cada carga escribe en una generación nueva y el alias solo
+# se mueve cuando el bulk y el refresh terminaron bien, así que las búsquedas
+# nunca ven un catálogo vacío o a medio cargar.
+def _numero_generacion(alias: str, indice: str) -> Optional[int]:
+    m = re.fullmatch(re.escape(alias) + r"_v(\d+)", indice)
+    return int(m.group(1)) if m else None
+
+
+def listar_generaciones(alias: str = INDICE_LIBROS) -> List[str]:
+    """
+    Devuelve los índices físicos de un alias, de la generación más antigua
+    a la más reciente.
+    """
+    indices = _llamar_es(
+        "get_indices",
+        lambda es: es.indices.get(index=f"{alias}_v*", expand_wildcards="open"),
+        ES_TIMEOUT_ADMIN,
+        ES_REINTENTOS_LECTURA,
+    )
+    return _ordenar_generaciones(alias, indices)
+
+
+def _ordenar_generaciones(alias: str, indices: Iterable[str]) -> List[str]:
+    # Solo los índices con nombre de generación del alias, por número
+    generaciones = [i for i in indices if _numero_generacion(alias, i) is not None]
+    return sorted(generaciones, key=lambda i: _numero_generacion(alias, i))
+
+
+def generacion_activa(alias: str = INDICE_LIBROS) -> Optional[str]:
+    """
+    Devuelve el índice físico al que apunta el alias (None si no hay alias).
+    """
+    try:
+        resp = _llamar_es(
+            "get_alias", lambda es: es.indices.get_alias(name=alias), ES_TIMEOUT_ADMIN, ES_REINTENTOS_LECTURA
+        )
+    except NotFoundError:
+        return None
+    return next(iter(resp), None)
+
+
+def crear_generacion(
+    alias: str = INDICE_LIBROS,
+    definicion: Dict[str, Any] = DEFINICION_INDICE_LIBROS,
+) -> str:
+    """
+    Crea un índice físico nuevo para el alias y devuelve su nombre.
+    Nace con AJUSTES_CARGA_MASIVA; finalizar_carga le devuelve los de
+    `definicion` antes de activarlo.
+    """
+    numero = int(time.time() * 1000)
+    existentes = listar_generaciones(alias)
+    if existentes:
+        numero = max(numero, _numero_generacion(alias, existentes[-1]) + 1)
+
+    indice = f"{alias}_v{numero}"
+    settings = {**definicion.get("settings", {}), **AJUSTES_CARGA_MASIVA}
+    _llamar_es(
+        "create_index",
+        lambda es: es.indices.create(index=indice, settings=settings, mappings=definicion.get("mappings")),
+        compartimento=False,
+    )
+    _indices_con_pasajes[indice] = "relacion" in definicion.get("mappings", {}).get("properties", {})
+    return indice
+
+
+# Generaciones que tienen (True) o no el mapping de los pasajes
+_indices_con_pasajes: Dict[str, bool] = {}
+
+
+def indice_con_pasajes(indice: str) -> bool:
+    """
+    True si `indice` tiene el mapping de los pasajes (las generaciones
+    creadas antes de existir no lo tienen y en ellas no se indexa el texto).
+    Se consulta una vez por índice y proceso.
+    """
+    if indice not in _indices_con_pasajes:
+        resp = _llamar_es(
+            "get_mapping", lambda es: es.indices.get_mapping(index=indice), ES_TIMEOUT_ADMIN, ES_REINTENTOS_LECTURA
+        )
+        _indices_con_pasajes[indice] = _mapping_con_pasajes(resp)
+    return _indices_con_pasajes[indice]
+
+
+def _mapping_con_pasajes(resp: Any) -> bool:
+    # Respuesta de get_mapping: {indice: {"mappings": {...}}}
+    return any(
+        m.get("mappings", {}).get("properties", {}).get("relacion", {}).get("type") == "join"
+        for m in resp.values()
+    )
+
+
+def activar_generacion(indice: str, alias: str = INDICE_LIBROS) -> None:
+    """
+    Apunta el alias a `indice` en una sola operación atómica.
+    Si todavía existe un índice "clásico" con el nombre del alias (versiones
+    anteriores de la app), se elimina en la misma operación.
+    """
+    acciones: List[Dict[str, Any]] = []
+
+    try:
+        actuales = _llamar_es(
+            "get_alias", lambda es: es.indices.get_alias(name=alias), ES_TIMEOUT_ADMIN, ES_REINTENTOS_LECTURA
+        )
+    except NotFoundError:
+        actuales = {}
+
+    if actuales:
+        for actual in actuales:
+            if actual != indice:
+                acciones.append({"remove": {"index": actual, "alias": alias}})
+    elif _llamar_es("exists", lambda es: es.indices.exists(index=alias), ES_TIMEOUT_ADMIN, ES_REINTENTOS_LECTURA):
+        acciones.append({"remove_index": {"index": alias}})
+
+    acciones.append({"add": {"index": indice, "alias": alias}})
+    _llamar_es("update_aliases", lambda es: es.indices.update_aliases(actions=acciones), compartimento=False)
+
+
+def limpiar_generaciones(
+    alias: str = INDICE_LIBROS,
+    retener: int = ES_RETENER_GENERACIONES,
+) -> List[str]:
+    """
+    Borra las generaciones más antiguas y conserva las `retener` más recientes
+    (la activa nunca se borra). Devuelve los índices eliminados.
+    """
+    generaciones = listar_generaciones(alias)
+    activa = generacion_activa(alias)
+
+    conservar = set(generaciones[-max(retener, 1):])
+    if activa:
+        conservar.add(activa)
+
+    borrados = [g for g in generaciones if g not in conservar]
+    for indice in borrados:
+        _llamar_es("delete_index", lambda es: es.indices.delete(index=indice), compartimento=False)
+    return borrados
+
+
+def revertir_generacion(alias: str = INDICE_LIBROS) -> str:
+    """
+    Vuelve a apuntar el alias a la generación anterior a la activa.
+    Devuelve el índice que queda activo.
+    """
+    generaciones = listar_generaciones(alias)
+    activa = generacion_activa(alias)
+
+    if activa not in generaciones or generaciones.index(activa) == 0:
+        raise RuntimeError("No hay una generación anterior a la que volver.")
+
+    anterior = generaciones[generaciones.index(activa) - 1]
+    activar_generacion(anterior, alias)
+    avanzar_generacion()
+    return anterior
+
+
+def iniciar_carga(
+    alias: str = INDICE_LIBROS,
+    definicion: Dict[str, Any] = DEFINICION_INDICE_LIBROS,
+) -> str:
+    """
+    Prepara una carga completa: crea la generación nueva donde se escribirá,
+    ya en modo de carga masiva (sin refresh ni réplicas).
+    """
+    return crear_generacion(alias, definicion)
+
+
+def finalizar_carga(
+    indice: str,
+    alias: str = INDICE_LIBROS,
+    definicion: Dict[str, Any] = DEFINICION_INDICE_LIBROS,
+) -> None:
+    """
+    Deja lista la generación recién cargada (ajustes finales, refresh y
+    forcemerge), la activa y limpia las viejas.
+    """
+    optimizar_tras_carga(indice, definicion)
+    activar_generacion(indice, alias)
+    avanzar_generacion()
+
+    # La carga ya está activa: un fallo al limpiar no debe deshacerla
+    try:
+        limpiar_generaciones(alias)
     except Exception:
+        logger.exception("No se pudieron limpiar las generaciones de %s", alias)
+
+
+def abortar_carga(indice: str) -> None:
+    """
+    Elimina una generación que no llegó a activarse (el alias no se toca).
+    """
+    try:
+        _llamar_es("delete_index", lambda es: es.indices.delete(index=indice), compartimento=False)
+    except NotFoundError:
+        pass
+
+
+# Campos que no se pueden añadir a una generación ya creada: los pasajes
+# (relación join) y los que usan analizadores propios
+_CAMPOS_SOLO_CARGA_COMPLETA = {"relacion", "tipo", "pagina", "texto"}
+
+
+def completar_mapping(
+    indice: str,
+    definicion: Dict[str, Any] = DEFINICION_INDICE_LIBROS,
+) -> List[str]:
+    """
+    Añade al mapping de `indice` (una generación creada por una versión
+    anterior) los campos de `definicion` que le faltan, para que una carga
+    incremental los rellene y las búsquedas y facetas los vean (coleccion,
+    palabras_clave, id_canonico...). Los pasajes y los campos con
+    analizadores propios solo llegan con una carga completa: se avisa.
+    Devuelve los campos añadidos.
+    """
+    resp = _llamar_es(
+        "get_mapping", lambda es: es.indices.get_mapping(index=indice), ES_TIMEOUT_ADMIN, ES_REINTENTOS_LECTURA
+    )
+    actuales = next(iter(resp.values()), {}).get("mappings", {}).get("properties", {})
+    nuevos: Dict[str, Any] = {}
+    pendientes: List[str] = []
+    for campo, tipo in definicion.get("mappings", {}).get("properties", {}).items():
+        if campo in actuales:
+            continue
+        if campo in _CAMPOS_SOLO_CARGA_COMPLETA or "analyzer" in json.dumps(tipo):
+            pendientes.append(campo)
+        else:
+            nuevos[campo] = tipo
+    if nuevos:
+        _llamar_es(
+            "put_mapping",
+            lambda es: es.indices.put_mapping(index=indice, properties=nuevos),
+            ES_TIMEOUT_ADMIN,
+            compartimento=False,
+        )
+        logger.info("Mapping de %s ampliado con: %s", indice, ", ".join(sorted(nuevos)))
+    if pendientes:
+        logger.warning(
+            "%s no tiene los campos %s; llegarán con la próxima carga completa.",
+            indice, ", ".join(sorted(pendientes)),
+        )
+    return sorted(nuevos)
+
+
+# ---------------------------------------------------------------------
+# Generación compartida de las cachés
+# ---------------------------------------------------------------------
+# Cada carga que termina deja una marca (milisegundos) en el _meta del índice
+# activo. Todos los procesos, en cualquier máquina, la leen de ahí para
+# saber si lo que tienen cacheado sigue valiendo (ver Helpers/cache.py).
+# Junto a ella va el resumen de la última carga, que ven así todos los workers
+_CLAVE_MARCA = "generacion_cache"
+_CLAVE_ULTIMA_CARGA = "ultima_carga"
+
+
+def leer_marca_generacion(alias: str = INDICE_LIBROS) -> int:
+    """
+    Marca de la última carga del índice activo; si no tiene (generaciones
+    anteriores), el número de la generación, y 0 si aún no hay catálogo.
+    """
+    try:
+        resp = _llamar_es(
+            "get_mapping", lambda es: es.indices.get_mapping(index=alias), ES_TIMEOUT_ADMIN, ES_REINTENTOS_LECTURA
+        )
+    except NotFoundError:
         return 0
+    for indice, datos in resp.items():
+        marca = datos.get("mappings", {}).get("_meta", {}).get(_CLAVE_MARCA)
+        if marca is not None:
+            return int(marca)
+        return _numero_generacion(alias, indice) or 0
+    return 0
+
+
+def _actualizar_meta(cambios: Dict[str, Any], alias: str = INDICE_LIBROS) -> None:
+    # put_mapping sustituye el _meta entero: se parte del que ya tiene
+    resp = _llamar_es(
+        "get_mapping", lambda es: es.indices.get_mapping(index=alias), ES_TIMEOUT_ADMIN, compartimento=False
+    )
+    meta = next(iter(resp.values()), {}).get("mappings", {}).get("_meta", {})
+    _llamar_es(
+        "put_mapping",
+        lambda es: es.indices.put_mapping(index=alias, meta={**meta, **cambios}),
+        ES_TIMEOUT_ADMIN,
+        compartimento=False,
+    )
+
+
+def marcar_generacion(alias: str = INDICE_LIBROS) -> None:
+    """
+    Pone una marca nueva en el índice activo (al terminar una carga).
+    """
+    _actualizar_meta({_CLAVE_MARCA: int(time.time() * 1000)}, alias)
+
+
+def anotar_ultima_carga(datos: Dict[str, Any], alias: str = INDICE_LIBROS) -> None:
+    """
+    Guarda el resumen de la carga que acaba de terminar en el índice activo
+    (lo lee Helpers/estadisticas.py en cualquier worker).
+    """
+    _actualizar_meta({_CLAVE_ULTIMA_CARGA: datos}, alias)
+
+
+registrar_generacion_compartida(leer_marca_generacion, marcar_generacion)
 
 
 # ---------------------------------------------------------------------
@@ -68,17 +864,22 @@ def contar_documentos(index: str = INDICE_LIBROS) -> int:
 # ---------------------------------------------------------------------
 def _build_search_query(
     texto: str = "",
+    filtros: Optional[Dict[str, Any]] = None,
 ) -> Dict[str, Any]:
     """
-    Construye la query bool para buscar libros según texto libre.
+    Construye la query bool para buscar libros según texto libre (en el
+    título, la ruta y, con BUSCAR_EN_TEXTO, el texto de sus pasajes). `filtros`
+    (autor, coleccion, anio_desde, anio_hasta) van en el contexto `filter`:
+    no puntúan y Elasticsearch cachea su resultado.
     """
     must: List[Dict[str, Any]] = []
-    filtros: List[Dict[str, Any]] = []
+    clausulas: List[Dict[str, Any]] = []
+    filtros = filtros or {}
 
     texto = (texto or "").strip()
 
     if texto:
-        must.append(
+        coincidencias = [
             {
                 "multi_match": {
                     "query": texto,
@@ -86,17 +887,136 @@ def _build_search_query(
                     "type": "best_fields",
                 }
             }
+        ]
+        if BUSCAR_EN_TEXTO:
+            coincidencias.append(_consulta_pasajes(texto))
+        must.append(
+            coincidencias[0] if len(coincidencias) == 1
+            else {"bool": {"should": coincidencias, "minimum_should_match": 1}}
         )
 
+    if filtros.get("autor"):
+        clausulas.append({"term": {"autor.keyword": filtros["autor"]}})
+    if filtros.get("coleccion"):
+        clausulas.append({"term": {"coleccion": filtros["coleccion"]}})
+
     rango: Dict[str, Any] = {}
+    if filtros.get("anio_desde") is not None:
+        rango["gte"] = filtros["anio_desde"]
+    if filtros.get("anio_hasta") is not None:
+        rango["lte"] = filtros["anio_hasta"]
+    if rango:
+        clausulas.append({"range": {"anio": rango}})
 
-    query: Dict[str, Any] = {"bool": {"must": must}}
-    if filtros:
-        query["bool"]["filter"] = filtros
+    # Los pasajes nunca salen como resultado: solo cuentan para su libro. Los
+    # casi duplicados no se excluyen aquí (su canónico puede no coincidir):
+    # se pliegan después, ver _duplicados_ocultos
+    excluir = list(CONSULTA_SOLO_LIBROS["bool"]["must_not"])
+    query: Dict[str, Any] = {"bool": {"must": must, "must_not": excluir}}
+    if clausulas:
+        query["bool"]["filter"] = clausulas
 
     return query
 
 
+# Delimitan lo resaltado en los fragmentos (caracteres de uso privado, que
+# no aparecen en el texto de los PDFs)
+_MARCA_INICIO = "\ue000"
+_MARCA_FIN = "\ue001"
+_PATRON_MARCAS = re.compile(f"({_MARCA_INICIO}|{_MARCA_FIN})")
+
+
+def _consulta_pasajes(texto: str) -> Dict[str, Any]:
+    # Libros con algún pasaje que coincide (puntúa el mejor). inner_hits se
+    # calcula solo para los libros de la página devuelta: trae sus mejores
+    # pasajes con el número de página y un fragmento resaltado, nunca el
+    # texto entero
+    return {
+        "has_child": {
+            "type": "pasaje",
+            "query": {"match": {"texto": texto}},
+            "score_mode": "max",
+            "ignore_unmapped": True,
+            "inner_hits": {
+                "name": "pasajes",
+                "size": PASAJES_POR_RESULTADO,
+                "_source": ["pagina"],
+                "highlight": {
+                    "pre_tags": [_MARCA_INICIO],
+                    "post_tags": [_MARCA_FIN],
+                    "fields": {
+                        "texto": {"type": "fvh", "fragment_size": PASAJES_FRAGMENTO, "number_of_fragments": 1}
+                    },
+                },
+            },
+        }
+    }
+
+
+def _trozos_resaltados(fragmento: str) -> List[Dict[str, Any]]:
+    """
+    Parte un fragmento con las marcas de resaltado en trozos
+    [{"texto", "resaltado"}] para que la plantilla los escape y pinte.
+    """
+    trozos: List[Dict[str, Any]] = []
+    resaltado = False
+    for parte in _PATRON_MARCAS.split(fragmento):
+        if parte == _MARCA_INICIO:
+            resaltado = True
+        elif parte == _MARCA_FIN:
+            resaltado = False
+        elif parte:
+            trozos.append({"texto": parte, "resaltado": resaltado})
+    return trozos
+
+
+def _leer_pasajes(hit: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    [{"pagina", "trozos"}] de los mejores pasajes de un resultado, con el
+    fragmento recortado con resumir_texto.
+    """
+    pasajes = []
+    for interno in hit.get("inner_hits", {}).get("pasajes", {}).get("hits", {}).get("hits", []):
+        fragmentos = interno.get("highlight", {}).get("texto")
+        if fragmentos:
+            pasajes.append(
+                {
+                    "pagina": interno.get("_source", {}).get("pagina"),
+                    "trozos": _trozos_resaltados(resumir_texto(fragmentos[0], PASAJES_FRAGMENTO)),
+                }
+            )
+    return pasajes
+
+
+# Agregaciones de la barra de facetas (ver _leer_facetas)
+AGREGACIONES_FACETAS: Dict[str, Any] = {
+    "anio": {"histogram": {"field": "anio", "interval": FACETAS_ANIO_INTERVALO, "min_doc_count": 1}},
+    "autor": {"terms": {"field": "autor.keyword", "size": FACETAS_TAMANO}},
+    "coleccion": {"terms": {"field": "coleccion", "size": FACETAS_TAMANO}},
+}
+
+
+def _leer_facetas(agregaciones: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    {"anio": [{"valor": 1990, "total": 12}, ...], "autor": [...], "coleccion": [...]}
+    """
+    facetas = {}
+    for nombre in AGREGACIONES_FACETAS:
+        cubetas = agregaciones.get(nombre, {}).get("buckets", [])
+        facetas[nombre] = [
+            {"valor": int(c["key"]) if nombre == "anio" else c["key"], "total": c["doc_count"]}
+            for c in cubetas
+        ]
+    return facetas
+
+
+def clave_filtros(filtros: Optional[Dict[str, Any]]) -> Tuple:
+    """
+    Los filtros con valor, como tupla ordenada (para claves de caché).
+    """
+    return tuple(sorted((k, v) for k, v in (filtros or {}).items() if v not in (None, "")))
+
+
 def buscar_libros(
     texto: str = "",
     tamano: int = 50,
@@ -108,39 +1028,519 @@ def buscar_libros(
 
     Esta firma coincide con cómo lo llama app.py:
     buscar_libros(texto=...)
+
+    Devuelve solo la primera página; para paginar ver buscar_libros_pagina.
+    """
+    pagina = buscar_libros_pagina(texto=texto, tamano=tamano)
+    return pagina["resultados"], pagina["total"]
+
+
+def codificar_cursor(datos: Dict[str, Any]) -> str:
+    """
+    Convierte el estado de paginación en un token opaco apto para URLs.
+    """
+    crudo = json.dumps(datos, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(crudo).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(token: str) -> Dict[str, Any]:
+    """
+    Inverso de codificar_cursor. Lanza ValueError si el token no es válido.
+    """
+    try:
+        relleno = "=" * (-len(token) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(token + relleno))
+    except Exception as e:
+        raise ValueError("Cursor de paginación inválido.") from e
+
+    if not isinstance(datos, dict) or not isinstance(datos.get("sa"), list):
+        raise ValueError("Cursor de paginación inválido.")
+    return datos
+
+
+def buscar_libros_pagina(
+    texto: str = "",
+    tamano: int = 50,
+    cursor: Optional[str] = None,
+    usar_pit: bool = ES_USAR_PIT,
+    total_hits: Any = TOTAL_HITS,
+    filtros: Optional[Dict[str, Any]] = None,
+    facetas: bool = False,
+) -> Dict[str, Any]:
     """
-    es = get_es_client()
+    Devuelve una página de resultados paginando con search_after (orden por
+    score y desempate por id_libro), así que la página 100 cuesta lo mismo
+    que la primera.
+
+    `cursor` es el token `siguiente_cursor` de la página anterior. Con
+    `usar_pit` la paginación se fija a un point-in-time desde la segunda
+    página (solo se abre si se pide) y no le afectan las cargas que terminen
+    mientras tanto. `total_hits` es el track_total_hits
+    de la primera página (True, False o un tope); las siguientes no vuelven
+    a contar, el total viaja en el cursor. `filtros` se aplican como en
+    _build_search_query y con `facetas` la primera página trae también los
+    conteos de AGREGACIONES_FACETAS (clave "facetas").
 
-    if not es.indices.exists(index=INDICE_LIBROS):
-        return [], 0
+    Devuelve {"resultados", "total", "total_exacto", "pagina",
+    "siguiente_cursor", "origen"}; "total" es None si no se contó y
+    "total_exacto" es False si solo es un mínimo. Las respuestas de
+    Elasticsearch se cachean (LRU + TTL) hasta que termina la siguiente
+    carga.
+
+    Si Elasticsearch falla (o su circuito está abierto) se sirve la última
+    respuesta buena guardada para la misma consulta (origen "cache"); si no
+    la hay y existe índice local (BM25_RUTA), la página sale del buscador
+    local (origen "local"); como el cursor de Elasticsearch no le vale, es
+    siempre la primera y, si se pedía otra, la respuesta trae
+    "reiniciada": True. Con BUSQUEDA_BACKEND=local se usa siempre el
+    local. El índice local no sabe filtrar: con `filtros` se propaga el
+    error.
+
+    Con DUPLICADOS_PLEGAR cada grupo de casi duplicados sale una vez (ver
+    _duplicados_ocultos): una página puede traer menos de `tamano`
+    resultados y "total" cuenta también los duplicados.
+    """
+    estado = decodificar_cursor(cursor) if cursor else {"sa": None, "pit": None, "p": 1}
 
-    query = _build_search_query(texto)
+    if BUSQUEDA_BACKEND == "local" or estado.get("origen") == "local":
+        if clave_filtros(filtros):
+            raise RuntimeError("El buscador local no admite filtros.")
+        pagina = _buscar_libros_local(texto, tamano, estado)
+        if pagina is None:
+            raise RuntimeError("No hay índice local de búsqueda (BM25_RUTA).")
+        return pagina
 
-    resp = es.search(
-        index=INDICE_LIBROS,
-        size=tamano,
-        query=query,
+    facetas = facetas and not cursor
+    clave = (
+        generacion_actual(), normalizar_consulta(texto), tamano, cursor or "", total_hits,
+        clave_filtros(filtros), facetas,
     )
+    cacheado = _cache_busquedas.obtener(clave)
+    if cacheado is not None:
+        return cacheado
+
+    try:
+        pagina = _buscar_libros_es(texto, tamano, estado, usar_pit, total_hits, filtros, facetas)
+    except Exception as e:
+        return _respaldo(clave[1:], texto, tamano, filtros, e, estado.get("p", 1))
+
+    _guardar_pagina(clave, pagina)
+    return pagina
+
+
+def buscar_libros_lote(
+    consultas: List[Dict[str, Any]],
+    total_hits: Any = TOTAL_HITS,
+) -> List[Dict[str, Any]]:
+    """
+    Primera página de varias búsquedas con una sola petición _msearch.
+    Cada consulta es un dict con "texto" y, opcionalmente, "tamano" (50;
+    0 para pedir solo el total o las facetas), "filtros" y "facetas".
+    Devuelve las páginas en el mismo orden y con la misma forma que
+    buscar_libros_pagina. Las que ya están en caché no se envían. Si
+    Elasticsearch falla y una consulta no tiene respaldo (ver _respaldo),
+    su posición trae una página vacía con "error" y el resto del lote se
+    devuelve igual.
+    """
+    if BUSQUEDA_BACKEND == "local":
+        return [
+            buscar_libros_pagina(c.get("texto", ""), c.get("tamano", 50), filtros=c.get("filtros"))
+            for c in consultas
+        ]
+
+    estado = {"sa": None, "pit": None, "p": 1}
+    paginas: List[Optional[Dict[str, Any]]] = [None] * len(consultas)
+    pendientes: List[Tuple[int, Tuple, Dict[str, Any]]] = []
+    generacion = generacion_actual()
+    for posicion, consulta in enumerate(consultas):
+        clave = (
+            generacion, normalizar_consulta(consulta.get("texto", "")), consulta.get("tamano", 50), "",
+            total_hits, clave_filtros(consulta.get("filtros")), bool(consulta.get("facetas")),
+        )
+        cacheado = _cache_busquedas.obtener(clave)
+        if cacheado is not None:
+            paginas[posicion] = cacheado
+        else:
+            pendientes.append((posicion, clave, consulta))
+    if not pendientes:
+        return paginas
+
+    busquedas: List[Dict[str, Any]] = []
+    for _, _, consulta in pendientes:
+        cuerpo = _parametros_busqueda(
+            consulta.get("texto", ""), consulta.get("tamano", 50), estado, total_hits,
+            consulta.get("filtros"), bool(consulta.get("facetas")),
+        )
+        cuerpo["_source"] = cuerpo.pop("source")
+        busquedas += [{"index": INDICE_LIBROS}, cuerpo]
+
+    try:
+        resp = _llamar_es(
+            "msearch",
+            lambda es: es.msearch(
+                searches=busquedas,
+                filter_path=["took", "responses.error"] + [f"responses.{f}" for f in _FILTRO_RESPUESTA],
+            ),
+            ES_TIMEOUT_BUSQUEDA,
+            ES_REINTENTOS_LECTURA,
+        )
+    except Exception as e:
+        for posicion, clave, consulta in pendientes:
+            paginas[posicion] = _respaldo_lote(clave, consulta, e, estado)
+        return paginas
+    observar_took("msearch", resp)
+
+    for (posicion, clave, consulta), respuesta in zip(pendientes, resp["responses"]):
+        error = respuesta.get("error")
+        if error and error.get("type") == "index_not_found_exception":
+            # Aún no hay ninguna carga (el alias no existe)
+            paginas[posicion] = _pagina_vacia(estado)
+        elif error:
+            paginas[posicion] = _respaldo_lote(
+                clave, consulta, RuntimeError(error.get("reason") or error.get("type")), estado
+            )
+        else:
+            try:
+                ocultos = _duplicados_ocultos(respuesta, consulta.get("texto", ""), consulta.get("filtros"))
+            except Exception as e:
+                paginas[posicion] = _respaldo_lote(clave, consulta, e, estado)
+                continue
+            paginas[posicion] = _pagina_desde_respuesta(respuesta, consulta.get("tamano", 50), estado, ocultos=ocultos)
+            _guardar_pagina(clave, paginas[posicion])
+    return paginas
+
+
+def _guardar_pagina(clave: Tuple, pagina: Dict[str, Any]) -> None:
+    # clave[0] es la generación: la copia de respaldo no depende de ella
+    _cache_busquedas.guardar(clave, pagina)
+    _cache_respaldo.guardar(clave[1:], pagina)
+
+
+def _respaldo(
+    clave: Tuple,
+    texto: str,
+    tamano: int,
+    filtros: Optional[Dict[str, Any]],
+    error: Exception,
+    pagina_pedida: int = 1,
+) -> Dict[str, Any]:
+    # Elasticsearch falló: primero la última respuesta buena de esta misma
+    # consulta (aunque sea de una carga anterior); si no la hay, la primera
+    # página del índice local (el cursor de Elasticsearch no le vale), con
+    # "reiniciada" si se había pedido otra. Sin ninguna de las dos (o con
+    # filtros, que el local no sabe aplicar) se propaga el error
+    # Con el circuito abierto no se repite el aviso en cada búsqueda
+    nivel = logging.DEBUG if isinstance(error, CircuitoAbierto) else logging.WARNING
+    guardada = _cache_respaldo.obtener(clave)
+    if guardada is not None:
+        logger.log(nivel, "Elasticsearch no respondió (%s); se sirve la última respuesta guardada.", error)
+        return {**guardada, "origen": "cache"}
+
+    pagina = None if clave_filtros(filtros) else _buscar_libros_local(texto, tamano, {"sa": None, "p": 1})
+    if pagina is None:
+        raise error
+    logger.log(nivel, "Elasticsearch no respondió (%s); se usa el índice local.", error)
+    if pagina_pedida > 1:
+        pagina["reiniciada"] = True
+    return pagina
+
+
+def _respaldo_lote(
+    clave: Tuple,
+    consulta: Dict[str, Any],
+    error: Exception,
+    estado: Dict[str, Any],
+) -> Dict[str, Any]:
+    # _respaldo para una posición de buscar_libros_lote: sin respaldo, la
+    # posición lleva el error en lugar de perder el lote entero
+    try:
+        return _respaldo(
+            clave[1:], consulta.get("texto", ""), consulta.get("tamano", 50), consulta.get("filtros"), error
+        )
+    except Exception as e:
+        return {**_pagina_vacia(estado), "total": None, "total_exacto": False, "origen": None, "error": str(e)}
+
+
+def _buscar_libros_local(
+    texto: str,
+    tamano: int,
+    estado: Dict[str, Any],
+) -> Optional[Dict[str, Any]]:
+    indice = obtener_indice_local()
+    if indice is None:
+        return None
+
+    with medir("local", "search"):
+        resultados, total, orden_ultimo = indice.buscar(texto, tamano, estado.get("sa"))
+    siguiente_cursor = None
+    if orden_ultimo:
+        siguiente_cursor = codificar_cursor(
+            {"sa": orden_ultimo, "pit": None, "p": estado.get("p", 1) + 1, "origen": "local"}
+        )
+    return {
+        "resultados": resultados,
+        "total": total,
+        "total_exacto": True,
+        "pagina": estado.get("p", 1),
+        "siguiente_cursor": siguiente_cursor,
+        "origen": "local",
+    }
+
+
+def _parametros_busqueda(
+    texto: str,
+    tamano: int,
+    estado: Dict[str, Any],
+    total_hits: Any,
+    filtros: Optional[Dict[str, Any]] = None,
+    facetas: bool = False,
+) -> Dict[str, Any]:
+    """
+    Argumentos de es.search para una página (solo los campos que se pintan).
+    """
+    parametros: Dict[str, Any] = {
+        "size": tamano,
+        "query": _build_search_query(texto, filtros),
+        "sort": ORDEN_RESULTADOS,
+        # El grupo de casi duplicados hace falta para plegarlos
+        "source": CAMPOS_RESULTADO + (["id_canonico", "duplicado"] if DUPLICADOS_PLEGAR else []),
+        # En las páginas siguientes el total ya viene en el cursor
+        "track_total_hits": False if "t" in estado else total_hits,
+    }
+    if estado.get("sa"):
+        parametros["search_after"] = estado["sa"]
+    if facetas:
+        parametros["aggs"] = AGREGACIONES_FACETAS
+    return parametros
+
 
-    total_obj = resp.get("hits", {}).get("total", 0)
-    if isinstance(total_obj, dict):
-        total = int(total_obj.get("value", 0))
+def _pagina_vacia(estado: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "resultados": [],
+        "total": 0,
+        "total_exacto": True,
+        "pagina": estado.get("p", 1),
+        "siguiente_cursor": None,
+        "origen": "elastic",
+    }
+
+
+def _pagina_desde_respuesta(
+    resp: Any,
+    tamano: int,
+    estado: Dict[str, Any],
+    pit_id: Optional[str] = None,
+    ocultos: Optional[Set[str]] = None,
+) -> Dict[str, Any]:
+    # `ocultos`: id_libro (como texto) de los hits que no se muestran (ver
+    # _duplicados_ocultos); el cursor sigue saliendo del último hit
+    if "t" in estado:
+        total, exacto = estado["t"], estado["te"]
     else:
-        total = int(total_obj)
+        total_obj = resp.get("hits", {}).get("total")
+        if total_obj is None:
+            total, exacto = None, False
+        elif isinstance(total_obj, dict):
+            total, exacto = int(total_obj.get("value", 0)), total_obj.get("relation", "eq") == "eq"
+        else:
+            total, exacto = int(total_obj), True
 
+    hits = resp.get("hits", {}).get("hits", [])
     resultados: List[Dict[str, Any]] = []
-    for hit in resp.get("hits", {}).get("hits", []):
+    for hit in hits:
         src = hit.get("_source", {})
-        resultados.append(
-            {
-                "id_libro": src.get("id_libro"),
-                "titulo": src.get("titulo"),
-                "ruta_pdf": src.get("ruta_pdf"),
-                "score": hit.get("_score"),
-            }
+        if ocultos and str(src.get("id_libro")) in ocultos:
+            continue
+        resultado = {
+            "id_libro": src.get("id_libro"),
+            "titulo": src.get("titulo"),
+            "ruta_pdf": src.get("ruta_pdf"),
+            "resumen": src.get("resumen"),
+            "palabras_clave": src.get("palabras_clave") or [],
+            "score": hit.get("_score"),
+        }
+        pasajes = _leer_pasajes(hit)
+        if pasajes:
+            resultado["pasajes"] = pasajes
+        resultados.append(resultado)
+
+    siguiente_cursor = None
+    if hits and len(hits) == tamano and hits[-1].get("sort"):
+        siguiente_cursor = codificar_cursor(
+            {"sa": hits[-1]["sort"], "pit": pit_id, "p": estado.get("p", 1) + 1, "t": total, "te": exacto}
         )
 
-    return resultados, total
+    pagina = {
+        "resultados": resultados,
+        "total": total,
+        "total_exacto": exacto,
+        "pagina": estado.get("p", 1),
+        "siguiente_cursor": siguiente_cursor,
+        "origen": "elastic",
+    }
+    if "aggregations" in resp:
+        pagina["facetas"] = _leer_facetas(resp["aggregations"])
+    return pagina
+
+
+def _duplicados_ocultos(
+    resp: Any,
+    texto: str,
+    filtros: Optional[Dict[str, Any]],
+    pit_id: Optional[str] = None,
+) -> Set[str]:
+    """
+    id_libro (como texto) de los casi duplicados de una página que no se
+    muestran porque otro libro representa a su grupo: el canónico si
+    coincide con la misma consulta y filtros o, si no, el duplicado que
+    mejor puntúa. Se pliega después de buscar, así que un libro nunca
+    desaparece porque solo coincida su duplicado. Solo se pregunta por los
+    grupos de los duplicados de la página (una búsqueda con collapse sobre
+    id_canonico); una página sin duplicados no cuesta nada más.
+    """
+    hits = resp.get("hits", {}).get("hits", [])
+    duplicados = [h["_source"] for h in hits if h.get("_source", {}).get("duplicado")]
+    grupos = {d["id_canonico"] for d in duplicados if d.get("id_canonico") is not None}
+    if not DUPLICADOS_PLEGAR or not grupos:
+        return set()
+
+    query = _build_search_query(texto, filtros)
+    query["bool"].setdefault("filter", []).append({"terms": {"id_canonico": sorted(grupos, key=str)}})
+    parametros: Dict[str, Any] = {
+        "query": query,
+        "size": len(grupos),
+        # Por grupo, el primero según este orden: el canónico y después score
+        "sort": [{"duplicado": {"order": "asc"}}, *ORDEN_RESULTADOS],
+        "collapse": {"field": "id_canonico"},
+        "source": ["id_libro"],
+        "track_total_hits": False,
+        "filter_path": ["hits.hits._source"],
+    }
+
+    def _buscar(es: Elasticsearch) -> Any:
+        if pit_id:
+            return es.search(pit={"id": pit_id, "keep_alive": ES_PIT_KEEP_ALIVE}, **parametros)
+        return es.search(index=INDICE_LIBROS, **parametros)
+
+    resp_grupos = _llamar_es("search", _buscar, ES_TIMEOUT_BUSQUEDA, ES_REINTENTOS_LECTURA)
+    elegidos = {str(h["_source"]["id_libro"]) for h in resp_grupos.get("hits", {}).get("hits", [])}
+    return {str(d["id_libro"]) for d in duplicados if str(d["id_libro"]) not in elegidos}
+
+
+def _buscar_libros_es(
+    texto: str,
+    tamano: int,
+    estado: Dict[str, Any],
+    usar_pit: bool,
+    total_hits: Any,
+    filtros: Optional[Dict[str, Any]] = None,
+    facetas: bool = False,
+) -> Dict[str, Any]:
+    pit_id = estado.get("pit")
+    parametros = _parametros_busqueda(texto, tamano, estado, total_hits, filtros, facetas)
+
+    def _buscar(es: Elasticsearch) -> Any:
+        if pit_id:
+            return es.search(
+                pit={"id": pit_id, "keep_alive": ES_PIT_KEEP_ALIVE},
+                filter_path=_FILTRO_RESPUESTA,
+                **parametros,
+            )
+        return es.search(index=INDICE_LIBROS, filter_path=_FILTRO_RESPUESTA, **parametros)
+
+    try:
+        if usar_pit and not pit_id and estado.get("sa"):
+            # El PIT se abre al pedir la segunda página: abrirlo en cada
+            # búsqueda dejaría abiertos, hasta que caducan, los de todas las
+            # que no pasan de la primera
+            pit_id = _llamar_es(
+                "open_pit",
+                lambda es: es.open_point_in_time(index=INDICE_LIBROS, keep_alive=ES_PIT_KEEP_ALIVE)["id"],
+                ES_TIMEOUT_BUSQUEDA,
+            )
+            parametros["search_after"] = [*estado["sa"][: len(ORDEN_RESULTADOS)], _SHARD_DOC_MAX]
+        resp = _llamar_es("search", _buscar, ES_TIMEOUT_BUSQUEDA, ES_REINTENTOS_LECTURA)
+    except NotFoundError:
+        if not pit_id:
+            # Aún no hay ninguna carga (el alias no existe)
+            return _pagina_vacia(estado)
+        # El point-in-time caducó: se sigue sobre el alias con el mismo
+        # search_after (sin el desempate _shard_doc que añade el PIT)
+        pit_id = None
+        if estado.get("sa"):
+            parametros["search_after"] = estado["sa"][: len(ORDEN_RESULTADOS)]
+        resp = _llamar_es("search", _buscar, ES_TIMEOUT_BUSQUEDA, ES_REINTENTOS_LECTURA)
+    observar_took("search", resp)
+
+    pit_id = resp.get("pit_id", pit_id)
+    ocultos = _duplicados_ocultos(resp, texto, filtros, pit_id)
+    pagina = _pagina_desde_respuesta(resp, tamano, estado, pit_id, ocultos)
+    if pagina["siguiente_cursor"] is None and pit_id:
+        # Última página: se libera el point-in-time
+        try:
+            _llamar_es("close_pit", lambda es: es.close_point_in_time(id=pit_id), ES_TIMEOUT_ADMIN)
+        except Exception:
+            pass
+    return pagina
+
+
+def sugerir_titulos(
+    prefijo: str,
+    limite: int = 10,
+    timeout: float = 0.05,
+) -> List[Dict[str, Any]]:
+    """
+    Títulos cuyas palabras empiezan por las de `prefijo` (subcampo
+    titulo.prefijos), sin reintentos y con `timeout` segundos como máximo.
+    Las generaciones creadas antes de existir el subcampo no devuelven nada.
+    Con el circuito abierto no se llama; un timeout por un presupuesto tan
+    corto no cuenta como fallo del cluster.
+    """
+    resp = _llamar_es(
+        "suggest",
+        lambda es: es.search(
+            index=INDICE_LIBROS,
+            size=limite,
+            source=["id_libro", "titulo"],
+            query={"match": {"titulo.prefijos": {"query": prefijo, "operator": "and"}}},
+            timeout=f"{max(int(timeout * 1000), 1)}ms",
+        ),
+        timeout,
+        vigilar=False,
+    )
+
+    sugerencias: List[Dict[str, Any]] = []
+    vistos = set()
+    for hit in resp.get("hits", {}).get("hits", []):
+        src = hit.get("_source", {})
+        if src.get("titulo") and src["titulo"] not in vistos:
+            vistos.add(src["titulo"])
+            sugerencias.append({"id_libro": src.get("id_libro"), "titulo": src["titulo"]})
+    return sugerencias
+
+
+def estadisticas_cache_busquedas() -> Dict[str, Any]:
+    """
+    Aciertos, fallos, desalojos, etc. de la caché de buscar_libros.
+    """
+    return {**_cache_busquedas.estadisticas(), "generacion": generacion_actual()}
+
+
+def _metricas_cache_busquedas():
+    datos = _cache_busquedas.estadisticas()
+    cache = {"cache": "busquedas"}
+    familias = [
+        (f"bigdata_cache_{clave}_total", "counter", f"{clave.capitalize()} de la caché.", [(cache, datos[clave])])
+        for clave in ("aciertos", "fallos", "desalojos", "expirados")
+    ]
+    familias.append(("bigdata_cache_ratio_aciertos", "gauge", "Aciertos / consultas de la caché.",
+                     [(cache, datos["ratio_aciertos"])]))
+    familias.append(("bigdata_cache_entradas", "gauge", "Entradas guardadas en la caché.",
+                     [(cache, datos["entradas"])]))
+    return familias
+
+
+registrar_recolector(_metricas_cache_busquedas)
 
 
 # ---------------------------------------------------------------------
@@ -158,17 +1558,324 @@ def parsear_json_libros(json_str: str) -> List[Dict[str, Any]]:
     if not isinstance(data, list):
         raise ValueError("El JSON debe contener una lista de libros.")
 
-    libros: List[Dict[str, Any]] = []
-    for i, raw in enumerate(data, start=1):
-        libros.append(
-            {
-                "id_libro": raw.get("id_libro", i),
-                "titulo": raw.get("titulo"),
-                "ruta_pdf": raw.get("ruta_pdf"),
+    return [normalizar_libro(raw, i) for i, raw in enumerate(data, start=1)]
+
+
+def normalizar_libro(raw: Any, posicion: int) -> Dict[str, Any]:
+    """
+    Normaliza un registro crudo del catálogo a las claves que usa la app y
+    le añade su huella de contenido (ver huella_libro).
+    `posicion` (1, 2, ...) se usa como id_libro si el registro no trae uno.
+    Si el registro trae `texto_paginas`, el texto queda en "pasajes" (ver
+    dividir_pasajes): va a Elasticsearch pero no se guarda en MongoDB.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError(f"El libro #{posicion} no es un objeto JSON.")
+
+    libro = {
+        "id_libro": raw.get("id_libro", posicion),
+        "titulo": raw.get("titulo"),
+        "autor": raw.get("autor"),
+        "anio": raw.get("anio"),
+        "num_paginas": raw.get("num_paginas"),
+        "ruta_pdf": raw.get("ruta_pdf"),
+        "coleccion": raw.get("coleccion") or coleccion_desde_ruta(raw.get("ruta_pdf")),
+    }
+    pasajes = dividir_pasajes(raw.get("texto_paginas"), PASAJES_MAX_CARACTERES)
+    if pasajes:
+        libro["pasajes"] = pasajes
+    libro["huella"] = huella_libro(libro)
+    return libro
+
+
+def coleccion_desde_ruta(ruta_pdf: Optional[str]) -> Optional[str]:
+    """
+    Carpeta donde está el PDF ("/biblioteca/ciencias/x.pdf" -> "ciencias"),
+    o None si la ruta no tiene carpeta.
+    """
+    partes = re.split(r"[\\/]+", (ruta_pdf or "").strip("\\/"))
+    return partes[-2] if len(partes) > 1 else None
+
+
+def huella_libro(libro: Dict[str, Any]) -> str:
+    """
+    Huella estable del contenido de un libro normalizado (SHA-1 de sus campos
+    en JSON canónico, sin la propia huella). Sirve para saber si cambió.
+    """
+    datos = {k: v for k, v in libro.items() if k not in ("huella", "_id")}
+    canonico = json.dumps(datos, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(canonico.encode("utf-8")).hexdigest()
+
+
+def _acciones_index(
+    documentos: Iterable[Dict[str, Any]],
+    indice: str,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Acciones bulk de cada libro y de sus pasajes (hijos con routing =
+    id_libro). En las generaciones sin mapping de pasajes el texto se descarta.
+    """
+    con_pasajes = indice_con_pasajes(indice)
+    for doc in documentos:
+        id_libro = doc.get("id_libro")
+        if "pasajes" not in doc:
+            fuente = doc
+        else:
+            fuente = {k: v for k, v in doc.items() if k != "pasajes"}
+        if not con_pasajes:
+            yield {"_index": indice, "_id": id_libro, "_source": fuente}
+            continue
+
+        yield {"_index": indice, "_id": id_libro, "_source": {**fuente, "relacion": "libro"}}
+        for numero, pasaje in enumerate(doc.get("pasajes") or []):
+            yield {
+                "_index": indice,
+                "_id": f"{id_libro}{_SUFIJO_PASAJE}{numero}",
+                "_routing": str(id_libro),
+                "_source": {
+                    "relacion": {"name": "pasaje", "parent": str(id_libro)},
+                    "tipo": "pasaje",
+                    "id_libro": id_libro,
+                    "pagina": pasaje["pagina"],
+                    "texto": pasaje["texto"],
+                },
             }
+
+
+# _id de los pasajes: "<id_libro>_p<n>"
+_SUFIJO_PASAJE = "_p"
+
+
+def _ids_pasajes(documento: Dict[str, Any]) -> List[str]:
+    # _id de los pasajes que _acciones_index escribe para el libro
+    id_libro = documento.get("id_libro")
+    return [f"{id_libro}{_SUFIJO_PASAJE}{n}" for n in range(len(documento.get("pasajes") or []))]
+
+
+def _error_bulk(item: Dict[str, Any], ids_pasajes: Set[str]) -> Dict[str, Any]:
+    """
+    Convierte un item fallido de helpers.streaming_bulk en un error legible.
+    `ids_pasajes` son los _id de las acciones de pasajes enviadas (las que
+    llevan _routing): por el _id solo no se distinguen de un libro cuyo id
+    contenga "_p".
+    """
+    accion, info = next(iter(item.items()))
+    error = info.get("error") or info.get("exception")
+    if isinstance(error, dict):
+        error = f"{error.get('type')}: {error.get('reason')}"
+    return {
+        "id": info.get("_id"),
+        "accion": accion,
+        "status": info.get("status"),
+        "error": str(error),
+        "pasaje": str(info.get("_id")) in ids_pasajes,
+    }
+
+
+def _enviar_chunk(
+    acciones: List[Dict[str, Any]],
+    bytes_por_chunk: int,
+    reintentos: int,
+    backoff_inicial: float,
+) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Envía un chunk con streaming_bulk, que reintenta con backoff exponencial
+    los documentos rechazados con 429 (es_rejected_execution_exception).
+    Pasa por el circuito de Elasticsearch (sin ocupar turnos de búsqueda):
+    con el cluster caído la carga se corta enseguida.
+    """
+    with _proteccion_es.proteger(compartimento=False), medir("elastic", "bulk"):
+        fallidos = _enviar_streaming_bulk(acciones, bytes_por_chunk, reintentos, backoff_inicial)
+    return len(acciones) - len(fallidos), fallidos
+
+
+def _enviar_streaming_bulk(
+    acciones: List[Dict[str, Any]],
+    bytes_por_chunk: int,
+    reintentos: int,
+    backoff_inicial: float,
+) -> List[Dict[str, Any]]:
+    ids_pasajes = {str(a["_id"]) for a in acciones if "_routing" in a}
+    return [
+        _error_bulk(item, ids_pasajes)
+        for ok, item in helpers.streaming_bulk(
+            get_es_client().options(request_timeout=ES_TIMEOUT_BULK),
+            acciones,
+            chunk_size=len(acciones),
+            max_chunk_bytes=bytes_por_chunk,
+            max_retries=reintentos,
+            initial_backoff=backoff_inicial,
+            max_backoff=ES_BULK_BACKOFF_MAX,
+            raise_on_error=False,
+            raise_on_exception=False,
+            yield_ok=False,
         )
+        if not ok
+    ]
+
+
+def indexar_documentos(
+    documentos: Iterable[Dict[str, Any]],
+    indice: str,
+    hilos: int = ES_BULK_HILOS,
+    docs_por_chunk: int = ES_BULK_DOCS,
+    bytes_por_chunk: int = ES_BULK_BYTES,
+    reintentos: int = ES_BULK_REINTENTOS,
+    backoff_inicial: float = ES_BULK_BACKOFF,
+) -> Dict[str, Any]:
+    """
+    Motor de indexación masiva: reparte los documentos en chunks (por número
+    de documentos y por bytes) y los envía en paralelo con `hilos` hilos.
+
+    Los documentos se consumen en streaming (nunca hay más de 2 * hilos chunks
+    en memoria). Un fallo no aborta la carga: se devuelve un resumen con
+    `indexados` y `fallidos` (libros), `pasajes` y `pasajes_fallidos`,
+    `errores` (lista de {id, accion, status, error, pasaje}), `ids_fallidos`
+    (todos los _id de libros rechazados), `segundos` y `docs_por_segundo`
+    (libros).
+    """
+    inicio = time.monotonic()
+    enviados = {False: 0, True: 0}
+    fallidos = {False: 0, True: 0}
+    errores: List[Dict[str, Any]] = []
+    ids_fallidos: List[Any] = []
+
+    def _acumular(futuro) -> None:
+        _, errores_chunk = futuro.result()
+        for error in errores_chunk:
+            fallidos[error["pasaje"]] += 1
+            if not error["pasaje"]:
+                ids_fallidos.append(error["id"])
+        errores.extend(errores_chunk[: MAX_ERRORES_REPORTADOS - len(errores)])
+
+    acciones = _acciones_index(documentos, indice)
+    with ThreadPoolExecutor(max_workers=max(hilos, 1)) as pool:
+        pendientes = set()
+        chunk: List[Dict[str, Any]] = []
+        for accion in acciones:
+            enviados["_routing" in accion] += 1
+            chunk.append(accion)
+            if len(chunk) < docs_por_chunk:
+                continue
+
+            pendientes.add(
+                pool.submit(_enviar_chunk, chunk, bytes_por_chunk, reintentos, backoff_inicial)
+            )
+            chunk = []
+            if len(pendientes) >= 2 * max(hilos, 1):
+                listos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+                for futuro in listos:
+                    _acumular(futuro)
+
+        if chunk:
+            pendientes.add(
+                pool.submit(_enviar_chunk, chunk, bytes_por_chunk, reintentos, backoff_inicial)
+            )
+        for futuro in pendientes:
+            _acumular(futuro)
+
+    return resumen_bulk(enviados, fallidos, errores, time.monotonic() - inicio, ids_fallidos)
 
-    return libros
+
+def resumen_bulk(
+    enviados: Dict[bool, int],
+    fallidos: Dict[bool, int],
+    errores: List[Dict[str, Any]],
+    segundos: float,
+    ids_fallidos: Optional[List[Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Resumen de una indexación; `enviados` y `fallidos` cuentan por separado
+    los libros (False) y los pasajes (True).
+    """
+    indexados = enviados[False] - fallidos[False]
+    docs_por_segundo = round(indexados / segundos, 1) if segundos > 0 else 0.0
+    observar_bulk(indexados, fallidos[False], docs_por_segundo)
+    return {
+        "indexados": indexados,
+        "fallidos": fallidos[False],
+        "pasajes": enviados[True] - fallidos[True],
+        "pasajes_fallidos": fallidos[True],
+        "errores": errores,
+        "ids_fallidos": ids_fallidos or [],
+        "segundos": round(segundos, 3),
+        "docs_por_segundo": docs_por_segundo,
+    }
+
+
+def eliminar_documentos(ids: List[Any], indice: str) -> int:
+    """
+    Borra de `indice` los libros con esos id_libro y sus pasajes (los que no
+    existan se ignoran). Devuelve cuántos libros se borraron.
+    """
+    acciones = ({"_op_type": "delete", "_index": indice, "_id": i} for i in ids)
+    with _proteccion_es.proteger(compartimento=False), medir("elastic", "bulk"):
+        ok, _ = helpers.bulk(get_es_client(), acciones, raise_on_error=False)
+    eliminar_pasajes(ids, indice)
+    return ok
+
+
+def eliminar_pasajes(
+    ids: List[Any],
+    indice: str,
+    conservar: Optional[List[Dict[str, Any]]] = None,
+) -> int:
+    """
+    Borra de `indice` los pasajes de esos libros. Con `conservar` (los
+    libros recién reindexados) se quedan sus pasajes actuales y solo se
+    borran las páginas que ya no tienen, así que el libro nunca se queda sin
+    texto buscable. Devuelve cuántos pasajes se borraron.
+    """
+    if not ids or not indice_con_pasajes(indice):
+        return 0
+    consulta: Dict[str, Any] = {
+        "bool": {"filter": [{"term": {"tipo": "pasaje"}}, {"terms": {"id_libro": list(ids)}}]}
+    }
+    actuales = [i for documento in conservar or [] for i in _ids_pasajes(documento)]
+    if actuales:
+        consulta["bool"]["must_not"] = [{"ids": {"values": actuales}}]
+    resp = _llamar_es(
+        "delete_by_query",
+        lambda es: es.delete_by_query(index=indice, query=consulta, conflicts="proceed"),
+        ES_TIMEOUT_MANTENIMIENTO,
+        compartimento=False,
+    )
+    return int(resp.get("deleted", 0))
+
+
+def actualizar_canonicos(cambios: Dict[Any, Any], indice: str) -> int:
+    """
+    Pone a cada libro de `cambios` ({id_libro: id_canonico}) su nuevo
+    grupo de casi duplicados sin reindexarlo (update parcial). Los que no
+    estén en `indice` se ignoran. Devuelve cuántos se actualizaron.
+    """
+    acciones = (
+        {
+            "_op_type": "update",
+            "_index": indice,
+            "_id": id_libro,
+            "doc": {"id_canonico": canonico, "duplicado": canonico != id_libro},
+        }
+        for id_libro, canonico in cambios.items()
+    )
+    with _proteccion_es.proteger(compartimento=False), medir("elastic", "bulk"):
+        ok, _ = helpers.bulk(get_es_client(), acciones, raise_on_error=False)
+    return ok
+
+
+def refrescar_indice(indice: str = INDICE_LIBROS) -> None:
+    """
+    Hace visibles para la búsqueda los últimos cambios de `indice`.
+    """
+    _llamar_es("refresh", lambda es: es.indices.refresh(index=indice), reintentos=ES_REINTENTOS_LECTURA)
+
+
+def indexar_lote(libros: List[Dict[str, Any]], indice: str) -> Dict[str, Any]:
+    """
+    Indexa un lote de libros ya normalizados en `indice` con el motor de
+    indexación masiva y devuelve su resumen (ver indexar_documentos).
+    """
+    return indexar_documentos(libros, indice)
 
 
 def indexar_libros_desde_json_str(json_str: str) -> Tuple[int, str]:
@@ -184,29 +1891,22 @@ def indexar_libros_desde_json_str(json_str: str) -> Tuple[int, str]:
     if not libros:
         return 0, "El JSON no contiene libros."
 
-    es = get_es_client()
-
-    # Borrar y recrear índice limpio
+    # Se carga en una generación nueva; el alias sigue sirviendo la anterior
     try:
-        if es.indices.exists(index=INDICE_LIBROS):
-            es.indices.delete(index=INDICE_LIBROS)
-        es.indices.create(index=INDICE_LIBROS)
-    except Exception:
-        # Si falla la creación porque el índice ya existe, seguimos igual
-        pass
-
-    acciones = [
-        {
-            "_index": INDICE_LIBROS,
-            "_id": libro.get("id_libro"),
-            "_source": libro,
-        }
-        for libro in libros
-    ]
+        indice = iniciar_carga()
+    except Exception as e:
+        return 0, f"Error al crear el índice: {e}"
 
     try:
-        helpers.bulk(es, acciones)
-        es.indices.refresh(index=INDICE_LIBROS)
-        return len(acciones), ""
+        resultado = indexar_documentos(libros, indice)
+        if not resultado["indexados"]:
+            errores = resultado["errores"]
+            raise RuntimeError(errores[0]["error"] if errores else "ningún libro indexado")
+        finalizar_carga(indice)
     except Exception as e:
+        abortar_carga(indice)
         return 0, f"Error en bulk: {e}"
+
+    if resultado["fallidos"]:
+        return resultado["indexados"], f"{resultado['fallidos']} libros no se pudieron indexar."
+    return resultado["indexados"], ""
@@ -0,0 +1,203 @@
+# proyecto_bigdata/Helpers/elastic_async.py
+# Versión asíncrona (AsyncElasticsearch) de las funciones de
+# Helpers/elastic.py, con los mismos nombres. Se ejecutan en el loop de
+# Helpers/asincrono.py.
+import os
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+from elasticsearch import AsyncElasticsearch, NotFoundError
+from elasticsearch.helpers import async_streaming_bulk
+
+from Helpers.asincrono import al_cerrar
+from Helpers.metricas import medir
+from Helpers.elastic import (
+    ES_BULK_BACKOFF,
+    ES_BULK_BACKOFF_MAX,
+    ES_BULK_BYTES,
+    ES_BULK_DOCS,
+    ES_BULK_HILOS,
+    ES_BULK_REINTENTOS,
+    ES_TIMEOUT_BULK,
+    ES_TIMEOUT_ADMIN,
+    CONSULTA_SOLO_LIBROS,
+    INDICE_LIBROS,
+    MAX_ERRORES_REPORTADOS,
+    _acciones_index,
+    _error_bulk,
+    _indices_con_pasajes,
+    _CLAVE_ULTIMA_CARGA,
+    _mapping_con_pasajes,
+    _opciones_cliente_es,
+    _proteccion_es,
+    _ordenar_generaciones,
+    leer_estadisticas_indice,
+    resumen_bulk,
+)
+
+logger = logging.getLogger(__name__)
+
+_es_client: Optional[AsyncElasticsearch] = None
+
+
+def get_es_client() -> AsyncElasticsearch:
+    """
+    Cliente asíncrono compartido, con la misma configuración de pool que el
+    síncrono de Helpers/elastic.py.
+    """
+    global _es_client
+    if _es_client is None:
+        _es_client = AsyncElasticsearch(**_opciones_cliente_es())
+    return _es_client
+
+
+async def cerrar_es_client() -> None:
+    global _es_client
+    if _es_client is not None:
+        await _es_client.close()
+        _es_client = None
+
+
+def _reiniciar_tras_fork() -> None:
+    global _es_client
+    _es_client = None
+
+
+al_cerrar(cerrar_es_client)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reiniciar_tras_fork)
+
+
+# ---------------------------------------------------------------------
+# Estado del cluster e índice
+# ---------------------------------------------------------------------
+def _cliente_admin() -> AsyncElasticsearch:
+    # Consultas de estado: con ES_TIMEOUT_ADMIN y sin reintentos, para que
+    # la página de estadísticas no espere a un cluster que no responde
+    return get_es_client().options(request_timeout=ES_TIMEOUT_ADMIN, max_retries=0)
+
+
+async def ping_elastic() -> bool:
+    try:
+        with medir("elastic", "ping"):
+            return await _cliente_admin().ping()
+    except Exception as e:
+        logger.warning("Elasticsearch no responde al ping: %s", e)
+        return False
+
+
+async def contar_documentos(index: str = INDICE_LIBROS) -> int:
+    try:
+        resp = await _cliente_admin().count(index=index, query=CONSULTA_SOLO_LIBROS)
+    except NotFoundError:
+        return 0
+    except Exception as e:
+        logger.warning("No se pudieron contar los documentos de %s: %s", index, e)
+        return 0
+    return int(resp.get("count", 0))
+
+
+async def generacion_activa(alias: str = INDICE_LIBROS) -> Optional[str]:
+    try:
+        resp = await _cliente_admin().indices.get_alias(name=alias)
+    except NotFoundError:
+        return None
+    return next(iter(resp), None)
+
+
+async def leer_ultima_carga(alias: str = INDICE_LIBROS) -> Optional[Dict[str, Any]]:
+    # Resumen que Helpers.elastic.anotar_ultima_carga dejó en el índice activo
+    try:
+        resp = await _cliente_admin().indices.get_mapping(index=alias)
+    except NotFoundError:
+        return None
+    for datos in resp.values():
+        return datos.get("mappings", {}).get("_meta", {}).get(_CLAVE_ULTIMA_CARGA)
+    return None
+
+
+async def listar_generaciones(alias: str = INDICE_LIBROS) -> List[str]:
+    indices = await _cliente_admin().indices.get(index=f"{alias}_v*", expand_wildcards="open")
+    return _ordenar_generaciones(alias, indices)
+
+
+async def estadisticas_indice(index: str = INDICE_LIBROS) -> Dict[str, Any]:
+    stats, libros = await asyncio.gather(
+        _cliente_admin().indices.stats(index=index, metric=["docs", "store", "segments"]),
+        _cliente_admin().count(index=index, query=CONSULTA_SOLO_LIBROS),
+    )
+    return leer_estadisticas_indice(stats, libros)
+
+
+async def indice_con_pasajes(indice: str) -> bool:
+    # Lo mismo que Helpers.elastic.indice_con_pasajes, sin bloquear el loop
+    if indice not in _indices_con_pasajes:
+        resp = await _cliente_admin().indices.get_mapping(index=indice)
+        _indices_con_pasajes[indice] = _mapping_con_pasajes(resp)
+    return _indices_con_pasajes[indice]
+
+
+# ---------------------------------------------------------------------
+# Indexación masiva
+# ---------------------------------------------------------------------
+async def _enviar_parte(acciones: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    fallidos = []
+    ids_pasajes = {str(a["_id"]) for a in acciones if "_routing" in a}
+    # Como _enviar_chunk de Helpers/elastic.py: respeta el circuito y cuenta
+    # para él, sin ocupar turnos de búsqueda. Con el circuito abierto se
+    # lanza CircuitoAbierto y la carga falla enseguida
+    with _proteccion_es.proteger(compartimento=False), medir("elastic", "bulk"):
+        async for ok, item in _bulk_asincrono(acciones):
+            if not ok:
+                fallidos.append(_error_bulk(item, ids_pasajes))
+    return fallidos
+
+
+def _bulk_asincrono(acciones: List[Dict[str, Any]]):
+    return async_streaming_bulk(
+        get_es_client().options(request_timeout=ES_TIMEOUT_BULK),
+        acciones,
+        chunk_size=ES_BULK_DOCS,
+        max_chunk_bytes=ES_BULK_BYTES,
+        max_retries=ES_BULK_REINTENTOS,
+        initial_backoff=ES_BULK_BACKOFF,
+        max_backoff=ES_BULK_BACKOFF_MAX,
+        raise_on_error=False,
+        raise_on_exception=False,
+        yield_ok=False,
+    )
+
+
+async def indexar_documentos(
+    documentos: Iterable[Dict[str, Any]],
+    indice: str,
+    hilos: int = ES_BULK_HILOS,
+) -> Dict[str, Any]:
+    """
+    Igual que Helpers.elastic.indexar_documentos para un lote en memoria:
+    lo reparte en `hilos` partes que se envían a la vez.
+    """
+    loop = asyncio.get_running_loop()
+    inicio = loop.time()
+
+    await indice_con_pasajes(indice)
+    acciones = list(_acciones_index(documentos, indice))
+    partes = [acciones[i::max(hilos, 1)] for i in range(max(hilos, 1))]
+    resultados = await asyncio.gather(*(_enviar_parte(p) for p in partes if p))
+
+    errores = [e for fallidos in resultados for e in fallidos]
+    enviados = {False: 0, True: 0}
+    fallidos = {False: 0, True: 0}
+    for accion in acciones:
+        enviados["_routing" in accion] += 1
+    for error in errores:
+        fallidos[error["pasaje"]] += 1
+    ids_fallidos = [e["id"] for e in errores if not e["pasaje"]]
+    return resumen_bulk(
+        enviados, fallidos, errores[:MAX_ERRORES_REPORTADOS], loop.time() - inicio, ids_fallidos
+    )
+
+
+async def indexar_lote(libros: List[Dict[str, Any]], indice: str) -> Dict[str, Any]:
+    return await indexar_documentos(libros, indice)
@@ -0,0 +1,167 @@
+# proyecto_bigdata/Helpers/estadisticas.py
+import os
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+from Helpers import elastic_async, mongoDB_async
+from Helpers.asincrono import ejecutar
+from Helpers.elastic import INDICE_LIBROS, anotar_ultima_carga
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Cada cuántos segundos se recalcula la foto de estadísticas en segundo plano
+ESTADISTICAS_INTERVALO = float(os.getenv("ESTADISTICAS_INTERVALO", "60"))
+
+# Última foto calculada: las vistas de admin solo leen esto
+_snapshot: Dict[str, Any] = {}
+_lock = threading.Lock()
+_hilo: Optional[threading.Thread] = None
+_hilo_pid: Optional[int] = None
+
+
+def _fecha_generacion(indice: Optional[str]) -> Optional[str]:
+    # Las generaciones se llaman <alias>_v<milisegundos>: es la hora de la carga
+    try:
+        ms = int(indice.rsplit("_v", 1)[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat(timespec="seconds")
+
+
+async def _calcular() -> Dict[str, Any]:
+    """
+    Consulta Elasticsearch y MongoDB a la vez y arma una foto nueva de
+    estadísticas.
+    """
+    foto: Dict[str, Any] = {
+        "es_disponible": False,
+        "indice": INDICE_LIBROS,
+        "generacion_activa": None,
+        "generaciones": [],
+        "total_es": 0,
+        "tamano_indice_bytes": 0,
+        "segmentos": 0,
+        "total_mongo": 0,
+        "ultima_carga": None,
+        "error": None,
+    }
+
+    # Las consultas no dependen unas de otras: se lanzan todas juntas
+    (
+        foto["es_disponible"],
+        foto["total_mongo"],
+        activa,
+        generaciones,
+        indice,
+        ultima_carga,
+    ) = await asyncio.gather(
+        elastic_async.ping_elastic(),
+        mongoDB_async.contar_libros_mongo(),
+        elastic_async.generacion_activa(),
+        elastic_async.listar_generaciones(),
+        elastic_async.estadisticas_indice(),
+        elastic_async.leer_ultima_carga(),
+        return_exceptions=True,
+    )
+
+    if foto["es_disponible"]:
+        errores = [r for r in (activa, generaciones) if isinstance(r, Exception)]
+        if errores:
+            foto["error"] = f"No se pudieron leer las estadísticas del índice: {errores[0]}"
+        else:
+            foto["generacion_activa"] = activa
+            foto["generaciones"] = generaciones
+            # Sin alias todavía, indices.stats falla: no es un error
+            if activa and isinstance(indice, Exception):
+                foto["error"] = f"No se pudieron leer las estadísticas del índice: {indice}"
+            elif activa:
+                foto["total_es"] = indice["documentos"]
+                foto["tamano_indice_bytes"] = indice["tamano_bytes"]
+                foto["segmentos"] = indice["segmentos"]
+
+    foto["deriva"] = foto["total_es"] - foto["total_mongo"]
+    # La anota en el índice activo el worker que hizo la carga; las
+    # generaciones de antes solo tienen la fecha de su nombre
+    if isinstance(ultima_carga, Exception):
+        ultima_carga = None
+    foto["ultima_carga"] = ultima_carga or (
+        {"fecha": _fecha_generacion(foto["generacion_activa"]), "modo": "completo"}
+        if foto["generacion_activa"] else None
+    )
+    foto["actualizado"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    foto["segundos_calculo"] = 0.0
+    return foto
+
+
+def refrescar_estadisticas() -> Dict[str, Any]:
+    """
+    Recalcula la foto ahora mismo (en el hilo que llama) y la publica.
+    """
+    global _snapshot
+    inicio = time.monotonic()
+    foto = ejecutar(_calcular())
+    foto["segundos_calculo"] = round(time.monotonic() - inicio, 3)
+    with _lock:
+        _snapshot = foto
+    return dict(foto)
+
+
+def _bucle() -> None:
+    while True:
+        time.sleep(ESTADISTICAS_INTERVALO)
+        try:
+            refrescar_estadisticas()
+        except Exception:
+            logger.exception("Fallo al refrescar las estadísticas")
+
+
+def _asegurar_hilo() -> None:
+    # Un hilo por proceso; con gunicorn se arranca en cada worker tras el fork
+    global _hilo, _hilo_pid
+    if _hilo is not None and _hilo_pid == os.getpid() and _hilo.is_alive():
+        return
+    with _lock:
+        if _hilo is None or _hilo_pid != os.getpid() or not _hilo.is_alive():
+            _hilo = threading.Thread(target=_bucle, name="estadisticas", daemon=True)
+            _hilo.start()
+            _hilo_pid = os.getpid()
+
+
+def obtener_estadisticas() -> Dict[str, Any]:
+    """
+    Devuelve la última foto de estadísticas sin tocar los backends (salvo la
+    primera vez en cada proceso, en que se calcula al momento).
+    """
+    _asegurar_hilo()
+    if not _snapshot:
+        return refrescar_estadisticas()
+    with _lock:
+        return dict(_snapshot)
+
+
+def registrar_carga(resumen: Dict[str, Any]) -> None:
+    """
+    Anota la carga que acaba de terminar en el índice activo (la ven todos
+    los workers) y refresca la foto enseguida.
+    """
+    try:
+        anotar_ultima_carga({
+            "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "modo": resumen.get("modo"),
+            "leidos": resumen.get("leidos"),
+            "segundos": resumen.get("segundos"),
+        })
+    except Exception:
+        logger.exception("No se pudo anotar la carga en el índice activo")
+    try:
+        refrescar_estadisticas()
+    except Exception:
+        logger.exception("Fallo al refrescar las estadísticas tras la carga")
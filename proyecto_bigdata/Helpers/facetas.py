@@ -0,0 +1,182 @@
+# proyecto_bigdata/Helpers/facetas.py
+# Barra de facetas de /buscar (años, autor, colección). Los conteos se
+# guardan por generación del catálogo y, al terminar cada carga, se
+# precalculan los de la consulta vacía y los de las consultas más repetidas
+# en una sola petición _msearch; así las páginas habituales no piden
+# agregaciones al cluster.
+import os
+import time
+import logging
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from Helpers.cache import crear_cache, generacion_actual, normalizar_consulta
+from Helpers.elastic import buscar_libros_lote, buscar_libros_pagina, clave_filtros
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Consultas populares que se precalculan tras cada carga
+FACETAS_POPULARES = int(os.getenv("FACETAS_POPULARES", "20"))
+
+# Conteos guardados (por generación, que ven todos los workers en cuanto
+# termina una carga, así que pueden vivir mucho)
+FACETAS_CACHE_MAX = int(os.getenv("FACETAS_CACHE_MAX", "5000"))
+FACETAS_CACHE_TTL = float(os.getenv("FACETAS_CACHE_TTL", "86400"))
+
+# Consultas distintas que se cuentan en memoria antes de olvidar las raras
+_MAX_CONSULTAS_CONTADAS = 10000
+
+# Cada cuánto (segundos) se mira si terminó una carga, y la espera antes de
+# reintentar un precálculo que falló
+_REVISAR_CADA = 1.0
+_REINTENTAR_TRAS = 30.0
+
+_cache_facetas = crear_cache("facetas", FACETAS_CACHE_MAX, FACETAS_CACHE_TTL)
+
+_populares: Counter = Counter()
+_populares_lock = threading.Lock()
+
+_precalculada: Optional[int] = None
+_revisado = 0.0
+_precalculando = False
+_precalculo_lock = threading.Lock()
+
+
+def _reiniciar_tras_fork() -> None:
+    global _precalculando, _revisado
+    _precalculando = False
+    _revisado = 0.0
+
+
+os.register_at_fork(after_in_child=_reiniciar_tras_fork)
+
+
+def _clave(generacion: int, texto: str, filtros: Optional[Dict[str, Any]]) -> tuple:
+    return (generacion, normalizar_consulta(texto), clave_filtros(filtros))
+
+
+def registrar_consulta(texto: str) -> None:
+    """
+    Cuenta una búsqueda (sin filtros) para saber cuáles son las populares.
+    """
+    texto = normalizar_consulta(texto)
+    if not texto:
+        return
+    with _populares_lock:
+        _populares[texto] += 1
+        if len(_populares) > _MAX_CONSULTAS_CONTADAS:
+            # Se quedan las más frecuentes; el resto vuelve a empezar de cero
+            mitad = _populares.most_common(_MAX_CONSULTAS_CONTADAS // 2)
+            _populares.clear()
+            _populares.update(dict(mitad))
+
+
+def consultas_populares(n: int = FACETAS_POPULARES) -> List[str]:
+    with _populares_lock:
+        return [texto for texto, _ in _populares.most_common(n)]
+
+
+def buscar_con_facetas(
+    texto: str = "",
+    filtros: Optional[Dict[str, Any]] = None,
+    cursor: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Página de buscar_libros_pagina con la clave "facetas" rellena. Si los
+    conteos de esta consulta ya están guardados no se piden agregaciones;
+    si no, van en la misma búsqueda de la primera página.
+    """
+    _revisar_precalculo()
+    clave = _clave(generacion_actual(), texto, filtros)
+    facetas = _cache_facetas.obtener(clave)
+
+    pagina = buscar_libros_pagina(
+        texto=texto, cursor=cursor, filtros=filtros, facetas=facetas is None and not cursor
+    )
+    if facetas is None and pagina.get("facetas") is not None:
+        facetas = pagina["facetas"]
+        # Las de una respuesta de respaldo pueden ser de una carga anterior
+        if pagina.get("origen") == "elastic":
+            _cache_facetas.guardar(clave, facetas)
+
+    if not cursor and not clave_filtros(filtros):
+        registrar_consulta(texto)
+    return {**pagina, "facetas": facetas}
+
+
+def obtener_facetas(
+    texto: str = "",
+    filtros: Optional[Dict[str, Any]] = None,
+) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    """
+    Solo los conteos (sin resultados). Con el texto vacío y sin filtros son
+    los del catálogo entero, que se precalculan tras cada carga.
+    """
+    _revisar_precalculo()
+    clave = _clave(generacion_actual(), texto, filtros)
+    facetas = _cache_facetas.obtener(clave)
+    if facetas is None:
+        pagina = buscar_libros_lote([{"texto": texto, "filtros": filtros, "tamano": 0, "facetas": True}])[0]
+        if pagina.get("error"):
+            raise RuntimeError(pagina["error"])
+        facetas = pagina.get("facetas")
+        if facetas is not None and pagina.get("origen") == "elastic":
+            _cache_facetas.guardar(clave, facetas)
+    return facetas
+
+
+# ---------------------------------------------------------------------
+# Precálculo tras cada carga
+# ---------------------------------------------------------------------
+def _revisar_precalculo() -> None:
+    # Como mucho una vez por segundo se mira si cambió la generación
+    global _revisado, _precalculando
+    ahora = time.monotonic()
+    if ahora - _revisado < _REVISAR_CADA:
+        return
+    with _precalculo_lock:
+        if ahora - _revisado < _REVISAR_CADA or _precalculando:
+            return
+        _revisado = ahora
+        generacion = generacion_actual()
+        if generacion == _precalculada:
+            return
+        _precalculando = True
+    threading.Thread(target=precalcular_facetas, args=(generacion,), name="facetas", daemon=True).start()
+
+
+def precalcular_facetas(generacion: Optional[int] = None) -> int:
+    """
+    Calcula y guarda los conteos de la consulta vacía y de las
+    FACETAS_POPULARES consultas más repetidas, con un solo _msearch.
+    Devuelve cuántas consultas se precalcularon.
+    """
+    global _precalculada, _precalculando, _revisado
+    generacion = generacion_actual() if generacion is None else generacion
+    textos = [""] + consultas_populares()
+    guardadas = 0
+    try:
+        paginas = buscar_libros_lote([{"texto": t, "tamano": 0, "facetas": True} for t in textos])
+        for texto, pagina in zip(textos, paginas):
+            # Con Elasticsearch caído, las del índice local no traen facetas y
+            # las de respaldo pueden ser de una carga anterior
+            if pagina.get("facetas") is not None and pagina.get("origen") == "elastic":
+                _cache_facetas.guardar(_clave(generacion, texto, None), pagina["facetas"])
+                guardadas += 1
+    except Exception as e:
+        logger.warning("No se pudieron precalcular las facetas: %s", e)
+
+    with _precalculo_lock:
+        _precalculando = False
+        if guardadas:
+            _precalculada = generacion
+        else:
+            _revisado = time.monotonic() + _REINTENTAR_TRAS
+    if guardadas:
+        logger.info("Facetas precalculadas para %d consultas (generación %d)", guardadas, generacion)
+    return guardadas
@@ -0,0 +1,586 @@
+# proyecto_bigdata/Helpers/ingesta.py
+import os
+import json
+import time
+import uuid
+import logging
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from Helpers import elastic_async, mongoDB_async
+from Helpers.PLN import PLN_ACTIVO, TuberiaPLN
+from Helpers.asincrono import ejecutar
+from Helpers.bm25 import BM25_RUTA, actualizar_indice_local, reconstruir_indice_local
+from Helpers.cache import avanzar_generacion
+from Helpers.descargas import MINIATURAS_DIR, GeneradorMiniaturas
+from Helpers.duplicados import DUPLICADOS_RUTA, DetectorDuplicados
+from Helpers.elastic import (
+    DUPLICADOS_PLEGAR,
+    MAX_ERRORES_REPORTADOS,
+    abortar_carga,
+    actualizar_canonicos,
+    completar_mapping,
+    eliminar_documentos,
+    eliminar_pasajes,
+    finalizar_carga,
+    generacion_activa,
+    huella_libro,
+    iniciar_carga,
+    listar_generaciones,
+    normalizar_libro,
+    refrescar_indice,
+)
+from Helpers.estadisticas import registrar_carga
+from Helpers.similares import SIMILARES_RUTA, AcumuladorSimilares
+from Helpers.mongoDB import (
+    actualizar_canonicos_mongo,
+    asegurar_indices_mongo,
+    eliminar_libros_mongo,
+    iterar_ids_no_vistos_mongo,
+    iterar_libros_mongo,
+)
+
+logger = logging.getLogger(__name__)
+
+# Libros por lote enviado a Elasticsearch y MongoDB
+INGESTA_TAMANO_LOTE = int(os.getenv("INGESTA_TAMANO_LOTE", "5000"))
+
+# Caracteres que se leen del archivo en cada bloque
+TAMANO_BLOQUE_LECTURA = 64 * 1024
+
+# Un registro que no se puede decodificar tras acumular esto es un JSON roto
+MAX_TAMANO_REGISTRO = 16 * 1024 * 1024
+
+
+# ---------------------------------------------------------------------
+# Lectura incremental del catálogo (array JSON o NDJSON)
+# ---------------------------------------------------------------------
+class _LectorBloques:
+    """
+    Buffer de texto que se va llenando por bloques y se compacta a medida
+    que se consumen registros, para no tener nunca el archivo entero en memoria.
+    """
+
+    def __init__(self, flujo: IO[str], tamano_bloque: int):
+        self.flujo = flujo
+        self.tamano_bloque = tamano_bloque
+        self.buffer = ""
+        self.pos = 0
+        self.fin = False
+        self.decoder = json.JSONDecoder()
+
+    def cargar(self) -> bool:
+        """Lee un bloque más. Devuelve False si ya no queda nada por leer."""
+        if self.fin:
+            return False
+        bloque = self.flujo.read(self.tamano_bloque)
+        if not bloque:
+            self.fin = True
+            return False
+        self.buffer = self.buffer[self.pos:] + bloque
+        self.pos = 0
+        return True
+
+    def siguiente_no_blanco(self) -> Optional[str]:
+        """Salta espacios y devuelve el siguiente carácter (None al final)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.cargar():
+                return None
+
+    def decodificar(self) -> Any:
+        """Decodifica el siguiente valor JSON, leyendo más bloques si hace falta."""
+        while True:
+            try:
+                valor, fin = self.decoder.raw_decode(self.buffer, self.pos)
+                self.pos = fin
+                return valor
+            except json.JSONDecodeError as e:
+                if len(self.buffer) - self.pos > MAX_TAMANO_REGISTRO or not self.cargar():
+                    raise ValueError(f"JSON inválido: {e}") from e
+
+    def linea(self) -> Optional[str]:
+        """Devuelve la siguiente línea (sin el salto) o None al final."""
+        while True:
+            salto = self.buffer.find("\n", self.pos)
+            if salto != -1:
+                linea = self.buffer[self.pos:salto]
+                self.pos = salto + 1
+                return linea
+            if not self.cargar():
+                if self.pos >= len(self.buffer):
+                    return None
+                linea = self.buffer[self.pos:]
+                self.pos = len(self.buffer)
+                return linea
+
+
+def iterar_json_libros(
+    flujo: IO[str],
+    tamano_bloque: int = TAMANO_BLOQUE_LECTURA,
+) -> Iterator[Any]:
+    """
+    Recorre un catálogo sin cargarlo entero y devuelve cada registro crudo.
+    Acepta un array JSON (`[{...}, {...}]`) o NDJSON (un objeto por línea).
+    """
+    lector = _LectorBloques(flujo, tamano_bloque)
+    primero = lector.siguiente_no_blanco()
+    if primero is None:
+        return
+
+    if primero != "[":
+        numero = 0
+        while True:
+            linea = lector.linea()
+            if linea is None:
+                return
+            numero += 1
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                yield json.loads(linea)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"JSON inválido en la línea {numero}: {e}") from e
+
+    lector.pos += 1
+    if lector.siguiente_no_blanco() == "]":
+        return
+
+    while True:
+        yield lector.decodificar()
+
+        separador = lector.siguiente_no_blanco()
+        if separador == "]":
+            return
+        if separador != ",":
+            raise ValueError("JSON inválido: se esperaba ',' o ']' entre libros.")
+        lector.pos += 1
+        lector.siguiente_no_blanco()
+
+
+def iterar_libros_normalizados(flujo: IO[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Igual que iterar_json_libros pero devolviendo cada libro ya normalizado.
+    """
+    for posicion, raw in enumerate(iterar_json_libros(flujo), start=1):
+        yield normalizar_libro(raw, posicion)
+
+
+def iterar_lotes(elementos: Iterable[Any], tamano: int) -> Iterator[List[Any]]:
+    """
+    Agrupa un iterable en listas de como mucho `tamano` elementos.
+    """
+    lote: List[Any] = []
+    for elemento in elementos:
+        lote.append(elemento)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+# ---------------------------------------------------------------------
+# Ingesta: Elasticsearch + MongoDB por lotes, enviando solo lo que cambió
+# ---------------------------------------------------------------------
+# - incremental: solo libros nuevos o modificados, sobre la generación activa.
+#                No borra nada (es el modo por defecto).
+# - sincronizar: como incremental, pero borrando en ambos almacenes los libros
+#                que desaparecieron del catálogo.
+# - completo:    el índice se reconstruye en una generación nueva con todo el
+#                catálogo; en Mongo solo se escriben los cambios y se borran
+#                los libros que ya no vienen (ambos almacenes quedan iguales).
+MODOS_INGESTA = ("incremental", "sincronizar", "completo")
+
+
+def _nuevo_resumen(modo: str) -> Dict[str, Any]:
+    return {
+        "modo": modo,
+        # Marca (id_carga) que se deja en Mongo en los libros que venían
+        "carga": uuid.uuid4().hex,
+        # Generación que servía el alias al empezar (para no reanudar sobre
+        # un catálogo publicado después)
+        "activa": None,
+        "lotes": 0,
+        "leidos": 0,
+        "anadidos": 0,
+        "actualizados": 0,
+        "eliminados": 0,
+        "sin_cambios": 0,
+        "indexados_es": 0,
+        "fallidos_es": 0,
+        "pasajes_es": 0,
+        "errores_es": [],
+        "guardados_mongo": 0,
+        "insertados_mongo": 0,
+        "actualizados_mongo": 0,
+        "sin_cambios_mongo": 0,
+        "duplicados": 0,
+        "reagrupados": 0,
+        "pln_procesados": 0,
+        "pln_en_cache": 0,
+        "pln_segundos": 0.0,
+        "pln_docs_por_segundo": 0.0,
+        "miniaturas": 0,
+        "miniaturas_fallidas": 0,
+        "segundos": 0.0,
+    }
+
+
+def _procesar_lote(
+    lote: List[Dict[str, Any]],
+    indice: str,
+    completo: bool,
+    resumen: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    """
+    Compara las huellas del lote con las guardadas en Mongo y envía a cada
+    almacén solo lo que le corresponde. Mongo se escribe después de que
+    Elasticsearch confirme, y solo con los libros que aceptó: a los
+    rechazados se les quita la huella en Mongo, así que la siguiente carga
+    los vuelve a enviar. Todos los libros del lote quedan marcados con la
+    carga actual (ver _eliminar_desaparecidos). Devuelve los libros escritos
+    en ambos almacenes.
+    """
+    guardadas = ejecutar(
+        mongoDB_async.huellas_libros_mongo([libro["id_libro"] for libro in lote])
+    )
+
+    delta = []
+    cambiados = []
+    for libro in lote:
+        if libro["id_libro"] not in guardadas:
+            resumen["anadidos"] += 1
+            delta.append(libro)
+        elif guardadas[libro["id_libro"]] != libro["huella"]:
+            resumen["actualizados"] += 1
+            delta.append(libro)
+            cambiados.append(libro["id_libro"])
+        else:
+            resumen["sin_cambios"] += 1
+
+    para_es = lote if completo else delta
+    aceptados = delta
+    if para_es:
+        resultado_es = ejecutar(elastic_async.indexar_lote(para_es, indice))
+        resumen["indexados_es"] += resultado_es["indexados"]
+        resumen["fallidos_es"] += resultado_es["fallidos"]
+        resumen["pasajes_es"] += resultado_es["pasajes"]
+        espacio = MAX_ERRORES_REPORTADOS - len(resumen["errores_es"])
+        resumen["errores_es"].extend(resultado_es["errores"][:espacio])
+        if resultado_es["ids_fallidos"]:
+            rechazados = {str(i) for i in resultado_es["ids_fallidos"]}
+            aceptados = [libro for libro in delta if str(libro["id_libro"]) not in rechazados]
+            ejecutar(mongoDB_async.olvidar_huellas_mongo(
+                [libro["id_libro"] for libro in para_es if str(libro["id_libro"]) in rechazados]
+            ))
+
+    if cambiados and not completo:
+        # En la generación activa quedarían las páginas que el libro ya no
+        # tiene. Solo en los que Elasticsearch aceptó: un libro rechazado
+        # conserva su texto anterior hasta que se vuelva a enviar
+        ids_cambiados = set(cambiados)
+        modificados = [libro for libro in aceptados if libro["id_libro"] in ids_cambiados]
+        eliminar_pasajes([libro["id_libro"] for libro in modificados], indice, conservar=modificados)
+
+    if aceptados:
+        resultado_mongo = ejecutar(mongoDB_async.guardar_libros_mongo(aceptados))
+        for clave in ("insertados", "actualizados", "sin_cambios"):
+            resumen[f"{clave}_mongo"] += resultado_mongo[clave]
+            resumen["guardados_mongo"] += resultado_mongo[clave]
+    ejecutar(mongoDB_async.marcar_vistos_mongo([libro["id_libro"] for libro in lote], resumen["carga"]))
+    return aceptados
+
+
+def _eliminar_desaparecidos(
+    carga: str,
+    indice: Optional[str],
+    tamano_lote: int,
+) -> int:
+    """
+    Borra de Mongo (y de `indice`, si se indica) los libros que no venían en
+    el catálogo, es decir, los que no llevan la marca de esta `carga`. Se
+    recorren y borran por lotes, sin juntar los ids en memoria. Devuelve
+    cuántos se borraron.
+    """
+    borrados = 0
+    for lote in iterar_lotes(iterar_ids_no_vistos_mongo(carga), tamano_lote):
+        if indice:
+            eliminar_documentos(lote, indice)
+        borrados += eliminar_libros_mongo(lote)
+    return borrados
+
+
+def _aplicar_pln(
+    tuberia: TuberiaPLN,
+    lote: List[Dict[str, Any]],
+    resumen: Optional[Dict[str, Any]],
+) -> None:
+    """
+    Añade palabras clave y resumen a los libros del lote y rehace su huella,
+    para que un cambio en la etapa de PLN también llegue a los almacenes.
+    Con `resumen` suma al de la carga lo procesado y la velocidad.
+    """
+    resultado = tuberia.procesar_lote(lote)
+    for libro in lote:
+        libro["huella"] = huella_libro(libro)
+    if resumen is not None:
+        resumen["pln_procesados"] += resultado["procesados"]
+        resumen["pln_en_cache"] += resultado["en_cache"]
+        resumen["pln_segundos"] = round(resumen["pln_segundos"] + resultado["segundos"], 3)
+        hechos = resumen["pln_procesados"] + resumen["pln_en_cache"]
+        if resumen["pln_segundos"] > 0:
+            resumen["pln_docs_por_segundo"] = round(hechos / resumen["pln_segundos"], 1)
+
+
+def _huellas_confirmadas(lote: List[Dict[str, Any]]) -> None:
+    """
+    Pone a los libros de un lote confirmado antes de la interrupción la huella
+    guardada en Mongo, la que ya incluye la etapa de PLN (duplicados y
+    similares la comparan con la suya). Los rechazados por Elasticsearch no
+    la tienen y se quedan con la calculada al leerlos.
+    """
+    guardadas = ejecutar(
+        mongoDB_async.huellas_libros_mongo([libro["id_libro"] for libro in lote])
+    )
+    for libro in lote:
+        if guardadas.get(libro["id_libro"]):
+            libro["huella"] = guardadas[libro["id_libro"]]
+
+
+def _corregir_canonicos(
+    duplicados: DetectorDuplicados,
+    indice: str,
+    eliminar_no_vistos: bool,
+    tamano_lote: int,
+) -> int:
+    """
+    Cierra los grupos de casi duplicados de la carga y lleva a ambos
+    almacenes el id_canonico de los libros que cambiaron de grupo después
+    de enviarse. Devuelve cuántos se corrigieron.
+    """
+    duplicados.terminar(eliminar_no_vistos)
+    corregidos = 0
+    for cambios in duplicados.pendientes(tamano_lote):
+        actualizar_canonicos(cambios, indice)
+        actualizar_canonicos_mongo(cambios)
+        corregidos += len(cambios)
+    return corregidos
+
+
+def ingerir_catalogo(
+    flujo: IO[str],
+    tamano_lote: int = INGESTA_TAMANO_LOTE,
+    progreso: Optional[Callable[[Dict[str, Any]], None]] = None,
+    modo: str = "incremental",
+    reanudar: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Carga un catálogo (array JSON o NDJSON) leyéndolo en streaming.
+
+    Cada libro se parsea y normaliza una sola vez (con su huella de
+    contenido) y se procesa en lotes de `tamano_lote`, así que la memoria
+    usada no depende del tamaño del archivo. Según `modo` (ver MODOS_INGESTA)
+    cada almacén recibe el catálogo entero o solo el delta. Después de cada
+    lote se llama a `progreso(resumen_parcial)` si se indicó.
+
+    Devuelve un resumen con libros añadidos / actualizados / eliminados /
+    sin cambios, lo indexado en ES (con los documentos rechazados en
+    `fallidos_es` / `errores_es`) y lo escrito en Mongo. Con PLN_ACTIVO cada
+    libro pasa antes por la etapa de PLN (palabras clave y resumen, ver
+    TuberiaPLN) y el resumen trae su velocidad en `pln_docs_por_segundo`. Con
+    MINIATURAS_DIR se dibuja la primera página de los PDFs nuevos o
+    modificados (ver GeneradorMiniaturas) y se cuentan en `miniaturas`. Con
+    DUPLICADOS_RUTA cada libro lleva además su grupo de casi duplicados (ver
+    Helpers/duplicados.py) y el resumen cuenta los duplicados.
+
+    Para retomar una carga interrumpida se pasa en `reanudar` el último
+    resumen parcial recibido en `progreso` (con el mismo archivo y
+    `tamano_lote`): se sigue en la misma generación (`indice`) a partir del
+    lote siguiente al último confirmado. Si esa generación ya no existe, o
+    si el alias apunta a otra desde que empezó (otra carga publicó mientras
+    tanto), la carga empieza de cero.
+    """
+    if modo not in MODOS_INGESTA:
+        raise ValueError(f"Modo de carga desconocido: {modo}")
+
+    # Índice único por id_libro antes de los upserts (con libros repetidos de
+    # cargas antiguas solo avisa; no se borra nada aquí)
+    asegurar_indices_mongo()
+
+    resumen = _nuevo_resumen(modo)
+    lotes_hechos = 0
+
+    # Sin la marca de la carga no se sabría qué libros ya se vieron (para
+    # borrar los desaparecidos): esa carga empieza de cero. También si otra
+    # carga publicó un catálogo mientras tanto: al terminar, esta activaría
+    # el suyo (más viejo) encima
+    activa = generacion_activa()
+    if reanudar and reanudar.get("carga") and reanudar.get("indice") in listar_generaciones():
+        if reanudar.get("activa") != activa:
+            logger.warning(
+                "El alias pasó de %s a %s desde que empezó la carga: se empieza de cero",
+                reanudar.get("activa"),
+                activa,
+            )
+            if reanudar["completo"] and reanudar["indice"] != activa:
+                abortar_carga(reanudar["indice"])
+            reanudar = None
+    else:
+        reanudar = None
+
+    if reanudar:
+        resumen.update({k: v for k, v in reanudar.items() if k in resumen})
+        indice, completo = reanudar["indice"], reanudar["completo"]
+        lotes_hechos = resumen["lotes"]
+    else:
+        resumen["activa"] = activa
+        indice = None if modo == "completo" else activa
+        # Sin catálogo publicado todavía, la primera carga siempre es completa
+        completo = indice is None
+        if completo:
+            indice = iniciar_carga()
+        else:
+            # La generación activa pudo crearla una versión anterior
+            completar_mapping(indice)
+
+    inicio = time.monotonic() - resumen["segundos"]
+    resumen["indice"], resumen["completo"] = indice, completo
+    if progreso:
+        progreso(dict(resumen))
+
+    # Los vectores de "libros parecidos" se sacan de todos los lotes (también
+    # de los ya confirmados al reanudar): el texto solo pasa por aquí
+    similares = AcumuladorSimilares() if SIMILARES_RUTA else None
+    # Los grupos de casi duplicados también se repasan en todos los lotes (sin
+    # volver a firmar los libros que no cambiaron)
+    duplicados = DetectorDuplicados() if DUPLICADOS_RUTA else None
+    # La etapa de PLN va primero: su salida entra en la huella de cada libro
+    pln = TuberiaPLN() if PLN_ACTIVO else None
+    miniaturas = GeneradorMiniaturas() if MINIATURAS_DIR else None
+    # Libros escritos en esta carga, para actualizar el índice local sin leer
+    # todo Mongo: {id_libro: campos que indexa, o None si sale plegado}
+    cambios_locales: Dict[Any, Optional[Dict[str, Any]]] = {}
+    try:
+        lotes = iterar_lotes(iterar_libros_normalizados(flujo), tamano_lote)
+        for numero, lote in enumerate(lotes, start=1):
+            if numero <= lotes_hechos:
+                # Lote ya confirmado: no se vuelve a pasar por PLN, la huella
+                # (con su salida) está en Mongo
+                _huellas_confirmadas(lote)
+            elif pln:
+                _aplicar_pln(pln, lote, resumen)
+            if duplicados:
+                duplicados.marcar_lote(lote)
+            if similares:
+                similares.anadir_lote(lote)
+            if numero <= lotes_hechos:
+                # Lote confirmado (y marcado con la carga) antes de la interrupción
+                continue
+
+            enviados = _procesar_lote(lote, indice, completo, resumen)
+            if BM25_RUTA and not completo:
+                for libro in enviados:
+                    plegado = DUPLICADOS_PLEGAR and libro.get("duplicado")
+                    cambios_locales[libro["id_libro"]] = None if plegado else {
+                        "id_libro": libro["id_libro"],
+                        "titulo": libro.get("titulo"),
+                        "ruta_pdf": libro.get("ruta_pdf"),
+                    }
+            if duplicados:
+                duplicados.confirmar(enviados)
+            if miniaturas:
+                # Va por archivo (fecha del PDF frente a la de la miniatura), no
+                # por el delta: así también se rellenan las que falten
+                hechas = miniaturas.generar_lote(lote)
+                resumen["miniaturas"] += hechas["generadas"]
+                resumen["miniaturas_fallidas"] += hechas["fallidas"]
+
+            resumen["leidos"] += len(lote)
+            resumen["lotes"] += 1
+            resumen["segundos"] = round(time.monotonic() - inicio, 3)
+
+            logger.info(
+                "Lote %d: %d libros leídos (%d nuevos, %d modificados), "
+                "%d indexados en ES, %d guardados en Mongo, PLN a %.1f libros/s",
+                resumen["lotes"],
+                resumen["leidos"],
+                resumen["anadidos"],
+                resumen["actualizados"],
+                resumen["indexados_es"],
+                resumen["guardados_mongo"],
+                resumen["pln_docs_por_segundo"],
+            )
+            if progreso:
+                progreso(dict(resumen))
+
+        if not resumen["leidos"]:
+            raise ValueError("El JSON no contiene libros.")
+        if completo and not resumen["indexados_es"]:
+            raise RuntimeError("Elasticsearch rechazó todos los libros del catálogo.")
+
+        if duplicados:
+            # Antes de activar la generación nueva, para que ya salga plegada
+            resumen["reagrupados"] = _corregir_canonicos(duplicados, indice, modo != "incremental", tamano_lote)
+            resumen["duplicados"] = duplicados.contar()["duplicados"]
+
+        if completo:
+            finalizar_carga(indice)
+    except Exception:
+        if completo:
+            abortar_carga(indice)
+        if similares:
+            similares.descartar()
+        raise
+    finally:
+        if duplicados:
+            duplicados.cerrar()
+        if pln:
+            pln.cerrar()
+        if miniaturas:
+            miniaturas.cerrar()
+
+    if modo != "incremental":
+        # En modo completo el índice nuevo ya no tiene los desaparecidos
+        resumen["eliminados"] = _eliminar_desaparecidos(
+            resumen["carga"], None if completo else indice, tamano_lote
+        )
+
+    if not completo and (
+        resumen["anadidos"] or resumen["actualizados"] or resumen["eliminados"] or resumen["reagrupados"]
+    ):
+        refrescar_indice(indice)
+        avanzar_generacion()
+
+    if BM25_RUTA and (completo or resumen["anadidos"] or resumen["actualizados"] or resumen["eliminados"]):
+        # Si solo hubo libros nuevos o modificados, el índice local se rehace
+        # desde el anterior con esos cambios. Con borrados, grupos de
+        # duplicados que cambiaron, una carga completa o una reanudada (no
+        # se saben los cambios de los lotes previos) se rehace con el
+        # catálogo completo, que está en Mongo
+        try:
+            actualizado = None
+            if not (completo or lotes_hechos or resumen["eliminados"] or resumen["reagrupados"]):
+                actualizado = actualizar_indice_local(cambios_locales)
+            if actualizado is None:
+                libros = iterar_libros_mongo(["id_libro", "titulo", "ruta_pdf", "duplicado"])
+                if DUPLICADOS_PLEGAR:
+                    # Como en Elasticsearch, los casi duplicados no salen
+                    libros = (libro for libro in libros if not libro.get("duplicado"))
+                reconstruir_indice_local(libros)
+        except Exception:
+            logger.exception("No se pudo reconstruir el índice local de búsqueda")
+
+    if similares:
+        # En una carga incremental se conservan los libros que no venían
+        try:
+            resumen["similares"] = similares.actualizar(conservar_no_vistos=modo == "incremental" and not completo)
+        except Exception:
+            logger.exception("No se pudieron recalcular los libros parecidos")
+
+    resumen["segundos"] = round(time.monotonic() - inicio, 3)
+    registrar_carga(resumen)
+    return resumen
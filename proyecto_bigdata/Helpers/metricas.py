@@ -0,0 +1,386 @@
+# proyecto_bigdata/Helpers/metricas.py
+import os
+import abc
+import hmac
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from dotenv import load_dotenv
+from pymongo import monitoring
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Una línea JSON por petición con su desglose de tiempos (logger "metricas")
+METRICAS_LOG = os.getenv("METRICAS_LOG", "0") == "1"
+
+# Token que Prometheus manda en "Authorization: Bearer <token>" para leer
+# /metrics. Sin token, /metrics solo lo ve un admin con sesión iniciada
+METRICAS_TOKEN = os.getenv("METRICAS_TOKEN", "")
+
+# Cubetas (segundos) de los histogramas de latencia
+CUBETAS_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Etiquetas = Tuple[str, ...]
+
+
+# ---------------------------------------------------------------------
+# Tipos de métrica (en memoria del proceso, seguros entre hilos)
+# ---------------------------------------------------------------------
+class _Metrica(abc.ABC):
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self._lock = threading.Lock()
+
+    def _clave(self, valores: Dict[str, Any]) -> Etiquetas:
+        return tuple(str(valores.get(e, "")) for e in self.etiquetas)
+
+    def _formato_etiquetas(self, clave: Etiquetas, extra: str = "") -> str:
+        partes = [f'{e}="{_escapar(v)}"' for e, v in zip(self.etiquetas, clave)]
+        partes.append(_etiqueta_proceso())
+        if extra:
+            partes.append(extra)
+        return "{" + ",".join(partes) + "}"
+
+    @abc.abstractmethod
+    def muestras(self) -> List[str]:
+        """Líneas de la métrica en el formato de texto de Prometheus."""
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._valores: Dict[Etiquetas, float] = {}
+
+    def inc(self, valor: float = 1.0, **etiquetas) -> None:
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0.0) + valor
+
+    def muestras(self) -> List[str]:
+        with self._lock:
+            valores = dict(self._valores)
+        return [f"{self.nombre}{self._formato_etiquetas(c)} {v}" for c, v in valores.items()]
+
+
+class Medidor(Contador):
+    """Gauge: valor que sube y baja (o se fija)."""
+
+    tipo = "gauge"
+
+    def fijar(self, valor: float, **etiquetas) -> None:
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = valor
+
+    def dec(self, valor: float = 1.0, **etiquetas) -> None:
+        self.inc(-valor, **etiquetas)
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = (), cubetas=CUBETAS_LATENCIA):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.cubetas = tuple(sorted(cubetas))
+        # Por etiquetas: [conteo por cubeta (+Inf al final), suma]
+        self._datos: Dict[Etiquetas, List[Any]] = {}
+
+    def observar(self, valor: float, **etiquetas) -> None:
+        clave = self._clave(etiquetas)
+        posicion = bisect_left(self.cubetas, valor)
+        with self._lock:
+            datos = self._datos.get(clave)
+            if datos is None:
+                datos = self._datos[clave] = [[0] * (len(self.cubetas) + 1), 0.0]
+            datos[0][posicion] += 1
+            datos[1] += valor
+
+    def muestras(self) -> List[str]:
+        with self._lock:
+            copia = {c: (list(d[0]), d[1]) for c, d in self._datos.items()}
+        lineas = []
+        for clave, (conteos, suma) in copia.items():
+            acumulado = 0
+            for limite, n in zip((*self.cubetas, float("inf")), conteos):
+                acumulado += n
+                le = "+Inf" if limite == float("inf") else repr(limite)
+                etiquetas = self._formato_etiquetas(clave, f'le="{le}"')
+                lineas.append(f"{self.nombre}_bucket{etiquetas} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{self._formato_etiquetas(clave)} {suma}")
+            lineas.append(f"{self.nombre}_count{self._formato_etiquetas(clave)} {acumulado}")
+        return lineas
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiqueta_proceso() -> str:
+    # Cada worker de gunicorn tiene sus propios contadores y /metrics lo
+    # atiende uno cualquiera: con el pid cada serie es de un solo proceso
+    # (para el total, sum without (pid))
+    return f'pid="{os.getpid()}"'
+
+
+# ---------------------------------------------------------------------
+# Registro
+# ---------------------------------------------------------------------
+_metricas: List[_Metrica] = []
+
+# Funciones que se llaman al exponer (valores que ya cuenta otro módulo,
+# p. ej. la caché): devuelven [(nombre, tipo, ayuda, [(etiquetas, valor)])]
+_recolectores: List[Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]] = []
+
+
+def _registrar(metrica: _Metrica):
+    _metricas.append(metrica)
+    return metrica
+
+
+def contador(nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = ()) -> Contador:
+    return _registrar(Contador(nombre, ayuda, etiquetas))
+
+
+def medidor(nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = ()) -> Medidor:
+    return _registrar(Medidor(nombre, ayuda, etiquetas))
+
+
+def histograma(nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = (), cubetas=CUBETAS_LATENCIA) -> Histograma:
+    return _registrar(Histograma(nombre, ayuda, etiquetas, cubetas))
+
+
+def registrar_recolector(funcion) -> None:
+    _recolectores.append(funcion)
+
+
+def exponer() -> str:
+    """
+    Todas las métricas en el formato de texto de Prometheus (0.0.4).
+    """
+    lineas: List[str] = []
+    for metrica in _metricas:
+        lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+        lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+        lineas.extend(metrica.muestras())
+
+    for recolector in _recolectores:
+        try:
+            familias = recolector()
+        except Exception:
+            logger.exception("Fallo en un recolector de métricas")
+            continue
+        for nombre, tipo, ayuda, muestras in familias:
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+            for etiquetas, valor in muestras:
+                partes = [f'{k}="{_escapar(str(v))}"' for k, v in etiquetas.items()]
+                texto = ",".join(partes + [_etiqueta_proceso()])
+                lineas.append(f"{nombre}{{{texto}}} {valor}")
+    return "\n".join(lineas) + "\n"
+
+
+def token_metricas_valido(autorizacion: str) -> bool:
+    """
+    True si la cabecera Authorization trae METRICAS_TOKEN (False si no hay
+    token configurado).
+    """
+    if not METRICAS_TOKEN:
+        return False
+    esquema, _, token = autorizacion.partition(" ")
+    return esquema.lower() == "bearer" and hmac.compare_digest(token.strip(), METRICAS_TOKEN)
+
+
+# ---------------------------------------------------------------------
+# Métricas de la app
+# ---------------------------------------------------------------------
+PETICIONES_SEGUNDOS = histograma(
+    "bigdata_peticion_segundos", "Duración de las peticiones HTTP.", ("ruta", "metodo", "status")
+)
+PETICIONES_EN_CURSO = medidor("bigdata_peticiones_en_curso", "Peticiones HTTP atendiéndose ahora.")
+PLANTILLA_SEGUNDOS = histograma(
+    "bigdata_plantilla_segundos", "Tiempo de render de cada plantilla.", ("plantilla",)
+)
+BACKEND_SEGUNDOS = histograma(
+    "bigdata_backend_segundos",
+    "Duración (reloj de la app) de cada llamada a Elasticsearch / MongoDB.",
+    ("backend", "operacion"),
+)
+BACKEND_ERRORES = contador(
+    "bigdata_backend_errores_total", "Llamadas a Elasticsearch / MongoDB que fallaron.", ("backend", "operacion")
+)
+ES_TOOK_SEGUNDOS = histograma(
+    "bigdata_es_took_segundos", "Tiempo que Elasticsearch dice haber tardado (took).", ("operacion",)
+)
+BULK_DOCUMENTOS = contador(
+    "bigdata_bulk_documentos_total", "Documentos enviados con bulk a Elasticsearch.", ("resultado",)
+)
+BULK_DOCS_POR_SEGUNDO = medidor(
+    "bigdata_bulk_docs_por_segundo", "Documentos por segundo de la última indexación masiva."
+)
+
+
+# ---------------------------------------------------------------------
+# Medición de llamadas y desglose por petición
+# ---------------------------------------------------------------------
+# Segundos por backend de la petición en curso (para METRICAS_LOG)
+_desglose = threading.local()
+
+
+def iniciar_desglose() -> None:
+    _desglose.tiempos = {}
+
+
+def terminar_desglose() -> Dict[str, float]:
+    tiempos = getattr(_desglose, "tiempos", None) or {}
+    _desglose.tiempos = None
+    return tiempos
+
+
+def anotar(clave: str, segundos: float) -> None:
+    """
+    Suma `segundos` al desglose de la petición en curso (si la hay).
+    """
+    tiempos = getattr(_desglose, "tiempos", None)
+    if tiempos is not None:
+        tiempos[clave] = tiempos.get(clave, 0.0) + segundos
+
+
+@contextmanager
+def medir(backend: str, operacion: str) -> Iterator[None]:
+    """
+    Mide una llamada a un backend: histograma de duración y contador de
+    errores por (backend, operacion).
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        BACKEND_ERRORES.inc(backend=backend, operacion=operacion)
+        raise
+    finally:
+        segundos = time.perf_counter() - inicio
+        BACKEND_SEGUNDOS.observar(segundos, backend=backend, operacion=operacion)
+        anotar(f"{backend}.{operacion}", segundos)
+
+
+def observar_took(operacion: str, respuesta: Any) -> None:
+    """
+    Registra el `took` (ms) de una respuesta de Elasticsearch.
+    """
+    try:
+        took = respuesta.get("took")
+    except AttributeError:
+        return
+    if took is not None:
+        ES_TOOK_SEGUNDOS.observar(took / 1000, operacion=operacion)
+        anotar(f"elastic.{operacion}.took", took / 1000)
+
+
+def observar_bulk(indexados: int, fallidos: int, docs_por_segundo: float) -> None:
+    BULK_DOCUMENTOS.inc(indexados, resultado="indexados")
+    if fallidos:
+        BULK_DOCUMENTOS.inc(fallidos, resultado="fallidos")
+    BULK_DOCS_POR_SEGUNDO.fijar(docs_por_segundo)
+
+
+# ---------------------------------------------------------------------
+# MongoDB: se mide cada comando con los eventos del driver
+# ---------------------------------------------------------------------
+class OyenteComandosMongo(monitoring.CommandListener):
+    """
+    Registra la duración de cada comando de MongoDB (find, update, insert...).
+    Funciona igual con MongoClient y con AsyncMongoClient.
+    """
+
+    def started(self, evento) -> None:
+        pass
+
+    def succeeded(self, evento) -> None:
+        segundos = evento.duration_micros / 1e6
+        BACKEND_SEGUNDOS.observar(segundos, backend="mongo", operacion=evento.command_name)
+        anotar(f"mongo.{evento.command_name}", segundos)
+
+    def failed(self, evento) -> None:
+        BACKEND_SEGUNDOS.observar(
+            evento.duration_micros / 1e6, backend="mongo", operacion=evento.command_name
+        )
+        BACKEND_ERRORES.inc(backend="mongo", operacion=evento.command_name)
+
+
+OYENTE_MONGO = OyenteComandosMongo()
+
+
+# ---------------------------------------------------------------------
+# Instrumentación de la app Flask
+# ---------------------------------------------------------------------
+def instrumentar_app(app) -> None:
+    """
+    Mide cada petición (duración por ruta, peticiones en curso y render de
+    plantillas) y, con METRICAS_LOG, escribe su desglose de tiempos.
+    """
+    from flask import before_render_template, g, request, template_rendered
+
+    log_peticiones = logging.getLogger("metricas")
+
+    @app.before_request
+    def _inicio_peticion():
+        g._metricas_inicio = time.perf_counter()
+        g._metricas_status = 500
+        PETICIONES_EN_CURSO.inc()
+        iniciar_desglose()
+
+    @app.after_request
+    def _status_peticion(respuesta):
+        g._metricas_status = respuesta.status_code
+        return respuesta
+
+    @app.teardown_request
+    def _fin_peticion(_error):
+        inicio = g.pop("_metricas_inicio", None)
+        if inicio is None:
+            return
+        PETICIONES_EN_CURSO.dec()
+        segundos = time.perf_counter() - inicio
+        ruta = request.url_rule.rule if request.url_rule else "sin_ruta"
+        status = g.pop("_metricas_status", 500)
+        PETICIONES_SEGUNDOS.observar(segundos, ruta=ruta, metodo=request.method, status=status)
+
+        desglose = terminar_desglose()
+        if METRICAS_LOG:
+            log_peticiones.info(
+                json.dumps(
+                    {
+                        "ruta": ruta,
+                        "metodo": request.method,
+                        "status": status,
+                        "ms": round(segundos * 1000, 2),
+                        "desglose_ms": {k: round(v * 1000, 2) for k, v in desglose.items()},
+                    }
+                )
+            )
+
+    def _antes_de_render(_app, template, context, **_extra):
+        g._metricas_render = time.perf_counter()
+
+    def _despues_de_render(_app, template, context, **_extra):
+        inicio = g.pop("_metricas_render", None)
+        if inicio is not None:
+            segundos = time.perf_counter() - inicio
+            PLANTILLA_SEGUNDOS.observar(segundos, plantilla=template.name)
+            anotar("plantilla", segundos)
+
+    before_render_template.connect(_antes_de_render, app, weak=False)
+    template_rendered.connect(_despues_de_render, app, weak=False)
@@ -1,16 +1,29 @@
 # proyecto_bigdata/Helpers/mongoDB.py
 import os
-from typing import List, Dict
+import logging
+from typing import Any, Dict, Iterator, List, Optional
 
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import ASCENDING, MongoClient, UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import OperationFailure
+from pymongo.write_concern import WriteConcern
+
+from Helpers.metricas import OYENTE_MONGO
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 MONGO_URI = os.getenv("MONGO_URI", "")
 MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "biblioteca_bigdata")
 MONGO_COLLECTION_LIBROS = os.getenv("MONGO_COLLECTION_LIBROS", "libros")
 
+# Escrituras de libros: operaciones por bulk_write y write concern
+MONGO_TAMANO_LOTE = int(os.getenv("MONGO_TAMANO_LOTE", "1000"))
+MONGO_W = os.getenv("MONGO_W", "1")
+MONGO_J = os.getenv("MONGO_J", "0") == "1"
+
 _client = None
 
 
@@ -19,28 +32,229 @@ def get_client() -> MongoClient:
     if _client is None:
         if not MONGO_URI:
             raise RuntimeError("MONGO_URI no está configurada.")
-        _client = MongoClient(MONGO_URI)
+        _client = MongoClient(MONGO_URI, event_listeners=[OYENTE_MONGO])
     return _client
 
 
-def guardar_libros_mongo(libros: List[Dict]) -> int:
+def _coleccion_libros(cliente):
+    # Compartida con Helpers/mongoDB_async.py (vale para los dos clientes)
+    w = int(MONGO_W) if MONGO_W.isdigit() else MONGO_W
+    return cliente[MONGO_DB_NAME][MONGO_COLLECTION_LIBROS].with_options(
+        write_concern=WriteConcern(w=w, j=MONGO_J or None)
+    )
+
+
+def get_coleccion_libros() -> Collection:
     """
-    Guarda la lista de libros en MongoDB.
-    Devuelve cuántos documentos se insertaron.
+    Colección de libros con el write concern configurado (MONGO_W / MONGO_J).
     """
+    return _coleccion_libros(get_client())
+
+
+def _grupos_repetidos(col: Collection) -> Iterator[Dict[str, Any]]:
+    # {"_id": id_libro, "ids": [_id, ...], "n": copias} de cada id repetido
+    return col.aggregate(
+        [
+            {"$group": {"_id": "$id_libro", "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+            {"$match": {"n": {"$gt": 1}}},
+        ],
+        allowDiskUse=True,
+    )
+
+
+def informe_repetidos_mongo(ejemplos: int = 10) -> Dict[str, Any]:
+    """
+    Cuántos id_libro están repetidos en la colección (restos de las cargas
+    con insert_many) y cuántos documentos sobran, sin borrar nada.
+    Devuelve {"ids_repetidos", "sobrantes", "ejemplos"}.
+    """
+    informe: Dict[str, Any] = {"ids_repetidos": 0, "sobrantes": 0, "ejemplos": []}
+    for grupo in _grupos_repetidos(get_coleccion_libros()):
+        informe["ids_repetidos"] += 1
+        informe["sobrantes"] += grupo["n"] - 1
+        if len(informe["ejemplos"]) < ejemplos:
+            informe["ejemplos"].append({"id_libro": grupo["_id"], "copias": grupo["n"]})
+    return informe
+
+
+def eliminar_repetidos_mongo() -> int:
+    """
+    Deja un solo documento por id_libro (el último insertado) y crea los
+    índices. Borra datos: revisar antes con informe_repetidos_mongo.
+    Devuelve cuántos documentos se borraron.
+    """
+    col = get_coleccion_libros()
+    borrados = 0
+    for grupo in _grupos_repetidos(col):
+        sobrantes = sorted(grupo["ids"])[:-1]
+        borrados += col.delete_many({"_id": {"$in": sobrantes}}).deleted_count
+    asegurar_indices_mongo()
+    return borrados
+
+
+def asegurar_indices_mongo() -> bool:
+    """
+    Crea (si no existen) el índice único sobre id_libro y los de apoyo a las
+    búsquedas. No borra nada: si hay libros repetidos por id_libro, avisa y
+    devuelve False (se limpian con `generar_json_libros.py mongo-repetidos`).
+    """
+    col = get_coleccion_libros()
+    unico = True
+    try:
+        col.create_index([("id_libro", ASCENDING)], unique=True, name="id_libro_unico")
+    except OperationFailure as e:
+        if e.code != 11000:
+            raise
+        unico = False
+        logger.warning(
+            "Hay libros repetidos por id_libro en MongoDB: no se creó el índice único. "
+            "Revísalos con `python scripts/generar_json_libros.py mongo-repetidos`."
+        )
+
+    col.create_index([("titulo", ASCENDING)], name="titulo")
+    col.create_index([("autor", ASCENDING), ("anio", ASCENDING)], name="autor_anio")
+    return unico
+
+
+def guardar_libros_mongo(
+    libros: List[Dict],
+    tamano_lote: int = MONGO_TAMANO_LOTE,
+) -> Dict[str, int]:
+    """
+    Guarda la lista de libros en MongoDB con upserts por id_libro (bulk_write
+    sin orden, en lotes de `tamano_lote`), así que volver a cargar el mismo
+    catálogo no duplica nada.
+    Devuelve cuántos libros se insertaron, actualizaron y quedaron igual.
+    """
+    resumen = {"insertados": 0, "actualizados": 0, "sin_cambios": 0}
     if not libros:
+        return resumen
+
+    col = get_coleccion_libros()
+    for i in range(0, len(libros), tamano_lote):
+        resultado = col.bulk_write(_operaciones_upsert(libros[i:i + tamano_lote]), ordered=False)
+        _sumar_resultado(resumen, resultado)
+
+    return resumen
+
+
+def _operaciones_upsert(libros: List[Dict]) -> List[UpdateOne]:
+    operaciones = []
+    for libro in libros:
+        # El texto (pasajes) solo se guarda en Elasticsearch
+        datos = {k: v for k, v in libro.items() if k not in ("_id", "pasajes")}
+        operaciones.append(
+            UpdateOne({"id_libro": datos["id_libro"]}, {"$set": datos}, upsert=True)
+        )
+    return operaciones
+
+
+def _sumar_resultado(resumen: Dict[str, int], resultado) -> None:
+    resumen["insertados"] += resultado.upserted_count
+    resumen["actualizados"] += resultado.modified_count
+    resumen["sin_cambios"] += resultado.matched_count - resultado.modified_count
+
+
+def huellas_libros_mongo(ids: List[Any]) -> Dict[Any, Any]:
+    """
+    Devuelve {id_libro: huella} de los libros de `ids` que ya están en Mongo
+    (la huella es None si se guardaron antes de existir las huellas).
+    """
+    if not ids:
+        return {}
+    cursor = get_coleccion_libros().find(
+        {"id_libro": {"$in": ids}}, {"_id": 0, "id_libro": 1, "huella": 1}
+    )
+    return {doc["id_libro"]: doc.get("huella") for doc in cursor}
+
+
+def marcar_vistos_mongo(ids: List[Any], carga: str) -> None:
+    """
+    Anota en los libros de `ids` que venían en la carga `carga` (campo
+    id_carga). Los que no estén en Mongo se ignoran.
+    """
+    if ids:
+        get_coleccion_libros().update_many({"id_libro": {"$in": ids}}, {"$set": {"id_carga": carga}})
+
+
+def olvidar_huellas_mongo(ids: List[Any]) -> None:
+    """
+    Quita la huella de esos libros, para que la siguiente carga los vuelva a
+    enviar (p. ej. los que Elasticsearch rechazó).
+    """
+    if ids:
+        get_coleccion_libros().update_many({"id_libro": {"$in": ids}}, {"$unset": {"huella": ""}})
+
+
+def iterar_ids_no_vistos_mongo(carga: str) -> Iterator[Any]:
+    """
+    Recorre (en bloques, sin juntarlos en memoria) los id_libro de los
+    libros que no venían en la carga `carga`.
+    """
+    cursor = get_coleccion_libros().find(
+        {"id_carga": {"$ne": carga}}, {"_id": 0, "id_libro": 1}
+    ).batch_size(10000)
+    for doc in cursor:
+        yield doc["id_libro"]
+
+
+def iterar_libros_mongo(campos: List[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Recorre todos los libros guardados, solo con los `campos` indicados.
+    """
+    proyeccion = {"_id": 0, **{campo: 1 for campo in campos}}
+    cursor = get_coleccion_libros().find({}, proyeccion).batch_size(10000)
+    yield from cursor
+
+
+def obtener_libro_mongo(id_libro: Any, campos: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    Un libro por id_libro (solo los `campos` indicados), o None. Acepta el
+    id como texto (p. ej. sacado de una URL) aunque se guardara como número.
+    """
+    ids = [id_libro]
+    if isinstance(id_libro, str) and id_libro.isdigit():
+        ids.append(int(id_libro))
+    proyeccion = {"_id": 0, **{campo: 1 for campo in campos}}
+    return get_coleccion_libros().find_one({"id_libro": {"$in": ids}}, proyeccion)
+
+
+def actualizar_canonicos_mongo(cambios: Dict[Any, Any]) -> int:
+    """
+    Guarda el nuevo grupo de casi duplicados ({id_libro: id_canonico}) de
+    esos libros. Devuelve cuántos se modificaron.
+    """
+    if not cambios:
         return 0
+    operaciones = [
+        UpdateOne(
+            {"id_libro": id_libro},
+            {"$set": {"id_canonico": canonico, "duplicado": canonico != id_libro}},
+        )
+        for id_libro, canonico in cambios.items()
+    ]
+    return get_coleccion_libros().bulk_write(operaciones, ordered=False).modified_count
 
-    db = get_client()[MONGO_DB_NAME]
-    col = db[MONGO_COLLECTION_LIBROS]
-    resultado = col.insert_many(libros)
-    return len(resultado.inserted_ids)
+
+def eliminar_libros_mongo(ids: List[Any]) -> int:
+    """
+    Borra los libros con esos id_libro. Devuelve cuántos se borraron.
+    """
+    if not ids:
+        return 0
+    return get_coleccion_libros().delete_many({"id_libro": {"$in": ids}}).deleted_count
 
 
-def contar_libros_mongo() -> int:
+def contar_libros_mongo(exacto: bool = False) -> int:
+    """
+    Total de libros. Por defecto usa estimated_document_count (metadatos de
+    la colección, sin recorrerla); con `exacto` hace count_documents.
+    """
     try:
-        db = get_client()[MONGO_DB_NAME]
-        return db[MONGO_COLLECTION_LIBROS].count_documents({})
+        col = get_client()[MONGO_DB_NAME][MONGO_COLLECTION_LIBROS]
+        if exacto:
+            return col.count_documents({})
+        return col.estimated_document_count()
     except Exception:
         return 0
 
@@ -0,0 +1,101 @@
+# proyecto_bigdata/Helpers/mongoDB_async.py
+# Versión asíncrona (pymongo AsyncMongoClient) de las funciones de
+# Helpers/mongoDB.py, con los mismos nombres. Se ejecutan en el loop de
+# Helpers/asincrono.py.
+import os
+from typing import Any, Dict, List, Optional
+
+from pymongo import AsyncMongoClient
+from pymongo.asynchronous.collection import AsyncCollection
+
+from Helpers.asincrono import al_cerrar
+from Helpers.metricas import OYENTE_MONGO
+from Helpers.mongoDB import (
+    MONGO_TAMANO_LOTE,
+    MONGO_URI,
+    _coleccion_libros,
+    _operaciones_upsert,
+    _sumar_resultado,
+)
+
+_client: Optional[AsyncMongoClient] = None
+
+
+def get_client() -> AsyncMongoClient:
+    global _client
+    if _client is None:
+        if not MONGO_URI:
+            raise RuntimeError("MONGO_URI no está configurada.")
+        _client = AsyncMongoClient(MONGO_URI, event_listeners=[OYENTE_MONGO])
+    return _client
+
+
+async def cerrar_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def _reiniciar_tras_fork() -> None:
+    # El loop del padre no existe en el hijo: el cliente se crea de nuevo
+    global _client
+    _client = None
+
+
+al_cerrar(cerrar_client)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reiniciar_tras_fork)
+
+
+def get_coleccion_libros() -> AsyncCollection:
+    return _coleccion_libros(get_client())
+
+
+async def guardar_libros_mongo(
+    libros: List[Dict],
+    tamano_lote: int = MONGO_TAMANO_LOTE,
+) -> Dict[str, int]:
+    """
+    Igual que Helpers.mongoDB.guardar_libros_mongo (upserts por id_libro).
+    """
+    resumen = {"insertados": 0, "actualizados": 0, "sin_cambios": 0}
+    if not libros:
+        return resumen
+
+    col = get_coleccion_libros()
+    for i in range(0, len(libros), tamano_lote):
+        resultado = await col.bulk_write(
+            _operaciones_upsert(libros[i:i + tamano_lote]), ordered=False
+        )
+        _sumar_resultado(resumen, resultado)
+    return resumen
+
+
+async def huellas_libros_mongo(ids: List[Any]) -> Dict[Any, Any]:
+    if not ids:
+        return {}
+    cursor = get_coleccion_libros().find(
+        {"id_libro": {"$in": ids}}, {"_id": 0, "id_libro": 1, "huella": 1}
+    )
+    return {doc["id_libro"]: doc.get("huella") async for doc in cursor}
+
+
+async def marcar_vistos_mongo(ids: List[Any], carga: str) -> None:
+    if ids:
+        await get_coleccion_libros().update_many({"id_libro": {"$in": ids}}, {"$set": {"id_carga": carga}})
+
+
+async def olvidar_huellas_mongo(ids: List[Any]) -> None:
+    if ids:
+        await get_coleccion_libros().update_many({"id_libro": {"$in": ids}}, {"$unset": {"huella": ""}})
+
+
+async def contar_libros_mongo(exacto: bool = False) -> int:
+    try:
+        col = get_client()[MONGO_DB_NAME][MONGO_COLLECTION_LIBROS]
+        if exacto:
+            return await col.count_documents({})
+        return await col.estimated_document_count()
+    except Exception:
+        return 0
@@ -0,0 +1,74 @@
+# proyecto_bigdata/Helpers/pdfs.py
+import os
+import re
+import hashlib
+from typing import Any, Dict, List, Optional
+
+from PyPDF2 import PdfReader
+
+# Años plausibles dentro de un nombre de archivo
+_PATRON_ANIO = re.compile(r"(?<!\d)(1[5-9]\d{2}|20\d{2})(?!\d)")
+
+# Fechas PDF: "D:20190315120000+01'00'"
+_PATRON_FECHA_PDF = re.compile(r"^(?:D:)?(\d{4})")
+
+
+def extraer_anio_desde_nombre(nombre: str) -> Optional[int]:
+    """
+    Devuelve el primer año (1500-2099) que aparezca en el nombre, o None.
+    """
+    m = _PATRON_ANIO.search(nombre or "")
+    return int(m.group(1)) if m else None
+
+
+def huella_archivo(ruta: str, tamano_bloque: int = 1024 * 1024) -> str:
+    """
+    SHA-256 del contenido del archivo, leído por bloques.
+    """
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(tamano_bloque), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def _texto_metadato(valor: Any) -> Optional[str]:
+    if valor is None:
+        return None
+    texto = str(valor).strip()
+    return texto or None
+
+
+def extraer_pdf(ruta: str) -> Dict[str, Any]:
+    """
+    Extrae de un PDF el texto de cada página y sus metadatos.
+
+    Devuelve {"titulo", "autor", "anio", "num_paginas", "texto_paginas"}.
+    El título es el nombre del archivo (sin extensión); el año sale del
+    nombre del archivo o, si no aparece, de la fecha de creación del PDF.
+    Lanza la excepción de PyPDF2 si el archivo no se puede leer.
+    """
+    lector = PdfReader(ruta)
+    meta = lector.metadata or {}
+
+    texto_paginas: List[str] = []
+    for pagina in lector.pages:
+        try:
+            texto_paginas.append((pagina.extract_text() or "").strip())
+        except Exception:
+            # Una página rota no invalida el resto del libro
+            texto_paginas.append("")
+
+    nombre = os.path.basename(ruta)
+    anio = extraer_anio_desde_nombre(nombre)
+    if anio is None:
+        fecha = _PATRON_FECHA_PDF.match(str(meta.get("/CreationDate") or ""))
+        anio = int(fecha.group(1)) if fecha else None
+
+    return {
+        "titulo": os.path.splitext(nombre)[0],
+        "autor": _texto_metadato(meta.get("/Author")),
+        "anio": anio,
+        "num_paginas": len(lector.pages),
+        "texto_paginas": texto_paginas,
+    }
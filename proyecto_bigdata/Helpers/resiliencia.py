@@ -0,0 +1,231 @@
+# proyecto_bigdata/Helpers/resiliencia.py
+# Protección de las llamadas a un servicio externo (Elasticsearch): un
+# interruptor (circuit breaker) que deja de llamar tras varios fallos
+# seguidos y prueba cada cierto tiempo si el servicio volvió, un tope de
+# llamadas a la vez por proceso para que los hilos no se amontonen detrás
+# de un cluster lento, y reintentos acotados con espera exponencial y jitter.
+import os
+import time
+import random
+import logging
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_INTERRUPTOR = ("cerrado", "semiabierto", "abierto")
+
+
+class CircuitoAbierto(RuntimeError):
+    """El servicio falló varias veces seguidas y no se le llama por ahora."""
+
+
+class Saturado(RuntimeError):
+    """Ya hay demasiadas llamadas al servicio en curso en este proceso."""
+
+
+class Interruptor:
+    """
+    Circuit breaker. "cerrado" deja pasar todo; tras `fallos_para_abrir`
+    fallos seguidos pasa a "abierto" y rechaza las llamadas (CircuitoAbierto)
+    durante `espera` segundos. Después deja pasar una sola llamada de prueba
+    ("semiabierto"): si sale bien se cierra y si falla vuelve a abrirse.
+    """
+
+    def __init__(self, nombre: str, fallos_para_abrir: int, espera: float):
+        self.nombre = nombre
+        self.fallos_para_abrir = max(fallos_para_abrir, 1)
+        self.espera = espera
+        self.estado = "cerrado"
+        self.aperturas = 0
+        self.rechazadas = 0
+        self._fallos = 0
+        self._abierto_desde = 0.0
+        self._probando = False
+        self._lock = threading.Lock()
+
+    def permitir(self) -> None:
+        """
+        Lanza CircuitoAbierto si ahora no se puede llamar al servicio. En
+        "semiabierto" solo pasa la primera llamada (la prueba); quien pasa
+        debe avisar después con exito() o fallo().
+        """
+        with self._lock:
+            if self.estado == "cerrado":
+                return
+            if self.estado == "abierto" and time.monotonic() - self._abierto_desde >= self.espera:
+                self.estado = "semiabierto"
+                self._probando = False
+            if self.estado == "semiabierto" and not self._probando:
+                self._probando = True
+                return
+            self.rechazadas += 1
+        raise CircuitoAbierto(f"{self.nombre} no responde; se reintentará en unos segundos.")
+
+    def rechaza(self) -> bool:
+        """
+        True si el circuito no está cerrado. No consume la llamada de prueba:
+        sirve para llamadas que no deben decidir si el servicio volvió.
+        """
+        with self._lock:
+            if self.estado != "cerrado":
+                self.rechazadas += 1
+                return True
+            return False
+
+    def exito(self) -> None:
+        with self._lock:
+            if self.estado != "cerrado":
+                logger.info("%s vuelve a responder: se cierra el circuito.", self.nombre)
+            self.estado = "cerrado"
+            self._fallos = 0
+            self._probando = False
+
+    def fallo(self) -> None:
+        with self._lock:
+            self._fallos += 1
+            if self.estado == "semiabierto" or (
+                self.estado == "cerrado" and self._fallos >= self.fallos_para_abrir
+            ):
+                logger.warning(
+                    "%s falló %d veces seguidas: se abre el circuito %.0f s.",
+                    self.nombre, self._fallos, self.espera,
+                )
+                self.estado = "abierto"
+                self._abierto_desde = time.monotonic()
+                self._probando = False
+                self.aperturas += 1
+
+    def _reiniciar(self) -> None:
+        self._lock = threading.Lock()
+        self._probando = False
+
+
+def espera_con_jitter(intento: int, base: float, maximo: float) -> float:
+    """
+    Segundos a esperar antes del reintento número `intento` (desde 0):
+    un valor al azar entre 0 y min(maximo, base * 2**intento) ("full jitter"),
+    para que los workers no reintenten todos a la vez.
+    """
+    return random.uniform(0, min(maximo, base * (2 ** intento)))
+
+
+# Protecciones creadas en este proceso (para rehacer sus locks tras un fork)
+_protecciones: "weakref.WeakSet[Proteccion]" = weakref.WeakSet()
+
+
+class Proteccion:
+    """
+    Interruptor + tope de llamadas a la vez + reintentos para un servicio.
+    `es_fallo(error)` decide qué excepciones son culpa del servicio (red,
+    timeouts, sobrecarga): solo esas cuentan para abrir el circuito y se
+    reintentan; el resto (p. ej. un 404) se propagan sin más.
+    """
+
+    def __init__(
+        self,
+        nombre: str,
+        es_fallo: Callable[[BaseException], bool],
+        fallos_para_abrir: int,
+        espera_apertura: float,
+        max_concurrentes: int,
+        espera_turno: float,
+        backoff: float,
+        backoff_max: float,
+    ):
+        self.nombre = nombre
+        self.es_fallo = es_fallo
+        self.interruptor = Interruptor(nombre, fallos_para_abrir, espera_apertura)
+        self.max_concurrentes = max(max_concurrentes, 1)
+        self.espera_turno = espera_turno
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.saturadas = 0
+        self.reintentos = 0
+        self._turnos = threading.BoundedSemaphore(self.max_concurrentes)
+        _protecciones.add(self)
+
+    @contextmanager
+    def proteger(self, compartimento: bool = True, vigilar: bool = True) -> Iterator[None]:
+        """
+        Envuelve una llamada al servicio. Con `compartimento` ocupa uno de
+        los `max_concurrentes` turnos del proceso y, si no queda ninguno en
+        `espera_turno` segundos, lanza Saturado. Con `vigilar` el resultado
+        cuenta para el interruptor; si no, la llamada solo respeta el
+        circuito (no hace de prueba ni lo abre).
+        """
+        if compartimento and not self._turnos.acquire(timeout=self.espera_turno):
+            self.saturadas += 1
+            raise Saturado(f"Demasiadas llamadas en curso a {self.nombre}.")
+        try:
+            if not vigilar:
+                if self.interruptor.rechaza():
+                    raise CircuitoAbierto(f"{self.nombre} no responde; se reintentará en unos segundos.")
+                yield
+                return
+
+            self.interruptor.permitir()
+            try:
+                yield
+            except BaseException as e:
+                if self.es_fallo(e):
+                    self.interruptor.fallo()
+                else:
+                    # El servicio respondió, aunque fuera con un error
+                    self.interruptor.exito()
+                raise
+            self.interruptor.exito()
+        finally:
+            if compartimento:
+                self._turnos.release()
+
+    def ejecutar(
+        self,
+        funcion: Callable[[], Any],
+        reintentos: int = 0,
+        compartimento: bool = True,
+        vigilar: bool = True,
+    ) -> Any:
+        """
+        Llama a `funcion()` dentro de proteger() y, si falla por culpa del
+        servicio, la reintenta hasta `reintentos` veces con espera_con_jitter.
+        Con el circuito abierto o el proceso saturado no se reintenta.
+        """
+        intento = 0
+        while True:
+            try:
+                with self.proteger(compartimento, vigilar):
+                    return funcion()
+            except (CircuitoAbierto, Saturado):
+                raise
+            except Exception as e:
+                if intento >= reintentos or not self.es_fallo(e):
+                    raise
+                self.reintentos += 1
+                time.sleep(espera_con_jitter(intento, self.backoff, self.backoff_max))
+                intento += 1
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "estado": self.interruptor.estado,
+            "aperturas": self.interruptor.aperturas,
+            "rechazadas": self.interruptor.rechazadas,
+            "saturadas": self.saturadas,
+            "reintentos": self.reintentos,
+        }
+
+    def _reiniciar(self) -> None:
+        self.interruptor._reiniciar()
+        self._turnos = threading.BoundedSemaphore(self.max_concurrentes)
+
+
+def _reiniciar_tras_fork() -> None:
+    # Los locks y turnos que tenían ocupados los hilos del padre no se
+    # liberarían nunca en el hijo
+    for proteccion in list(_protecciones):
+        proteccion._reiniciar()
+
+
+os.register_at_fork(after_in_child=_reiniciar_tras_fork)
@@ -0,0 +1,668 @@
+# proyecto_bigdata/Helpers/similares.py
+# "Libros parecidos" sin servicios externos. Cada libro se convierte en un
+# vector disperso de términos (título y texto) con feature hashing, pesado
+# con TF-IDF y normalizado; la similitud es el coseno. Los vecinos de todo el
+# catálogo se precalculan al terminar cada carga, por tramos de libros
+# repartidos entre varios procesos, y se guardan con los vectores en un
+# archivo que las peticiones leen mapeado en memoria (como el de Helpers/bm25.py).
+import os
+import json
+import math
+import mmap
+import time
+import heapq
+import zlib
+import struct
+import logging
+import threading
+import multiprocessing
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from dotenv import load_dotenv
+
+from Helpers.PLN import tokenizar
+from Helpers.bm25 import _clave_id
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Archivo de vectores y vecinos. Vacío = sin libros parecidos
+SIMILARES_RUTA = os.getenv("SIMILARES_RUTA", "")
+
+# Vecinos guardados por libro y cuántos se muestran en /buscar
+SIMILARES_K = int(os.getenv("SIMILARES_K", "10"))
+SIMILARES_MOSTRAR = int(os.getenv("SIMILARES_MOSTRAR", "3"))
+
+# Tamaño del espacio de hashing y términos (los más frecuentes) por libro
+SIMILARES_DIMENSIONES = int(os.getenv("SIMILARES_DIMENSIONES", str(2 ** 20)))
+SIMILARES_TERMINOS = int(os.getenv("SIMILARES_TERMINOS", "256"))
+
+# Caracteres del texto de cada libro que se leen (además del título)
+SIMILARES_MAX_CARACTERES = int(os.getenv("SIMILARES_MAX_CARACTERES", "100000"))
+
+# Los términos presentes en más de esta fracción de libros (o en más de
+# SIMILARES_DF_TOPE) no sirven para distinguirlos y no se recorren al buscar
+# vecinos (sí cuentan en la norma). Los que están en menos de _DF_SIEMPRE
+# libros se recorren siempre. El tope acota lo que cuesta cada libro: como
+# mucho SIMILARES_TERMINOS listas de SIMILARES_DF_TOPE libros
+SIMILARES_DF_MAX = float(os.getenv("SIMILARES_DF_MAX", "0.05"))
+SIMILARES_DF_TOPE = int(os.getenv("SIMILARES_DF_TOPE", "1000"))
+_DF_SIEMPRE = 100
+
+# Libros distintos que se puntúan como mucho por libro: los términos se
+# recorren de más a menos peso y, llegado el tope, solo se suman puntos a
+# los que ya son candidatos
+SIMILARES_CANDIDATOS = int(os.getenv("SIMILARES_CANDIDATOS", "2000"))
+
+# Procesos y libros por tramo del precálculo
+SIMILARES_PROCESOS = int(os.getenv("SIMILARES_PROCESOS", str(os.cpu_count() or 1)))
+SIMILARES_TRAMO = int(os.getenv("SIMILARES_TRAMO", "2000"))
+
+# Si cambia más de esta fracción del catálogo, los vecinos se recalculan
+# todos en lugar de solo los afectados
+SIMILARES_RECALCULO_COMPLETO = float(os.getenv("SIMILARES_RECALCULO_COMPLETO", "0.2"))
+
+# Cada término del título cuenta como PESO_TITULO apariciones (titulo^3)
+PESO_TITULO = 3
+
+# Cabecera del archivo: firma + longitud del bloque JSON
+_FIRMA = b"SIMLIB01"
+_CABECERA = struct.Struct("<8sQ")
+
+
+# ---------------------------------------------------------------------
+# Vectores
+# ---------------------------------------------------------------------
+def _rasgo(token: str) -> int:
+    # crc32 y no hash(): tiene que dar lo mismo en todos los procesos
+    return zlib.crc32(token.encode("utf-8")) % SIMILARES_DIMENSIONES
+
+
+def vectorizar(libro: Dict[str, Any]) -> Tuple[List[int], List[float]]:
+    """
+    Vector de términos de un libro normalizado: (rasgos ordenados,
+    frecuencias) con los SIMILARES_TERMINOS rasgos más frecuentes del título
+    y de los primeros SIMILARES_MAX_CARACTERES caracteres de sus pasajes.
+    """
+    conteo: Counter = Counter()
+    for token in tokenizar(str(libro.get("titulo") or "")):
+        conteo[_rasgo(token)] += PESO_TITULO
+
+    restante = SIMILARES_MAX_CARACTERES
+    for pasaje in libro.get("pasajes") or []:
+        if restante <= 0:
+            break
+        texto = pasaje["texto"][:restante]
+        restante -= len(texto)
+        conteo.update(_rasgo(token) for token in tokenizar(texto))
+
+    mejores = sorted(conteo.most_common(SIMILARES_TERMINOS))
+    return [r for r, _ in mejores], [float(tf) for _, tf in mejores]
+
+
+# ---------------------------------------------------------------------
+# Archivo de secciones (cabecera JSON + arrays alineados a 4 bytes)
+# ---------------------------------------------------------------------
+def _escribir(ruta: str, meta: Dict[str, Any], secciones: List[Tuple[str, array]]) -> None:
+    desplazamiento = 0
+    tramos = {}
+    for nombre, datos in secciones:
+        tramos[nombre] = [desplazamiento, len(datos), datos.typecode]
+        desplazamiento += datos.itemsize * len(datos)
+
+    cabecera = json.dumps({**meta, "tramos": tramos}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    cabecera += b" " * (-len(cabecera) % 4)
+
+    temporal = ruta + ".tmp"
+    with open(temporal, "wb") as f:
+        f.write(_CABECERA.pack(_FIRMA, len(cabecera)))
+        f.write(cabecera)
+        for _, datos in secciones:
+            datos.tofile(f)
+    os.replace(temporal, ruta)
+
+
+def _leer(ruta: str) -> Tuple[mmap.mmap, Dict[str, Any], Dict[str, memoryview]]:
+    with open(ruta, "rb") as f:
+        mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    firma, largo = _CABECERA.unpack_from(mapa, 0)
+    if firma != _FIRMA:
+        mapa.close()
+        raise ValueError(f"{ruta} no es un archivo de similares válido.")
+    meta = json.loads(bytes(mapa[_CABECERA.size:_CABECERA.size + largo]))
+    base = _CABECERA.size + largo
+    vista = memoryview(mapa)
+    arrays = {}
+    for nombre, (desplazamiento, n, tipo) in meta["tramos"].items():
+        inicio = base + desplazamiento
+        arrays[nombre] = vista[inicio:inicio + array(tipo).itemsize * n].cast(tipo)
+    return mapa, meta, arrays
+
+
+# ---------------------------------------------------------------------
+# IDF
+# ---------------------------------------------------------------------
+class IDF:
+    """
+    IDF de cada rasgo y rasgos útiles para buscar vecinos (los que
+    comparten más de un libro y no más del tope de SIMILARES_DF_MAX /
+    SIMILARES_DF_TOPE), calculados sobre `libros` libros en el último
+    recálculo completo. Un rasgo que no aparecía entonces pesa como uno
+    de un solo libro y no es útil hasta el siguiente recálculo completo.
+    """
+
+    def __init__(self, rasgos: Sequence[int], valores: Sequence[float], utiles: Sequence[int], libros: int):
+        self.rasgos = rasgos
+        self.valores = valores
+        self.utiles = utiles
+        self.libros = libros
+        self._por_rasgo: Optional[Dict[int, float]] = None
+
+    @classmethod
+    def calcular(cls, rasgos: Sequence[int], n: int) -> "IDF":
+        df: Counter = Counter(rasgos)
+        df_max = min(max(SIMILARES_DF_MAX * n, _DF_SIEMPRE), SIMILARES_DF_TOPE)
+        orden = sorted(df)
+        return cls(
+            array("I", orden),
+            array("f", (math.log((1 + n) / (1 + df[r])) + 1 for r in orden)),
+            # Un término de un solo libro no acerca a nadie
+            array("I", (r for r in orden if 1 < df[r] <= df_max)),
+            n,
+        )
+
+    def __getitem__(self, rasgo: int) -> float:
+        if self._por_rasgo is None:
+            self._por_rasgo = dict(zip(self.rasgos, self.valores))
+        valor = self._por_rasgo.get(rasgo)
+        return valor if valor is not None else math.log((1 + self.libros) / 2) + 1
+
+    def secciones(self) -> List[Tuple[str, array]]:
+        return [
+            (nombre, datos if isinstance(datos, array) else array(datos.format, datos))
+            for nombre, datos in (
+                ("idf_rasgos", self.rasgos),
+                ("idf_valores", self.valores),
+                ("idf_utiles", self.utiles),
+                ("idf_libros", array("I", [self.libros])),
+            )
+        ]
+
+
+# ---------------------------------------------------------------------
+# Vecinos guardados
+# ---------------------------------------------------------------------
+class Similares:
+    """
+    Vectores (CSR: `filas`, `rasgos`, `frecuencias`) y los `k` vecinos de
+    cada libro (`vecinos`, con -1 si tiene menos, y `puntos`). En un archivo
+    cargado de disco los arrays son vistas sobre el archivo mapeado.
+
+    También guarda la IDF con la que se puntuaron los vecinos (ver
+    IDF): las actualizaciones incrementales la reutilizan para que todas
+    las puntuaciones del archivo sean comparables.
+    """
+
+    def __init__(self, libros: List[Dict[str, Any]], k: int, arrays: Dict[str, Sequence]):
+        # libros[i] = {"id_libro", "titulo", "huella"} de la fila i
+        self.libros = libros
+        self.k = k
+        self.filas = arrays["filas"]
+        self.rasgos = arrays["rasgos"]
+        self.frecuencias = arrays["frecuencias"]
+        self.vecinos = arrays["vecinos"]
+        self.puntos = arrays["puntos"]
+        self.idf: Optional[IDF] = None
+        if "idf_rasgos" in arrays:
+            self.idf = IDF(arrays["idf_rasgos"], arrays["idf_valores"], arrays["idf_utiles"], arrays["idf_libros"][0])
+        self.posiciones = {str(l["id_libro"]): i for i, l in enumerate(libros)}
+        self.dimensiones = SIMILARES_DIMENSIONES
+        self._mapa: Optional[mmap.mmap] = None
+
+    def __len__(self) -> int:
+        return len(self.libros)
+
+    @classmethod
+    def cargar(cls, ruta: str) -> "Similares":
+        mapa, meta, arrays = _leer(ruta)
+        similares = cls(meta["libros"], meta["k"], arrays)
+        similares.dimensiones = meta.get("dimensiones")
+        similares._mapa = mapa
+        return similares
+
+    def guardar(self, ruta: str) -> None:
+        secciones = [
+            (nombre, datos if isinstance(datos, array) else array(datos.format, datos))
+            for nombre, datos in (
+                ("filas", self.filas),
+                ("rasgos", self.rasgos),
+                ("frecuencias", self.frecuencias),
+                ("vecinos", self.vecinos),
+                ("puntos", self.puntos),
+            )
+        ]
+        if self.idf is not None:
+            secciones += self.idf.secciones()
+        _escribir(ruta, {"libros": self.libros, "k": self.k, "dimensiones": self.dimensiones}, secciones)
+
+    def vector(self, fila: int) -> Tuple[Sequence[int], Sequence[float]]:
+        inicio, fin = self.filas[fila], self.filas[fila + 1]
+        return self.rasgos[inicio:fin], self.frecuencias[inicio:fin]
+
+    def vecinos_de(self, id_libro: Any, k: int = SIMILARES_K) -> List[Dict[str, Any]]:
+        """
+        [{"id_libro", "titulo", "score"}] de los libros más parecidos a
+        `id_libro` (vacío si no está).
+        """
+        fila = self.posiciones.get(str(id_libro))
+        if fila is None:
+            return []
+        resultado = []
+        for j in range(fila * self.k, fila * self.k + min(k, self.k)):
+            vecino = self.vecinos[j]
+            if vecino < 0:
+                break
+            libro = self.libros[vecino]
+            resultado.append(
+                {"id_libro": libro["id_libro"], "titulo": libro["titulo"], "score": round(self.puntos[j], 4)}
+            )
+        return resultado
+
+
+_similares: Optional[Similares] = None
+_similares_mtime: Optional[float] = None
+_similares_lock = threading.Lock()
+
+
+def obtener_similares(ruta: str = SIMILARES_RUTA) -> Optional[Similares]:
+    """
+    Los vecinos mapeados desde `ruta`, o None si no hay. Si el archivo cambió
+    (otra carga lo reescribió) se vuelve a mapear.
+    """
+    global _similares, _similares_mtime
+    if not ruta:
+        return None
+    try:
+        mtime = os.stat(ruta).st_mtime
+    except OSError:
+        return None
+
+    if _similares is not None and _similares_mtime == mtime:
+        return _similares
+    with _similares_lock:
+        if _similares is None or _similares_mtime != mtime:
+            try:
+                _similares = Similares.cargar(ruta)
+                _similares_mtime = mtime
+            except Exception:
+                logger.exception("No se pudo abrir el archivo de similares %s", ruta)
+                return None
+    return _similares
+
+
+def libros_similares_lote(ids: Iterable[Any], k: int = SIMILARES_MOSTRAR) -> Dict[Any, List[Dict[str, Any]]]:
+    """
+    {id_libro: vecinos} de varios libros a la vez (los de una página de
+    resultados). Vacío si no hay archivo de similares.
+    """
+    similares = obtener_similares()
+    if similares is None:
+        return {}
+    return {i: similares.vecinos_de(i, k) for i in ids}
+
+
+# ---------------------------------------------------------------------
+# Precálculo (lo que corre en cada proceso del pool)
+# ---------------------------------------------------------------------
+# Matrices temporales ya mapeadas en este proceso
+_matrices: Dict[str, Tuple[mmap.mmap, Dict[str, Any], Dict[str, memoryview]]] = {}
+
+
+def _vecinos_de_filas(ruta_matriz: str, filas: Sequence[int], k: int) -> Tuple[bytes, bytes]:
+    """
+    Top-k por coseno de cada fila de `filas` contra las columnas candidatas
+    de la matriz temporal: producto disperso recorriendo, para cada término
+    de la fila (de más a menos peso), la lista de candidatas que lo tienen.
+    Las listas están acotadas por SIMILARES_DF_TOPE y cada fila puntúa como
+    mucho SIMILARES_CANDIDATOS libros distintos, así que el top-k es
+    aproximado (el escenario similares de benchmarks/medir.py mide el recall).
+    Devuelve los arrays (vecinos, puntos) en bytes, k por fila.
+    """
+    if ruta_matriz not in _matrices:
+        _matrices[ruta_matriz] = _leer(ruta_matriz)
+    _, _, m = _matrices[ruta_matriz]
+    filas_ptr, columnas, pesos = m["filas"], m["columnas"], m["pesos"]
+    cand_ptr, cand_filas, cand_pesos = m["cand_ptr"], m["cand_filas"], m["cand_pesos"]
+
+    vecinos = array("i")
+    puntos = array("f")
+    for fila in filas:
+        acumulado: Dict[int, float] = {}
+        sumado = acumulado.get
+        inicio, fin = filas_ptr[fila], filas_ptr[fila + 1]
+        terminos = sorted(
+            zip(columnas[inicio:fin].tolist(), pesos[inicio:fin].tolist()), key=itemgetter(1), reverse=True
+        )
+        lleno = False
+        for columna, peso in terminos:
+            desde, hasta = cand_ptr[columna], cand_ptr[columna + 1]
+            otras = zip(cand_filas[desde:hasta].tolist(), cand_pesos[desde:hasta].tolist())
+            if not lleno:
+                for otra, peso_otra in otras:
+                    acumulado[otra] = sumado(otra, 0.0) + peso * peso_otra
+                lleno = len(acumulado) > SIMILARES_CANDIDATOS
+            else:
+                for otra, peso_otra in otras:
+                    if otra in acumulado:
+                        acumulado[otra] += peso * peso_otra
+        acumulado.pop(fila, None)
+
+        mejores = heapq.nlargest(k, acumulado.items(), key=itemgetter(1))
+        vecinos.extend(v for v, _ in mejores)
+        puntos.extend(s for _, s in mejores)
+        faltan = k - len(mejores)
+        vecinos.extend([-1] * faltan)
+        puntos.extend([0.0] * faltan)
+    return vecinos.tobytes(), puntos.tobytes()
+
+
+def _calcular_vecinos(ruta_matriz: str, filas: List[int], k: int, procesos: int) -> Tuple[array, array]:
+    # Tramos de SIMILARES_TRAMO filas; con uno solo no se levanta el pool
+    tramos = [filas[i:i + SIMILARES_TRAMO] for i in range(0, len(filas), max(SIMILARES_TRAMO, 1))]
+    vecinos, puntos = array("i"), array("f")
+    if len(tramos) <= 1 or procesos <= 1:
+        partes = [_vecinos_de_filas(ruta_matriz, t, k) for t in tramos]
+    else:
+        # spawn: el precálculo corre en un hilo de un worker con más hilos
+        contexto = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(procesos, len(tramos)), mp_context=contexto) as pool:
+            partes = list(pool.map(_vecinos_de_filas, [ruta_matriz] * len(tramos), tramos, [k] * len(tramos)))
+    for bytes_vecinos, bytes_puntos in partes:
+        vecinos.frombytes(bytes_vecinos)
+        puntos.frombytes(bytes_puntos)
+    _matrices.pop(ruta_matriz, None)
+    return vecinos, puntos
+
+
+def _escribir_matriz(
+    ruta: str,
+    filas: array,
+    rasgos: array,
+    frecuencias: array,
+    candidatas: Optional[Set[int]],
+    idf: IDF,
+) -> None:
+    """
+    Matriz temporal para _vecinos_de_filas: los vectores TF-IDF normalizados
+    con `idf` (solo con sus términos útiles, numerados como columnas) y, por
+    columna, las filas `candidatas` (todas si None) que la tienen, con su
+    peso.
+    """
+    n = len(filas) - 1
+    columna_de = {r: c for c, r in enumerate(idf.utiles)}
+
+    filas_ptr, columnas, pesos = array("I", [0]), array("I"), array("f")
+    por_columna: List[List[Tuple[int, float]]] = [[] for _ in columna_de]
+    for fila in range(n):
+        inicio, fin = filas[fila], filas[fila + 1]
+        valores = [(1 + math.log(frecuencias[j])) * idf[rasgos[j]] for j in range(inicio, fin)]
+        norma = math.sqrt(sum(v * v for v in valores)) or 1.0
+        for j, valor in zip(range(inicio, fin), valores):
+            columna = columna_de.get(rasgos[j])
+            if columna is None:
+                continue
+            columnas.append(columna)
+            pesos.append(valor / norma)
+            if candidatas is None or fila in candidatas:
+                por_columna[columna].append((fila, valor / norma))
+        filas_ptr.append(len(columnas))
+
+    cand_ptr, cand_filas, cand_pesos = array("I", [0]), array("I"), array("f")
+    for lista in por_columna:
+        cand_filas.extend(f for f, _ in lista)
+        cand_pesos.extend(p for _, p in lista)
+        cand_ptr.append(len(cand_filas))
+
+    _escribir(
+        ruta,
+        {},
+        [
+            ("filas", filas_ptr),
+            ("columnas", columnas),
+            ("pesos", pesos),
+            ("cand_ptr", cand_ptr),
+            ("cand_filas", cand_filas),
+            ("cand_pesos", cand_pesos),
+        ],
+    )
+
+
+# ---------------------------------------------------------------------
+# Actualización tras una carga
+# ---------------------------------------------------------------------
+class AcumuladorSimilares:
+    """
+    Recoge los libros de una carga, lote a lote. Solo se vectorizan los que
+    no están en el archivo anterior con la misma huella; sus vectores se
+    van escribiendo a un archivo temporal para no tenerlos en memoria.
+    """
+
+    def __init__(self, ruta: str = SIMILARES_RUTA):
+        self.ruta = ruta
+        try:
+            self.anterior = Similares.cargar(ruta) if os.path.exists(ruta) else None
+        except Exception:
+            logger.exception("No se pudo leer %s; los similares se recalculan de cero", ruta)
+            self.anterior = None
+        if self.anterior is not None and self.anterior.dimensiones != SIMILARES_DIMENSIONES:
+            # Los rasgos guardados no valen con otro espacio de hashing
+            self.anterior = None
+        self.vistos: Set[str] = set()
+        # Libros vectorizados en esta carga: {"id_libro", "titulo", "huella"}
+        self.nuevos: List[Dict[str, Any]] = []
+        self._largos = array("I")
+        self._ruta_vectores = ruta + ".vectores.tmp"
+        self._vectores = open(self._ruta_vectores, "wb")
+
+    def anadir_lote(self, lote: Iterable[Dict[str, Any]]) -> int:
+        """
+        Anota los libros del lote y vectoriza los nuevos o modificados.
+        Devuelve cuántos se vectorizaron.
+        """
+        anterior = self.anterior
+        vectorizados = 0
+        for libro in lote:
+            clave = str(libro["id_libro"])
+            self.vistos.add(clave)
+            if anterior is not None:
+                fila = anterior.posiciones.get(clave)
+                if fila is not None and anterior.libros[fila]["huella"] == libro.get("huella"):
+                    continue
+            rasgos, frecuencias = vectorizar(libro)
+            self.nuevos.append(
+                {"id_libro": libro["id_libro"], "titulo": libro.get("titulo"), "huella": libro.get("huella")}
+            )
+            self._largos.append(len(rasgos))
+            array("I", rasgos).tofile(self._vectores)
+            array("f", frecuencias).tofile(self._vectores)
+            vectorizados += 1
+        return vectorizados
+
+    def descartar(self) -> None:
+        self._vectores.close()
+        if os.path.exists(self._ruta_vectores):
+            os.remove(self._ruta_vectores)
+
+    def actualizar(self, conservar_no_vistos: bool, procesos: int = SIMILARES_PROCESOS) -> Dict[str, Any]:
+        """
+        Escribe el archivo nuevo con los vectores de esta carga y los que se
+        conservan del anterior: los no vistos solo si `conservar_no_vistos`
+        (carga incremental). Si cambió poco, solo se recalculan los vecinos
+        de los libros nuevos o modificados y de los que los tenían de vecinos;
+        al resto solo se les suman los nuevos que ahora entran en su top-k.
+        Devuelve {"libros", "vectorizados", "recalculados", "segundos"}.
+        """
+        inicio = time.monotonic()
+        self._vectores.close()
+        try:
+            return self._actualizar(conservar_no_vistos, procesos, inicio)
+        finally:
+            self.descartar()
+
+    def _actualizar(self, conservar_no_vistos: bool, procesos: int, inicio: float) -> Dict[str, Any]:
+        anterior = self.anterior
+        nuevos = {str(l["id_libro"]): i for i, l in enumerate(self.nuevos)}
+
+        # Filas del archivo nuevo, ordenadas por id_libro como el índice local
+        origen: Dict[str, Tuple[str, int]] = {}
+        if anterior is not None:
+            for fila, libro in enumerate(anterior.libros):
+                clave = str(libro["id_libro"])
+                if conservar_no_vistos or clave in self.vistos:
+                    origen[clave] = ("anterior", fila)
+        for clave, i in nuevos.items():
+            origen[clave] = ("nuevo", i)
+        libros = sorted(
+            (self.nuevos[i] if de == "nuevo" else anterior.libros[i] for de, i in origen.values()),
+            key=lambda l: _clave_id(l["id_libro"]),
+        )
+        fila_de = {str(l["id_libro"]): f for f, l in enumerate(libros)}
+
+        # Vectores en el orden nuevo
+        desplazamientos = array("Q", [0])
+        for largo in self._largos:
+            desplazamientos.append(desplazamientos[-1] + 8 * largo)
+        filas, rasgos, frecuencias = array("I", [0]), array("I"), array("f")
+        with open(self._ruta_vectores, "rb") as f:
+            for libro in libros:
+                de, i = origen[str(libro["id_libro"])]
+                if de == "anterior":
+                    r, tf = anterior.vector(i)
+                    rasgos.extend(r)
+                    frecuencias.extend(tf)
+                else:
+                    f.seek(desplazamientos[i])
+                    rasgos.fromfile(f, self._largos[i])
+                    frecuencias.fromfile(f, self._largos[i])
+                filas.append(len(rasgos))
+
+        # Qué vecinos hay que recalcular
+        n = len(libros)
+        k = SIMILARES_K
+        desaparecidos = set(anterior.posiciones) - set(fila_de) if anterior is not None else set()
+        cambiados = set(nuevos) | desaparecidos
+        incremental = (
+            anterior is not None
+            and anterior.k == k
+            and anterior.idf is not None
+            and n > 0
+            and len(cambiados) <= SIMILARES_RECALCULO_COMPLETO * n
+        )
+        if incremental and not cambiados:
+            # Nada nuevo ni desaparecido: el archivo anterior sigue valiendo
+            return {"libros": n, "vectorizados": 0, "recalculados": 0, "segundos": 0.0}
+
+        # La IDF solo se recalcula en los recálculos completos: los vecinos
+        # que se conservan se puntuaron con ella
+        idf = anterior.idf if incremental else IDF.calcular(rasgos, n)
+        ruta_matriz = self.ruta + ".matriz.tmp"
+        try:
+            if not incremental:
+                _escribir_matriz(ruta_matriz, filas, rasgos, frecuencias, None, idf)
+                vecinos, puntos = _calcular_vecinos(ruta_matriz, list(range(n)), k, procesos)
+                recalculados = n
+            else:
+                vecinos, puntos, recalculados = self._vecinos_incrementales(
+                    libros, fila_de, filas, rasgos, frecuencias, cambiados, ruta_matriz, procesos
+                )
+        finally:
+            if os.path.exists(ruta_matriz):
+                os.remove(ruta_matriz)
+
+        similares = Similares(
+            libros,
+            k,
+            {"filas": filas, "rasgos": rasgos, "frecuencias": frecuencias, "vecinos": vecinos, "puntos": puntos},
+        )
+        similares.idf = idf
+        similares.guardar(self.ruta)
+        resumen = {
+            "libros": n,
+            "vectorizados": len(self.nuevos),
+            "recalculados": recalculados,
+            "segundos": round(time.monotonic() - inicio, 3),
+        }
+        logger.info(
+            "Similares: %d libros, %d vectorizados, vecinos recalculados de %d (%.2f s)",
+            n, resumen["vectorizados"], recalculados, resumen["segundos"],
+        )
+        return resumen
+
+    def _vecinos_incrementales(
+        self,
+        libros: List[Dict[str, Any]],
+        fila_de: Dict[str, int],
+        filas: array,
+        rasgos: array,
+        frecuencias: array,
+        cambiados: Set[str],
+        ruta_matriz: str,
+        procesos: int,
+    ) -> Tuple[array, array, int]:
+        anterior = self.anterior
+        k = SIMILARES_K
+        n = len(libros)
+
+        # Vecinos anteriores, ya con las filas nuevas (sus puntos se
+        # calcularon con la misma IDF, así que se comparan con los nuevos)
+        previos: List[List[Tuple[int, float]]] = [[] for _ in range(n)]
+        afectadas: Set[int] = {fila_de[c] for c in cambiados if c in fila_de}
+        for clave, fila_anterior in anterior.posiciones.items():
+            fila = fila_de.get(clave)
+            if fila is None or fila in afectadas:
+                continue
+            for j in range(fila_anterior * k, fila_anterior * k + k):
+                vecino = anterior.vecinos[j]
+                if vecino < 0:
+                    break
+                clave_vecino = str(anterior.libros[vecino]["id_libro"])
+                if clave_vecino in cambiados:
+                    # Su lista se rehace entera: el vecino cambió o ya no está
+                    afectadas.add(fila)
+                    break
+                previos[fila].append((fila_de[clave_vecino], anterior.puntos[j]))
+
+        # 1) Las afectadas, contra todo el catálogo
+        orden = sorted(afectadas)
+        _escribir_matriz(ruta_matriz, filas, rasgos, frecuencias, None, anterior.idf)
+        vecinos_a, puntos_a = _calcular_vecinos(ruta_matriz, orden, k, procesos)
+
+        # 2) El resto, solo contra los libros nuevos o modificados
+        nuevas = {fila_de[str(l["id_libro"])] for l in self.nuevos}
+        resto = [f for f in range(n) if f not in afectadas]
+        vecinos_b, puntos_b = array("i"), array("f")
+        if resto and nuevas:
+            _escribir_matriz(ruta_matriz, filas, rasgos, frecuencias, nuevas, anterior.idf)
+            vecinos_b, puntos_b = _calcular_vecinos(ruta_matriz, resto, k, procesos)
+
+        vecinos, puntos = array("i", [-1] * (n * k)), array("f", [0.0] * (n * k))
+        for i, fila in enumerate(orden):
+            vecinos[fila * k:fila * k + k] = vecinos_a[i * k:i * k + k]
+            puntos[fila * k:fila * k + k] = puntos_a[i * k:i * k + k]
+        for i, fila in enumerate(resto):
+            candidatos = list(previos[fila])
+            if len(vecinos_b):
+                candidatos += [
+                    (vecinos_b[j], puntos_b[j]) for j in range(i * k, i * k + k) if vecinos_b[j] >= 0
+                ]
+            mejores = heapq.nlargest(k, candidatos, key=itemgetter(1))
+            for j, (vecino, score) in enumerate(mejores):
+                vecinos[fila * k + j] = vecino
+                puntos[fila * k + j] = score
+        return vecinos, puntos, len(orden)
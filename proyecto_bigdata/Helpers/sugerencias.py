@@ -0,0 +1,210 @@
+# proyecto_bigdata/Helpers/sugerencias.py
+# Autocompletado de títulos mientras se escribe. Las pulsaciones se
+# responden con arrays ordenados de títulos normalizados que viven en el
+# proceso (búsqueda binaria); Elasticsearch (subcampo titulo.prefijos, con
+# edge n-grams) solo se consulta si esos arrays aún no están listos o el
+# prefijo es más largo que sus claves.
+import os
+import re
+import time
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+from Helpers.PLN import plegar_acentos
+from Helpers.cache import generacion_actual
+from Helpers.elastic import sugerir_titulos
+from Helpers.metricas import medir
+from Helpers.mongoDB import iterar_libros_mongo
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Sugerencias máximas por respuesta y caracteres mínimos para sugerir
+SUGERENCIAS_MAX = int(os.getenv("SUGERENCIAS_MAX", "10"))
+SUGERENCIAS_MIN_CARACTERES = int(os.getenv("SUGERENCIAS_MIN_CARACTERES", "2"))
+
+# Caracteres de cada clave en memoria: prefijos más largos van a Elasticsearch
+SUGERENCIAS_LARGO_CLAVE = int(os.getenv("SUGERENCIAS_LARGO_CLAVE", "48"))
+
+# Tiempo máximo (ms) de la consulta a Elasticsearch; si se pasa, no hay
+# sugerencias para esa pulsación
+SUGERENCIAS_PRESUPUESTO_MS = float(os.getenv("SUGERENCIAS_PRESUPUESTO_MS", "50"))
+
+# Segundos como mucho que se usan los mismos prefijos aunque la generación
+# no cambie (p. ej. si no se pudo leer la marca de la última carga)
+SUGERENCIAS_MAX_EDAD = float(os.getenv("SUGERENCIAS_MAX_EDAD", "900"))
+
+# Cada cuánto (segundos) se mira si terminó una carga, y la espera antes de
+# reintentar si no se pudieron leer los títulos de MongoDB
+_REVISAR_CADA = 1.0
+_REINTENTAR_TRAS = 30.0
+
+_PATRON_PALABRA = re.compile(r"[0-9a-z]+")
+
+
+def normalizar_titulo(texto: str) -> str:
+    """
+    Minúsculas, sin tildes y con las palabras separadas por un espacio
+    ("  El Cálculo, 2ª ed." -> "el calculo 2 a ed").
+    """
+    return " ".join(_PATRON_PALABRA.findall(plegar_acentos(texto)))
+
+
+class PrefijosTitulos:
+    """
+    Dos arrays ordenados de claves con la posición del título de cada una:
+    `inicios` con el título entero y `palabras` con el título a partir de
+    cada una de sus otras palabras ("datos" encuentra "Mineria de datos").
+    Primero salen los títulos que empiezan por el prefijo.
+    """
+
+    def __init__(self, titulos: List[str], ids: List[Any], inicios: List, palabras: List):
+        self.titulos = titulos
+        self.ids = ids
+        self.tramos = []
+        for entradas in (inicios, palabras):
+            entradas.sort()
+            self.tramos.append(([c for c, _ in entradas], array("I", (p for _, p in entradas))))
+
+    @classmethod
+    def construir(cls, libros: Iterable[Dict[str, Any]]) -> "PrefijosTitulos":
+        titulos: List[str] = []
+        ids: List[Any] = []
+        inicios, palabras = [], []
+        for libro in libros:
+            clave = normalizar_titulo(libro.get("titulo") or "")
+            if not clave:
+                continue
+            posicion = len(titulos)
+            titulos.append(libro["titulo"])
+            ids.append(libro.get("id_libro"))
+            inicios.append((clave[:SUGERENCIAS_LARGO_CLAVE], posicion))
+            inicio = clave.find(" ") + 1
+            while inicio:
+                palabras.append((clave[inicio:inicio + SUGERENCIAS_LARGO_CLAVE], posicion))
+                inicio = clave.find(" ", inicio) + 1
+        return cls(titulos, ids, inicios, palabras)
+
+    def __len__(self) -> int:
+        return len(self.titulos)
+
+    def buscar(self, prefijo: str, limite: int) -> List[Dict[str, Any]]:
+        """
+        Hasta `limite` títulos distintos con alguna palabra que empieza por
+        `prefijo` (ya normalizado).
+        """
+        resultados: List[Dict[str, Any]] = []
+        vistos = set()
+        for claves, posiciones in self.tramos:
+            i = bisect_left(claves, prefijo)
+            while i < len(claves) and len(resultados) < limite and claves[i].startswith(prefijo):
+                titulo = self.titulos[posiciones[i]]
+                if titulo not in vistos:
+                    vistos.add(titulo)
+                    resultados.append({"id_libro": self.ids[posiciones[i]], "titulo": titulo})
+                i += 1
+        return resultados
+
+
+# ---------------------------------------------------------------------
+# Prefijos del proceso (se rehacen cuando termina una carga)
+# ---------------------------------------------------------------------
+_prefijos: Optional[PrefijosTitulos] = None
+_prefijos_generacion: Optional[int] = None
+_prefijos_construidos = 0.0
+_revisado = 0.0
+_reconstruyendo = False
+_prefijos_lock = threading.Lock()
+
+
+def _reiniciar_tras_fork() -> None:
+    # Un hilo de reconstrucción del padre no existe en el hijo
+    global _reconstruyendo, _revisado
+    _reconstruyendo = False
+    _revisado = 0.0
+
+
+os.register_at_fork(after_in_child=_reiniciar_tras_fork)
+
+
+def obtener_prefijos() -> Optional[PrefijosTitulos]:
+    """
+    Devuelve los prefijos en memoria (None hasta que se construyen por
+    primera vez). Si la generación del catálogo cambió (la ven todos los
+    workers, ver generacion_actual) o tienen más de SUGERENCIAS_MAX_EDAD
+    segundos, los rehace en un hilo aparte y mientras tanto se siguen
+    usando los anteriores.
+    """
+    global _revisado, _reconstruyendo
+    ahora = time.monotonic()
+    if ahora - _revisado < _REVISAR_CADA:
+        return _prefijos
+
+    # Valor en memoria (lo relee un hilo de Helpers/cache.py): en cada
+    # pulsación no se llama a Elasticsearch para saber la generación
+    generacion = generacion_actual()
+    with _prefijos_lock:
+        if ahora - _revisado < _REVISAR_CADA or _reconstruyendo:
+            return _prefijos
+        _revisado = ahora
+        if generacion != _prefijos_generacion or ahora - _prefijos_construidos > SUGERENCIAS_MAX_EDAD:
+            _reconstruyendo = True
+            threading.Thread(
+                target=_reconstruir, args=(generacion,), name="sugerencias", daemon=True
+            ).start()
+    return _prefijos
+
+
+def _reconstruir(generacion: int) -> None:
+    global _prefijos, _prefijos_generacion, _prefijos_construidos, _reconstruyendo, _revisado
+    inicio = time.monotonic()
+    try:
+        prefijos = PrefijosTitulos.construir(iterar_libros_mongo(["id_libro", "titulo"]))
+    except Exception as e:
+        logger.warning("No se pudieron cargar los títulos para sugerencias: %s", e)
+        with _prefijos_lock:
+            _reconstruyendo = False
+            _revisado = time.monotonic() + _REINTENTAR_TRAS
+        return
+
+    with _prefijos_lock:
+        _prefijos, _prefijos_generacion = prefijos, generacion
+        _prefijos_construidos = time.monotonic()
+        _reconstruyendo = False
+    logger.info(
+        "Sugerencias: %d títulos en %.2f s (generación %d)",
+        len(prefijos), time.monotonic() - inicio, generacion,
+    )
+
+
+def sugerir(texto: str, limite: int = SUGERENCIAS_MAX) -> Dict[str, Any]:
+    """
+    Títulos que completan `texto`. Devuelve {"sugerencias", "origen"}
+    con origen "local", "elastic" o None si no se consultó nada (texto
+    demasiado corto o Elasticsearch fuera de presupuesto).
+    """
+    prefijo = normalizar_titulo(texto)
+    if texto[-1:].isspace() and prefijo:
+        # "historia " ya no debe completar "historiadores"
+        prefijo += " "
+    limite = max(1, min(limite, SUGERENCIAS_MAX))
+    if len(prefijo.strip()) < SUGERENCIAS_MIN_CARACTERES:
+        return {"sugerencias": [], "origen": None}
+
+    prefijos = obtener_prefijos()
+    if prefijos is not None and len(prefijo) <= SUGERENCIAS_LARGO_CLAVE:
+        with medir("local", "suggest"):
+            return {"sugerencias": prefijos.buscar(prefijo, limite), "origen": "local"}
+
+    try:
+        sugerencias = sugerir_titulos(texto, limite, SUGERENCIAS_PRESUPUESTO_MS / 1000)
+    except Exception as e:
+        logger.debug("Sin sugerencias de Elasticsearch para %r: %s", texto, e)
+        return {"sugerencias": [], "origen": None}
+    return {"sugerencias": sugerencias, "origen": "elastic"}
@@ -0,0 +1,284 @@
+# proyecto_bigdata/Helpers/trabajos.py
+# Cargas de catálogo en segundo plano: /admin/cargar guarda el archivo en
+# disco y devuelve un id de trabajo enseguida; un hilo aparte lo ingiere
+# con ingerir_catalogo y va dejando su estado en un JSON que cualquier
+# worker puede leer.
+import os
+import re
+import json
+import time
+import uuid
+import codecs
+import fcntl
+import shutil
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import IO, Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from Helpers.ingesta import MODOS_INGESTA, ingerir_catalogo
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Carpeta donde se guardan los archivos subidos y el estado de cada trabajo
+TRABAJOS_DIR = os.getenv(
+    "TRABAJOS_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "trabajos"),
+)
+
+# Trabajos que se ejecutan a la vez en cada proceso y máximo en espera
+TRABAJOS_HILOS = int(os.getenv("TRABAJOS_HILOS", "1"))
+TRABAJOS_MAX_PENDIENTES = int(os.getenv("TRABAJOS_MAX_PENDIENTES", "4"))
+
+# Trabajos terminados que se conservan: los de más de TRABAJOS_RETENCION_DIAS
+# y los que pasen de TRABAJOS_MAX_GUARDADOS (los más viejos) se borran al
+# encolar otro, porque listar_trabajos lee el estado de todos
+TRABAJOS_RETENCION_DIAS = float(os.getenv("TRABAJOS_RETENCION_DIAS", "7"))
+TRABAJOS_MAX_GUARDADOS = int(os.getenv("TRABAJOS_MAX_GUARDADOS", "100"))
+
+FASES_TERMINADAS = ("terminado", "error")
+
+_PATRON_ID = re.compile(r"^[0-9a-f]{32}$")
+_TAMANO_COPIA = 1024 * 1024
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_pendientes = 0
+_lock = threading.Lock()
+
+
+def _ahora() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def _obtener_executor() -> ThreadPoolExecutor:
+    # Uno por proceso (con gunicorn, el de cada worker tras el fork)
+    global _executor, _executor_pid
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=max(TRABAJOS_HILOS, 1), thread_name_prefix="trabajo")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+# ---------------------------------------------------------------------
+# Estado en disco
+# ---------------------------------------------------------------------
+def _carpeta(id_trabajo: str) -> str:
+    if not _PATRON_ID.match(id_trabajo or ""):
+        raise ValueError("Id de trabajo no válido.")
+    return os.path.join(TRABAJOS_DIR, id_trabajo)
+
+
+def _guardar_estado(estado: Dict[str, Any]) -> None:
+    ruta = os.path.join(_carpeta(estado["id"]), "estado.json")
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(estado, f, ensure_ascii=False)
+    os.replace(temporal, ruta)
+
+
+def leer_trabajo(id_trabajo: str) -> Optional[Dict[str, Any]]:
+    """
+    Estado actual del trabajo, o None si no existe.
+    """
+    try:
+        with open(os.path.join(_carpeta(id_trabajo), "estado.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (ValueError, FileNotFoundError):
+        return None
+
+
+def listar_trabajos(limite: Optional[int] = 20) -> List[Dict[str, Any]]:
+    """
+    Los trabajos más recientes primero.
+    """
+    if not os.path.isdir(TRABAJOS_DIR):
+        return []
+    trabajos = [t for t in map(leer_trabajo, os.listdir(TRABAJOS_DIR)) if t]
+    trabajos.sort(key=lambda t: t["creado"], reverse=True)
+    return trabajos[:limite]
+
+
+def podar_trabajos() -> int:
+    """
+    Borra la carpeta de los trabajos terminados que pasan de
+    TRABAJOS_RETENCION_DIAS o de TRABAJOS_MAX_GUARDADOS (empezando por los
+    más viejos). Los que siguen en curso no se tocan. Devuelve cuántos borró.
+    """
+    limite = time.time() - TRABAJOS_RETENCION_DIAS * 86400
+    guardados = 0
+    borrados = 0
+    for trabajo in listar_trabajos(limite=None):
+        if trabajo["fase"] not in FASES_TERMINADAS:
+            continue
+        guardados += 1
+        terminado = datetime.fromisoformat(trabajo["terminado"] or trabajo["actualizado"]).timestamp()
+        if terminado < limite or guardados > TRABAJOS_MAX_GUARDADOS:
+            shutil.rmtree(_carpeta(trabajo["id"]), ignore_errors=True)
+            borrados += 1
+    return borrados
+
+
+# ---------------------------------------------------------------------
+# Encolar y ejecutar
+# ---------------------------------------------------------------------
+def encolar_carga(flujo: IO[bytes], nombre_archivo: str, modo: str) -> str:
+    """
+    Guarda el archivo subido en TRABAJOS_DIR y encola su carga. Devuelve el
+    id del trabajo. Lanza RuntimeError si ya hay TRABAJOS_MAX_PENDIENTES
+    trabajos en espera en este proceso.
+    """
+    global _pendientes
+    if modo not in MODOS_INGESTA:
+        raise ValueError(f"Modo de carga desconocido: {modo}")
+
+    with _lock:
+        if _pendientes >= TRABAJOS_MAX_PENDIENTES:
+            raise RuntimeError("Hay demasiadas cargas en curso; inténtalo en unos minutos.")
+        _pendientes += 1
+
+    try:
+        try:
+            podar_trabajos()
+        except OSError as e:
+            logger.warning("No se pudieron borrar los trabajos viejos: %s", e)
+
+        id_trabajo = uuid.uuid4().hex
+        carpeta = _carpeta(id_trabajo)
+        os.makedirs(carpeta)
+        with open(os.path.join(carpeta, "catalogo"), "wb") as destino:
+            shutil.copyfileobj(flujo, destino, _TAMANO_COPIA)
+
+        _guardar_estado(
+            {
+                "id": id_trabajo,
+                "archivo": nombre_archivo,
+                "modo": modo,
+                "fase": "en_cola",
+                "creado": _ahora(),
+                "iniciado": None,
+                "terminado": None,
+                "actualizado": _ahora(),
+                "bytes_total": os.path.getsize(os.path.join(carpeta, "catalogo")),
+                "bytes_leidos": 0,
+                "docs_por_segundo": 0.0,
+                "eta_segundos": None,
+                "reanudaciones": 0,
+                "resumen": None,
+                "error": None,
+            }
+        )
+        _obtener_executor().submit(_ejecutar, id_trabajo, True)
+    except Exception:
+        with _lock:
+            _pendientes -= 1
+        raise
+    return id_trabajo
+
+
+def reanudar_trabajos() -> List[str]:
+    """
+    Vuelve a encolar los trabajos que no terminaron (el proceso que los
+    llevaba se cayó o reinició). Cada uno sigue desde su último lote
+    confirmado. Devuelve los ids encolados.
+    """
+    reanudados = []
+    for trabajo in listar_trabajos(limite=None):
+        if trabajo["fase"] not in FASES_TERMINADAS and os.path.exists(
+            os.path.join(_carpeta(trabajo["id"]), "catalogo")
+        ):
+            _obtener_executor().submit(_ejecutar, trabajo["id"], False)
+            reanudados.append(trabajo["id"])
+    return reanudados
+
+
+def _ejecutar(id_trabajo: str, cuenta_pendiente: bool) -> None:
+    global _pendientes
+    carpeta = _carpeta(id_trabajo)
+    try:
+        # El lock del trabajo lo toma un solo proceso (se libera solo si el
+        # proceso muere); el de ingesta hace que las cargas vayan de una en una
+        with open(os.path.join(carpeta, "lock"), "w") as lock_trabajo:
+            try:
+                fcntl.flock(lock_trabajo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            os.makedirs(TRABAJOS_DIR, exist_ok=True)
+            with open(os.path.join(TRABAJOS_DIR, "ingesta.lock"), "w") as lock_ingesta:
+                fcntl.flock(lock_ingesta, fcntl.LOCK_EX)
+                _ingerir(id_trabajo)
+    except Exception:
+        logger.exception("Fallo inesperado en el trabajo %s", id_trabajo)
+    finally:
+        if cuenta_pendiente:
+            with _lock:
+                _pendientes -= 1
+
+
+def _ingerir(id_trabajo: str) -> None:
+    estado = leer_trabajo(id_trabajo)
+    if not estado or estado["fase"] in FASES_TERMINADAS:
+        return
+
+    reanudar = estado["resumen"] if estado["fase"] != "en_cola" else None
+    if reanudar:
+        estado["reanudaciones"] += 1
+        logger.info("Se reanuda el trabajo %s desde el lote %d", id_trabajo, reanudar["lotes"])
+
+    estado.update(fase="procesando", iniciado=estado["iniciado"] or _ahora(), actualizado=_ahora())
+    _guardar_estado(estado)
+
+    ruta = os.path.join(_carpeta(id_trabajo), "catalogo")
+    with open(ruta, "rb") as crudo:
+        # ingerir_catalogo avisa una vez antes del primer lote: ahí se sabe
+        # desde dónde sigue (si la generación ya no existe, empieza de cero)
+        inicio = time.monotonic()
+        al_inicio: Dict[str, int] = {}
+
+        def _progreso(parcial: Dict[str, Any]) -> None:
+            leidos_al_inicio = al_inicio.setdefault("leidos", parcial["leidos"])
+            segundos = time.monotonic() - inicio
+            posicion = crudo.tell()
+            estado["resumen"] = parcial
+            estado["bytes_leidos"] = posicion
+            if segundos > 0 and parcial["leidos"] > leidos_al_inicio:
+                estado["docs_por_segundo"] = round((parcial["leidos"] - leidos_al_inicio) / segundos, 1)
+                # ETA por la parte del archivo que falta leer
+                estado["eta_segundos"] = round(
+                    segundos * (estado["bytes_total"] - posicion) / max(posicion, 1), 1
+                )
+            estado["actualizado"] = _ahora()
+            _guardar_estado(estado)
+
+        try:
+            resumen = ingerir_catalogo(
+                codecs.getreader("utf-8-sig")(crudo),
+                progreso=_progreso,
+                modo=estado["modo"],
+                reanudar=reanudar,
+            )
+        except Exception as e:
+            logger.exception("Falló la carga del trabajo %s", id_trabajo)
+            estado.update(fase="error", error=str(e), terminado=_ahora(), actualizado=_ahora())
+            _guardar_estado(estado)
+            # Un trabajo con error no se reanuda: el archivo ya no sirve
+            os.remove(ruta)
+            return
+
+    estado.update(
+        fase="terminado",
+        resumen=resumen,
+        bytes_leidos=estado["bytes_total"],
+        eta_segundos=0,
+        terminado=_ahora(),
+        actualizado=_ahora(),
+    )
+    _guardar_estado(estado)
+    # Ya no hace falta para reanudar
+    os.remove(ruta)
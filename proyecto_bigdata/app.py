@@ -11,16 +11,37 @@ from flask import (
     url_for,
     flash,
     session,
+    Response,
+    abort,
+    jsonify,
 )
 
 from Helpers.elastic import (
-    buscar_libros,
-    contar_documentos,
-    ping_elastic,
-    indexar_libros_desde_json_str,
+    BUSQUEDA_BACKEND,
+    FACETAS_ANIO_INTERVALO,
+    INDICE_LIBROS,
+    estadisticas_cache_busquedas,
+    estado_circuito,
+    revertir_generacion,
 )
-from Helpers.mongoDB import guardar_libros_mongo, obtener_estadisticas_libros
+from Helpers.descargas import (
+    MINIATURAS_DIR,
+    PDFS_RAIZ,
+    PDFS_X_ACCEL,
+    miniaturas_disponibles,
+    pdf_de_libro,
+    respuesta_archivo,
+    respuesta_x_accel,
+    ruta_miniatura,
+)
+from Helpers.estadisticas import obtener_estadisticas, refrescar_estadisticas
+from Helpers.facetas import buscar_con_facetas, obtener_facetas
+from Helpers.ingesta import MODOS_INGESTA
+from Helpers.similares import SIMILARES_K, libros_similares_lote, obtener_similares
+from Helpers.sugerencias import SUGERENCIAS_MAX, sugerir
 from Helpers.funciones import obtener_usuario, usuarios_sin_password
+from Helpers.metricas import exponer, instrumentar_app, token_metricas_valido
+from Helpers.trabajos import encolar_carga, leer_trabajo, listar_trabajos, reanudar_trabajos
 
 load_dotenv()
 
@@ -29,6 +50,15 @@ APP_NAME = "Mini Biblioteca BigData"
 app = Flask(__name__, template_folder="templates", static_folder="static")
 app.secret_key = os.getenv("SECRET_KEY", "clave_super_secreta")
 
+# Tiempos por petición / plantilla y peticiones en curso (ver /metrics)
+instrumentar_app(app)
+
+# Cargas que quedaron a medias (el proceso se cayó o se reinició)
+try:
+    reanudar_trabajos()
+except Exception as e:
+    app.logger.warning("No se pudieron reanudar las cargas pendientes: %s", e)
+
 
 # ---------------------------------------------------------------------------
 # Decoradores de autenticación
@@ -73,32 +103,130 @@ def index():
 @app.route("/buscar", methods=["GET"])
 def buscar():
     texto = request.args.get("texto", "").strip()
+    cursor = request.args.get("cursor") or None
+    filtros = {
+        "autor": request.args.get("autor", "").strip() or None,
+        "coleccion": request.args.get("coleccion", "").strip() or None,
+        "anio_desde": request.args.get("anio_desde", type=int),
+        "anio_hasta": request.args.get("anio_hasta", type=int),
+    }
+    filtros = {k: v for k, v in filtros.items() if v is not None}
 
     resultados = []
+    similares = {}
+    miniaturas = set()
     total_resultados = 0
+    total_exacto = True
+    pagina = 1
+    siguiente_cursor = None
+    facetas = None
     error = None
 
-    hay_filtros = any([texto])
+    hay_filtros = any([texto, *filtros.values()])
 
     if hay_filtros:
         try:
-            resultados, total_resultados = buscar_libros(
-                texto=texto,
-            )
+            try:
+                respuesta = buscar_con_facetas(texto=texto, filtros=filtros, cursor=cursor)
+            except ValueError:
+                flash("El enlace de paginación no es válido; se muestra la primera página.", "warning")
+                respuesta = buscar_con_facetas(texto=texto, filtros=filtros)
+
+            resultados = respuesta["resultados"]
+            total_resultados = respuesta["total"]
+            total_exacto = respuesta["total_exacto"]
+            pagina = respuesta["pagina"]
+            siguiente_cursor = respuesta["siguiente_cursor"]
+            facetas = respuesta["facetas"]
+            similares = libros_similares_lote(r["id_libro"] for r in resultados)
+            miniaturas = miniaturas_disponibles(r["id_libro"] for r in resultados)
+            if respuesta.get("reiniciada"):
+                flash(
+                    "Elasticsearch no está disponible: el buscador local no puede seguir "
+                    "la paginación y muestra la primera página.",
+                    "warning",
+                )
+            elif respuesta.get("origen") == "local" and BUSQUEDA_BACKEND != "local":
+                flash("Elasticsearch no está disponible: resultados del buscador local.", "info")
+            elif respuesta.get("origen") == "cache":
+                flash("Elasticsearch no está disponible: resultados guardados de una búsqueda anterior.", "info")
         except Exception as e:
             error = f"Error al consultar Elasticsearch: {e}"
             flash(error, "danger")
+    elif BUSQUEDA_BACKEND != "local":
+        # Sin búsqueda: facetas del catálogo entero (precalculadas) para explorar
+        try:
+            facetas = obtener_facetas()
+        except Exception as e:
+            app.logger.warning("No se pudieron obtener las facetas: %s", e)
 
     return render_template(
         "buscador.html",
         app_nombre=APP_NAME,
         texto=texto,
+        filtros=filtros,
+        facetas=facetas,
+        anio_intervalo=FACETAS_ANIO_INTERVALO,
         resultados=resultados,
+        similares=similares,
+        miniaturas=miniaturas,
+        pdfs_activos=bool(PDFS_RAIZ),
         total_resultados=total_resultados,
+        total_exacto=total_exacto,
+        pagina=pagina,
+        siguiente_cursor=siguiente_cursor,
         error=error,
     )
 
 
+@app.route("/api/sugerencias", methods=["GET"])
+def api_sugerencias():
+    # Se llama en cada pulsación del buscador: la respuesta se puede cachear
+    texto = request.args.get("q", "")[:200]
+    limite = request.args.get("limite", SUGERENCIAS_MAX, type=int)
+
+    respuesta = jsonify(sugerir(texto, limite))
+    respuesta.headers["Cache-Control"] = "public, max-age=60"
+    return respuesta
+
+
+@app.route("/api/libros/<id_libro>/similares", methods=["GET"])
+def api_libros_similares(id_libro):
+    # Vecinos precalculados en la última carga (ver Helpers/similares.py)
+    k = max(1, min(request.args.get("k", SIMILARES_K, type=int), SIMILARES_K))
+    indice = obtener_similares()
+    if indice is None:
+        return jsonify({"error": "No hay libros parecidos calculados."}), 503
+    if id_libro not in indice.posiciones:
+        return jsonify({"error": f"No se conoce el libro {id_libro}."}), 404
+
+    libro = indice.libros[indice.posiciones[id_libro]]
+    respuesta = jsonify({"id_libro": libro["id_libro"], "similares": indice.vecinos_de(id_libro, k)})
+    respuesta.headers["Cache-Control"] = "public, max-age=60"
+    return respuesta
+
+
+@app.route("/libros/<id_libro>/pdf", methods=["GET", "HEAD"])
+def pdf_libro(id_libro):
+    # Range / ETag / sendfile en Helpers/descargas.py; con PDFS_X_ACCEL lo sirve nginx
+    ruta = pdf_de_libro(id_libro)
+    if ruta is None:
+        abort(404)
+    nombre = os.path.basename(ruta)
+    if PDFS_X_ACCEL:
+        return respuesta_x_accel(ruta, "application/pdf", nombre)
+    return respuesta_archivo(request.environ, ruta, "application/pdf", nombre)
+
+
+@app.route("/libros/<id_libro>/miniatura", methods=["GET", "HEAD"])
+def miniatura_libro(id_libro):
+    # Primera página generada en la carga (ver GeneradorMiniaturas)
+    ruta = ruta_miniatura(id_libro) if MINIATURAS_DIR else None
+    if ruta is None or not os.path.isfile(ruta):
+        abort(404)
+    return respuesta_archivo(request.environ, ruta, "image/jpeg")
+
+
 # ---------------------------------------------------------------------------
 # Login / Logout
 # ---------------------------------------------------------------------------
@@ -140,40 +268,53 @@ def logout():
 @app.route("/admin")
 @admin_requerido
 def admin():
-    # Estadísticas básicas desde MongoDB y Elasticsearch
-    estadisticas_mongo = obtener_estadisticas_libros()
-    total_es = contar_documentos()
+    # Estadísticas básicas desde MongoDB y Elasticsearch (foto en memoria)
+    estadisticas = obtener_estadisticas()
 
     return render_template(
         "admin.html",
         app_nombre=APP_NAME,
-        estadisticas_mongo=estadisticas_mongo,
-        total_indexados_es=total_es,
+        estadisticas_mongo={"total_libros_mongo": estadisticas["total_mongo"]},
+        total_indexados_es=estadisticas["total_es"],
     )
 
 
 @app.route("/admin/elastic")
 @admin_requerido
 def admin_elastic():
-    indice_actual = os.getenv("ELASTIC_INDEX", "libros_bigdata")
+    estadisticas = obtener_estadisticas()
 
-    estado_ping = ping_elastic()
-    total_indexados = contar_documentos()
-
-    error = None
-    if not estado_ping:
+    error = estadisticas["error"]
+    if not estadisticas["es_disponible"]:
         error = "No se pudo conectar con Elasticsearch."
 
     return render_template(
         "admin_elastic.html",
         app_nombre=APP_NAME,
-        indice_actual=indice_actual,
-        total_indexados=total_indexados,
-        estado_ping=estado_ping,
+        indice_actual=INDICE_LIBROS,
+        total_indexados=estadisticas["total_es"],
+        estado_ping=estadisticas["es_disponible"],
+        generacion_activa=estadisticas["generacion_activa"],
+        generaciones=estadisticas["generaciones"],
+        estadisticas=estadisticas,
+        cache_busquedas=estadisticas_cache_busquedas(),
+        circuito=estado_circuito(),
         error=error,
     )
 
 
+@app.route("/admin/elastic/revertir", methods=["POST"])
+@admin_requerido
+def admin_elastic_revertir():
+    try:
+        indice = revertir_generacion()
+        refrescar_estadisticas()
+        flash(f"El índice {INDICE_LIBROS} vuelve a apuntar a {indice}.", "success")
+    except Exception as e:
+        flash(f"No se pudo revertir la carga: {e}", "danger")
+    return redirect(url_for("admin_elastic"))
+
+
 @app.route("/admin/usuarios")
 @admin_requerido
 def admin_usuarios():
@@ -188,52 +329,79 @@ def admin_usuarios():
 @app.route("/admin/cargar", methods=["GET", "POST"])
 @admin_requerido
 def admin_cargar():
-    total_insertados_mongo = None
-    total_indexados_es = None
     error = None
 
     if request.method == "POST":
         archivo = request.files.get("archivo")
+        modo = request.form.get("modo", "incremental")
 
-        if not archivo or archivo.filename == "":
-            flash("Debes seleccionar un archivo JSON.", "warning")
+        if modo not in MODOS_INGESTA:
+            flash("Modo de carga no válido.", "warning")
+        elif not archivo or archivo.filename == "":
+            flash("Debes seleccionar un archivo JSON o NDJSON.", "warning")
         else:
             try:
-                contenido = archivo.read().decode("utf-8")
-                # Primero indexamos en Elasticsearch
-                n_es = indexar_libros_desde_json_str(contenido)
-                total_indexados_es = n_es
-
-                # También guardamos en Mongo
-                from Helpers.elastic import parsear_json_libros
-
-                libros = parsear_json_libros(contenido)
-                n_mongo = guardar_libros_mongo(libros)
-                total_insertados_mongo = n_mongo
-
-                flash(
-                    f"Se cargaron {n_es} libros en Elasticsearch y {n_mongo} en MongoDB.",
-                    "success",
-                )
+                # El archivo se guarda en disco y se carga en segundo plano:
+                # la petición no espera a Elasticsearch ni a MongoDB
+                id_trabajo = encolar_carga(archivo.stream, archivo.filename, modo)
+                flash(f"Carga {modo} de {archivo.filename} en cola.", "success")
+                return redirect(url_for("admin_trabajo", id_trabajo=id_trabajo))
             except Exception as e:
                 error = f"Error al procesar el archivo: {e}"
                 flash(error, "danger")
 
-    # Estadísticas actuales
-    total_es_actual = contar_documentos()
-    estadisticas_mongo = obtener_estadisticas_libros()
+    # Estadísticas actuales (foto en memoria, refrescada al terminar la carga)
+    estadisticas = obtener_estadisticas()
+    total_es_actual = estadisticas["total_es"]
+    estadisticas_mongo = {"total_libros_mongo": estadisticas["total_mongo"]}
 
     return render_template(
         "cargar_archivos.html",
         app_nombre=APP_NAME,
-        total_insertados_mongo=total_insertados_mongo,
-        total_indexados_es=total_indexados_es,
         error=error,
+        trabajos=listar_trabajos(),
         total_es_actual=total_es_actual,
         estadisticas_mongo=estadisticas_mongo,
     )
 
 
+@app.route("/admin/trabajos/<id_trabajo>")
+@admin_requerido
+def admin_trabajo(id_trabajo):
+    trabajo = leer_trabajo(id_trabajo)
+    if trabajo is None:
+        flash("No existe esa carga.", "warning")
+        return redirect(url_for("admin_cargar"))
+
+    return render_template("trabajo.html", app_nombre=APP_NAME, trabajo=trabajo)
+
+
+@app.route("/admin/trabajos/<id_trabajo>/estado")
+@admin_requerido
+def admin_trabajo_estado(id_trabajo):
+    trabajo = leer_trabajo(id_trabajo)
+    if trabajo is None:
+        return jsonify({"error": "No existe esa carga."}), 404
+    return jsonify(trabajo)
+
+
+# ---------------------------------------------------------------------------
+# Métricas (formato Prometheus)
+# ---------------------------------------------------------------------------
+
+@app.route("/metrics")
+def metrics():
+    # Prometheus entra con METRICAS_TOKEN; un admin, con su sesión
+    autorizado = session.get("rol") == "admin" or token_metricas_valido(
+        request.headers.get("Authorization", "")
+    )
+    if not autorizado:
+        return Response(
+            "No autorizado.\n", 401, {"WWW-Authenticate": "Bearer"}, mimetype="text/plain"
+        )
+    return Response(exponer(), mimetype="text/plain; version=0.0.4")
+
+
 # ---------------------------------------------------------------------------
 # Punto de entrada
 # ---------------------------------------------------------------------------
@@ -0,0 +1,116 @@
+# proyecto_bigdata/benchmarks/catalogo_sintetico.py
+#
+# Catálogos de libros inventados (NDJSON, con el mismo formato que genera
+# scripts/generar_json_libros.py) y consultas de búsqueda para los benchmarks.
+# Con la misma semilla siempre salen los mismos libros y consultas.
+import random
+import json
+from itertools import accumulate
+from typing import IO, Iterator, List
+
+# Palabras de los títulos; las primeras salen mucho más (reparto tipo Zipf)
+VOCABULARIO = """
+historia datos introduccion analisis sistemas programacion python redes
+gestion economia derecho matematicas estadistica fisica quimica biologia
+medicina filosofia literatura arte musica arquitectura ingenieria calculo
+algebra geometria probabilidad computacion algoritmos estructuras bases
+aprendizaje automatico inteligencia artificial mineria texto lenguaje
+procesamiento imagenes senales control automatas compiladores seguridad
+criptografia operativos distribuidos paralelos nube servicios web moviles
+diseno software pruebas calidad proyectos empresas finanzas contabilidad
+mercadeo ventas logistica produccion operaciones recursos humanos
+psicologia sociologia antropologia politica gobierno ciudades territorio
+ambiente energia agua clima suelos agricultura alimentos salud publica
+educacion pedagogia escuela universidad investigacion metodos cualitativos
+cuantitativos teoria practica manual guia curso fundamentos avanzado
+aplicaciones casos estudio colombia america latina espana europa mundo
+siglo moderno contemporaneo antiguo clasico nuevo breve completo tratado
+""".split()
+
+AUTORES = [
+    "Gabriel García", "Laura Restrepo", "Jorge Isaacs", "Ana Gómez",
+    "Carlos Pérez", "Luisa Martínez", "Andrés Caicedo", "Piedad Bonnett",
+    "Héctor Abad", "Juan Gabriel Vásquez", "Tomás Carrasquilla", "Soledad Acosta",
+]
+
+COLECCIONES = ["ingenieria", "ciencias", "humanidades", "economia", "salud", "artes"]
+
+
+def _pesos(n: int) -> List[float]:
+    return [1.0 / (rango + 1) for rango in range(n)]
+
+
+def iterar_libros(n: int, semilla: int = 42) -> Iterator[dict]:
+    """
+    Genera `n` libros con id_libro 1..n.
+    """
+    azar = random.Random(semilla)
+    pesos = _pesos(len(VOCABULARIO))
+    for id_libro in range(1, n + 1):
+        palabras = azar.choices(VOCABULARIO, weights=pesos, k=azar.randint(2, 6))
+        titulo = " ".join(palabras).capitalize()
+        coleccion = azar.choice(COLECCIONES)
+        yield {
+            "id_libro": id_libro,
+            "titulo": titulo,
+            "autor": azar.choice(AUTORES),
+            "anio": azar.randint(1950, 2025),
+            "num_paginas": azar.randint(40, 900),
+            "ruta_pdf": f"/biblioteca/{coleccion}/{'_'.join(palabras)}_{id_libro}.pdf",
+        }
+
+
+def _palabras_inventadas(n: int, azar: random.Random) -> List[str]:
+    # Palabras de 2 a 4 sílabas; salen pocas repetidas con n de miles
+    silabas = [c + v for c in "bcdfglmnprstvz" for v in "aeiou"]
+    return ["".join(azar.choices(silabas, k=azar.randint(2, 4))) for _ in range(n)]
+
+
+def iterar_libros_con_texto(
+    n: int,
+    palabras: int = 1000,
+    semilla: int = 42,
+    vocabulario: int = 20000,
+) -> Iterator[dict]:
+    """
+    Como iterar_libros, pero cada libro trae un pasaje de `palabras`
+    palabras. Cada libro tiene un tema (uno por cada 50 libros): el 70 % del
+    texto sale del vocabulario general (tipo Zipf) y el 30 % de las palabras
+    de su tema, así que los libros del mismo tema se parecen de verdad.
+    """
+    azar = random.Random(semilla + 1)
+    lexico = _palabras_inventadas(vocabulario, azar)
+    acumulados = list(accumulate(_pesos(vocabulario)))
+    temas = [azar.sample(lexico, 200) for _ in range(max(n // 50, 10))]
+    del_tema = int(palabras * 0.3)
+    for libro in iterar_libros(n, semilla):
+        tema = azar.choice(temas)
+        texto = azar.choices(lexico, cum_weights=acumulados, k=palabras - del_tema)
+        texto += azar.choices(tema, k=del_tema)
+        azar.shuffle(texto)
+        libro["pasajes"] = [{"texto": " ".join(texto)}]
+        yield libro
+
+
+def escribir_catalogo(salida: IO[str], n: int, semilla: int = 42) -> int:
+    """
+    Escribe el catálogo en NDJSON (en streaming: sirve para millones de libros).
+    """
+    escritos = 0
+    for libro in iterar_libros(n, semilla):
+        salida.write(json.dumps(libro, ensure_ascii=False) + "\n")
+        escritos += 1
+    return escritos
+
+
+def generar_consultas(n: int, semilla: int = 7) -> List[str]:
+    """
+    Consultas de una o dos palabras, con el mismo reparto que los títulos
+    (así hay consultas repetidas, como en el uso real).
+    """
+    azar = random.Random(semilla)
+    pesos = _pesos(len(VOCABULARIO))
+    return [
+        " ".join(azar.choices(VOCABULARIO, weights=pesos, k=azar.randint(1, 2)))
+        for _ in range(n)
+    ]
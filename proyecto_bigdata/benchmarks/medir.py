@@ -0,0 +1,487 @@
+# proyecto_bigdata/benchmarks/medir.py
+#
+# Benchmarks de los caminos críticos de la app:
+#   busqueda  -> GET /buscar (buscar_libros_pagina), con N clientes a la vez
+#   sugerencias -> GET /api/sugerencias con las consultas tecleadas letra a letra
+#   ingesta   -> POST /admin/cargar (ingerir_catalogo: ES + Mongo), completa
+#                y después incremental sin cambios
+#   bulk      -> el bucle de carga de scripts/generar_json_libros.py
+#                (indexar_documentos sobre el catálogo en streaming)
+#   similares -> precálculo completo de los libros parecidos (Helpers/similares.py)
+#                sobre libros con texto, y recall del top-k frente al coseno exacto
+#
+# Por defecto Elasticsearch y MongoDB son los sustitutos en memoria de
+# benchmarks/sustitutos.py; con --sustitutos locales se usan procesos reales
+# (p. ej. contenedores) indicados con --es-url / --mongo-uri.
+#
+# Uso (desde proyecto_bigdata/):
+#   python benchmarks/medir.py --libros 100000 --concurrencia 16 --salida base.json
+#   python benchmarks/medir.py --libros 100000 --comparar base.json
+#
+# Cada escenario corre en su propio proceso (el pico de RSS es solo suyo) y
+# el resultado es un JSON con operaciones/s, latencias p50/p95/p99 y RSS pico.
+import os
+import sys
+import json
+import math
+import time
+import heapq
+import argparse
+import platform
+import shutil
+import resource
+import tempfile
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+ESCENARIOS = ("busqueda", "sugerencias", "ingesta", "bulk", "similares")
+
+# Palabras de texto por libro y libros cuyo top-k se compara con el exacto
+# en el escenario similares
+PALABRAS_POR_LIBRO = 1000
+MUESTRA_SIMILARES = 50
+
+
+# ======================================================
+# Utilidades de medida
+# ======================================================
+def percentil(valores: List[float], p: float) -> float:
+    """
+    Percentil `p` (0-100) por rango más cercano.
+    """
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    posicion = max(int(round(p / 100 * len(ordenados) + 0.5)) - 1, 0)
+    return ordenados[min(posicion, len(ordenados) - 1)]
+
+
+def rss_pico_mb() -> float:
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB y macOS en bytes
+    return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def resumen_latencias(latencias_s: List[float]) -> Dict[str, float]:
+    ms = [s * 1000 for s in latencias_s]
+    return {
+        "p50": round(percentil(ms, 50), 3),
+        "p95": round(percentil(ms, 95), 3),
+        "p99": round(percentil(ms, 99), 3),
+        "max": round(max(ms), 3) if ms else 0.0,
+    }
+
+
+# ======================================================
+# Preparación del entorno
+# ======================================================
+def configurar_entorno(args) -> None:
+    # Las variables se leen al importar Helpers: hay que fijarlas antes
+    os.environ.setdefault("ESTADISTICAS_INTERVALO", "3600")
+    os.environ.setdefault("TRABAJOS_DIR", tempfile.mkdtemp(prefix="bench-trabajos-"))
+    if args.sin_cache:
+        os.environ["CACHE_BUSQUEDAS_MAX"] = "0"
+    if args.sustitutos == "locales":
+        if args.es_url:
+            os.environ["ES_URL"] = args.es_url
+        if args.mongo_uri:
+            os.environ["MONGO_URI"] = args.mongo_uri
+    else:
+        os.environ.setdefault("MONGO_URI", "mongodb://sustituto-en-memoria")
+
+
+def preparar(args):
+    """
+    Instala los sustitutos (si toca) e importa la app. Devuelve la app Flask.
+    """
+    configurar_entorno(args)
+    if args.sustitutos == "memoria":
+        from sustitutos import instalar_sustitutos
+
+        instalar_sustitutos(latencia_es=args.latencia_es_ms / 1000)
+
+    import logging
+
+    logging.disable(logging.INFO)
+    from app import app
+
+    app.config["TESTING"] = True
+    return app
+
+
+def escribir_catalogo_temporal(args) -> str:
+    from catalogo_sintetico import escribir_catalogo
+
+    fd, ruta = tempfile.mkstemp(prefix="catalogo_", suffix=".ndjson")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        escribir_catalogo(f, args.libros, args.semilla)
+    return ruta
+
+
+def cliente_admin(app):
+    cliente = app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion["usuario"] = "benchmark"
+        sesion["rol"] = "admin"
+    return cliente
+
+
+# ======================================================
+# Escenarios
+# ======================================================
+def _cargar_por_http(app, ruta: str, modo: str) -> Dict[str, Any]:
+    # La carga va en segundo plano: se mide hasta que el trabajo termina
+    cliente = cliente_admin(app)
+    inicio = time.perf_counter()
+    with open(ruta, "rb") as f:
+        resp = cliente.post(
+            "/admin/cargar",
+            data={"modo": modo, "archivo": (f, "catalogo.ndjson")},
+            content_type="multipart/form-data",
+        )
+    if resp.status_code != 302:
+        raise RuntimeError(f"/admin/cargar respondió {resp.status_code}")
+
+    url_estado = resp.headers["Location"].rstrip("/") + "/estado"
+    while True:
+        trabajo = cliente.get(url_estado).get_json()
+        if trabajo["fase"] == "terminado":
+            break
+        if trabajo["fase"] == "error":
+            raise RuntimeError(f"La carga falló: {trabajo['error']}")
+        time.sleep(0.05)
+    segundos = time.perf_counter() - inicio
+    return {"segundos": round(segundos, 3)}
+
+
+def escenario_ingesta(app, args) -> Dict[str, Any]:
+    from Helpers.elastic import contar_documentos
+
+    ruta = escribir_catalogo_temporal(args)
+    try:
+        completo = _cargar_por_http(app, ruta, "completo")
+        indexados = contar_documentos()
+        incremental = _cargar_por_http(app, ruta, "incremental")
+    finally:
+        os.remove(ruta)
+
+    if indexados != args.libros:
+        raise RuntimeError(f"Se esperaban {args.libros} libros en el índice y hay {indexados}")
+
+    return {
+        "operaciones": args.libros,
+        "segundos": completo["segundos"],
+        "por_segundo": round(args.libros / completo["segundos"], 1),
+        "incremental_segundos": incremental["segundos"],
+        "incremental_por_segundo": round(args.libros / incremental["segundos"], 1),
+        "rss_pico_mb": rss_pico_mb(),
+    }
+
+
+def escenario_bulk(app, args) -> Dict[str, Any]:
+    sys.path.insert(0, os.path.join(RAIZ, "scripts"))
+    from generar_json_libros import cargar_json
+
+    from Helpers.elastic import abortar_carga, finalizar_carga, indexar_documentos, iniciar_carga
+
+    ruta = escribir_catalogo_temporal(args)
+    indice = iniciar_carga()
+    try:
+        inicio = time.perf_counter()
+        resultado = indexar_documentos(cargar_json(ruta), indice)
+        segundos = time.perf_counter() - inicio
+        finalizar_carga(indice)
+    except Exception:
+        abortar_carga(indice)
+        raise
+    finally:
+        os.remove(ruta)
+
+    return {
+        "operaciones": resultado["indexados"],
+        "fallidos": resultado["fallidos"],
+        "segundos": round(segundos, 3),
+        "por_segundo": round(resultado["indexados"] / segundos, 1),
+        "rss_pico_mb": rss_pico_mb(),
+    }
+
+
+def _cargar_catalogo(args) -> None:
+    from Helpers.ingesta import ingerir_catalogo
+
+    ruta = escribir_catalogo_temporal(args)
+    try:
+        with open(ruta, "r", encoding="utf-8") as f:
+            ingerir_catalogo(f)
+    finally:
+        os.remove(ruta)
+
+
+def _medir_peticiones(app, args, url: str, parametros: List[Dict[str, str]]) -> Dict[str, Any]:
+    # Un GET a `url` por cada juego de parámetros, desde --concurrencia hilos
+    latencias: List[float] = []
+    errores = 0
+    lock = threading.Lock()
+    local = threading.local()
+
+    def _pedir(query_string: Dict[str, str]) -> None:
+        nonlocal errores
+        # Un cliente de pruebas por hilo
+        if not hasattr(local, "cliente"):
+            local.cliente = app.test_client()
+        inicio = time.perf_counter()
+        resp = local.cliente.get(url, query_string=query_string)
+        duracion = time.perf_counter() - inicio
+        with lock:
+            latencias.append(duracion)
+            if resp.status_code != 200:
+                errores += 1
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrencia) as pool:
+        list(pool.map(_pedir, parametros))
+    segundos = time.perf_counter() - inicio
+
+    return {
+        "operaciones": len(parametros),
+        "errores": errores,
+        "concurrencia": args.concurrencia,
+        "segundos": round(segundos, 3),
+        "por_segundo": round(len(parametros) / segundos, 1),
+        "latencia_ms": resumen_latencias(latencias),
+        "rss_pico_mb": rss_pico_mb(),
+    }
+
+
+def escenario_busqueda(app, args) -> Dict[str, Any]:
+    from catalogo_sintetico import generar_consultas
+
+    _cargar_catalogo(args)
+    consultas = generar_consultas(args.consultas, args.semilla)
+    return _medir_peticiones(app, args, "/buscar", [{"texto": texto} for texto in consultas])
+
+
+def escenario_sugerencias(app, args) -> Dict[str, Any]:
+    from catalogo_sintetico import generar_consultas
+
+    from Helpers.sugerencias import obtener_prefijos
+
+    _cargar_catalogo(args)
+    # Los prefijos en memoria se construyen en segundo plano
+    while obtener_prefijos() is None:
+        time.sleep(0.05)
+
+    # Cada consulta se "teclea" letra a letra, desde la segunda
+    pulsaciones = [
+        {"q": texto[:n]}
+        for texto in generar_consultas(args.consultas // 4 or 1, args.semilla)
+        for n in range(2, len(texto) + 1)
+    ][: args.consultas]
+    return _medir_peticiones(app, args, "/api/sugerencias", pulsaciones)
+
+
+def _vecinos_exactos(similares, muestra: List[int], k: int) -> List[List[int]]:
+    # Top-k por coseno exacto (todos los términos, sin topes) de las filas
+    # de `muestra`, con los mismos vectores TF-IDF que el precálculo
+    def normalizado(fila):
+        rasgos, frecuencias = similares.vector(fila)
+        valores = [(1 + math.log(tf)) * similares.idf[r] for r, tf in zip(rasgos, frecuencias)]
+        norma = math.sqrt(sum(v * v for v in valores)) or 1.0
+        return zip(rasgos, (v / norma for v in valores))
+
+    n = len(similares)
+    de_la_muestra: Dict[int, List] = {}
+    for posicion, fila in enumerate(muestra):
+        for rasgo, peso in normalizado(fila):
+            de_la_muestra.setdefault(rasgo, []).append((posicion, peso))
+    puntos = [[0.0] * n for _ in muestra]
+    for fila in range(n):
+        for rasgo, peso in normalizado(fila):
+            for posicion, peso_muestra in de_la_muestra.get(rasgo, ()):
+                puntos[posicion][fila] += peso * peso_muestra
+
+    exactos = []
+    for posicion, fila in enumerate(muestra):
+        puntos[posicion][fila] = -1.0
+        exactos.append(heapq.nlargest(k, range(n), key=puntos[posicion].__getitem__))
+    return exactos
+
+
+def escenario_similares(app, args) -> Dict[str, Any]:
+    import random
+
+    from catalogo_sintetico import iterar_libros_con_texto
+
+    from Helpers.similares import SIMILARES_K, AcumuladorSimilares, Similares
+
+    carpeta = tempfile.mkdtemp(prefix="bench-similares-")
+    ruta = os.path.join(carpeta, "similares.bin")
+    try:
+        inicio = time.perf_counter()
+        acumulador = AcumuladorSimilares(ruta)
+        lote = []
+        for libro in iterar_libros_con_texto(args.libros, PALABRAS_POR_LIBRO, args.semilla):
+            lote.append(libro)
+            if len(lote) == 1000:
+                acumulador.anadir_lote(lote)
+                lote = []
+        acumulador.anadir_lote(lote)
+        resumen = acumulador.actualizar(conservar_no_vistos=False)
+        segundos = time.perf_counter() - inicio
+        rss = rss_pico_mb()
+
+        # Lo que se pierde por los topes (SIMILARES_DF_*, SIMILARES_CANDIDATOS)
+        similares = Similares.cargar(ruta)
+        muestra = random.Random(args.semilla).sample(range(len(similares)), min(MUESTRA_SIMILARES, len(similares)))
+        aciertos = total = 0
+        for fila, exactos in zip(muestra, _vecinos_exactos(similares, muestra, SIMILARES_K)):
+            guardados = {v for v in similares.vecinos[fila * SIMILARES_K:(fila + 1) * SIMILARES_K] if v >= 0}
+            aciertos += len(guardados & set(exactos))
+            total += len(exactos)
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+    return {
+        "operaciones": resumen["libros"],
+        "segundos": round(segundos, 3),
+        "por_segundo": round(resumen["libros"] / segundos, 1),
+        "vecinos_segundos": resumen["segundos"],
+        "recall_top_k": round(aciertos / total, 3) if total else None,
+        "rss_pico_mb": rss,
+    }
+
+
+# ======================================================
+# Ejecución y comparación
+# ======================================================
+def ejecutar_escenario(args) -> Dict[str, Any]:
+    app = preparar(args)
+    funcion = {
+        "busqueda": escenario_busqueda,
+        "sugerencias": escenario_sugerencias,
+        "ingesta": escenario_ingesta,
+        "bulk": escenario_bulk,
+        "similares": escenario_similares,
+    }[args.escenario]
+    return funcion(app, args)
+
+
+def _revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=RAIZ, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return ""
+
+
+def ejecutar_todos(args, argv: List[str]) -> Dict[str, Any]:
+    escenarios = ESCENARIOS if args.escenario == "todos" else (args.escenario,)
+    resultados = {}
+    for nombre in escenarios:
+        # Un proceso por escenario: RSS y cachés no se mezclan entre escenarios
+        proceso = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *argv, "--escenario", nombre, "--interno"],
+            capture_output=True, text=True,
+        )
+        if proceso.returncode != 0:
+            sys.stderr.write(proceso.stderr)
+            resultados[nombre] = {"error": proceso.stderr.strip().splitlines()[-1:]}
+            continue
+        resultados[nombre] = json.loads(proceso.stdout)
+        print(f"{nombre}: {json.dumps(resultados[nombre])}", file=sys.stderr)
+
+    return {
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": _revision(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "parametros": {
+            "libros": args.libros,
+            "consultas": args.consultas,
+            "concurrencia": args.concurrencia,
+            "sustitutos": args.sustitutos,
+            "latencia_es_ms": args.latencia_es_ms,
+            "sin_cache": args.sin_cache,
+            "semilla": args.semilla,
+        },
+        "resultados": resultados,
+    }
+
+
+def comparar(actual: Dict[str, Any], base: Dict[str, Any], tolerancia: float) -> List[str]:
+    """
+    Devuelve las regresiones: rendimiento por debajo de la base o p95 por
+    encima, en más de `tolerancia` (0.1 = 10 %).
+    """
+    regresiones = []
+    for nombre, medida in actual["resultados"].items():
+        previa = base.get("resultados", {}).get(nombre)
+        if not previa or "error" in medida or "error" in previa:
+            continue
+        if medida["por_segundo"] < previa["por_segundo"] * (1 - tolerancia):
+            regresiones.append(
+                f"{nombre}: {medida['por_segundo']} ops/s (antes {previa['por_segundo']})"
+            )
+        p95, p95_previo = medida.get("latencia_ms", {}).get("p95"), previa.get("latencia_ms", {}).get("p95")
+        if p95 and p95_previo and p95 > p95_previo * (1 + tolerancia):
+            regresiones.append(f"{nombre}: p95 {p95} ms (antes {p95_previo} ms)")
+    return regresiones
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks de búsqueda e ingesta.")
+    parser.add_argument("--escenario", choices=(*ESCENARIOS, "todos"), default="todos")
+    parser.add_argument("--libros", type=int, default=10000, help="Tamaño del catálogo sintético.")
+    parser.add_argument("--consultas", type=int, default=2000, help="Búsquedas del escenario busqueda.")
+    parser.add_argument("--concurrencia", type=int, default=8, help="Clientes simultáneos contra /buscar.")
+    parser.add_argument("--sustitutos", choices=("memoria", "locales"), default="memoria")
+    parser.add_argument("--es-url", default="", help="Elasticsearch local (con --sustitutos locales).")
+    parser.add_argument("--mongo-uri", default="", help="MongoDB local (con --sustitutos locales).")
+    parser.add_argument("--latencia-es-ms", type=float, default=0.0,
+                        help="Latencia simulada por petición al Elasticsearch en memoria.")
+    parser.add_argument("--sin-cache", action="store_true", help="Desactiva la caché de búsquedas.")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", default="", help="Archivo JSON de resultados (por defecto, stdout).")
+    parser.add_argument("--comparar", default="", help="JSON de una ejecución anterior.")
+    parser.add_argument("--tolerancia", type=float, default=0.10)
+    parser.add_argument("--interno", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.interno:
+        print(json.dumps(ejecutar_escenario(args)))
+        return
+
+    # Argumentos que se pasan a cada proceso de escenario
+    argv = [a for a in sys.argv[1:]]
+    if "--escenario" in argv:
+        i = argv.index("--escenario")
+        del argv[i:i + 2]
+    informe = ejecutar_todos(args, argv)
+
+    texto = json.dumps(informe, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            regresiones = comparar(informe, json.load(f), args.tolerancia)
+        for linea in regresiones:
+            print(f"REGRESIÓN {linea}", file=sys.stderr)
+        if regresiones:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,754 @@
+# proyecto_bigdata/benchmarks/sustitutos.py
+#
+# Sustitutos en memoria de Elasticsearch y MongoDB para medir la app sin
+# servicios externos.
+#
+# - Elasticsearch: un nodo de transporte falso. Los clientes son los reales
+#   (Elasticsearch / AsyncElasticsearch, helpers.streaming_bulk...) y hacen
+#   la misma serialización; solo la "red" se sustituye por ElasticFalso, que
+#   responde a la API REST que usa Helpers/elastic.py. La búsqueda puntúa con
+#   el BM25 de Helpers/bm25.py.
+# - MongoDB: colección en memoria con las operaciones que usa
+#   Helpers/mongoDB.py (y su versión asíncrona).
+import re
+import json
+import time
+import asyncio
+import fnmatch
+import threading
+from collections import Counter
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from elastic_transport import ApiResponseMeta, BaseAsyncNode, BaseNode, HttpHeaders
+from elastic_transport._node._base import NodeApiResponse
+from pymongo.results import BulkWriteResult, DeleteResult, UpdateResult
+
+from Helpers.PLN import tokenizar
+from Helpers.bm25 import IndiceBM25, _clave_id
+from Helpers.sugerencias import normalizar_titulo
+
+# Máximo de hits que ES cuenta con exactitud si no se pide track_total_hits
+_TOTAL_EXACTO_POR_DEFECTO = 10000
+
+
+# ---------------------------------------------------------------------
+# Elasticsearch
+# ---------------------------------------------------------------------
+class _Indice:
+    def __init__(self, settings: Optional[Dict] = None, mappings: Optional[Dict] = None):
+        self.settings = settings or {}
+        self.mappings = mappings or {}
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self._bm25: Optional[IndiceBM25] = None
+        self._claves: List[Tuple[int, Any]] = []
+        self._pasajes: Optional[Dict[str, List[Dict[str, Any]]]] = None
+
+    def modificado(self) -> None:
+        self._bm25 = None
+        self._pasajes = None
+
+    def bm25(self) -> Tuple[IndiceBM25, List[Tuple[int, Any]]]:
+        # Solo puntúan los libros; los pasajes se miran en pasajes()
+        if self._bm25 is None:
+            self._bm25 = IndiceBM25.construir(d for d in self.docs.values() if d.get("tipo") != "pasaje")
+            self._claves = [_clave_id(l["id_libro"]) for l in self._bm25.libros]
+        return self._bm25, self._claves
+
+    def pasajes(self, id_libro: Any) -> List[Dict[str, Any]]:
+        if self._pasajes is None:
+            self._pasajes = {}
+            for doc in self.docs.values():
+                if doc.get("tipo") == "pasaje":
+                    self._pasajes.setdefault(str(doc["id_libro"]), []).append(doc)
+        return self._pasajes.get(str(id_libro), [])
+
+
+class ElasticFalso:
+    """
+    Cluster de Elasticsearch en memoria. Atiende (método, ruta, cuerpo) y
+    devuelve (status, respuesta) como lo haría la API REST.
+    """
+
+    def __init__(self, latencia: float = 0.0):
+        # Segundos que tarda cada petición (simula la red)
+        self.latencia = latencia
+        self.indices: Dict[str, _Indice] = {}
+        self.alias: Dict[str, set] = {}
+        self.pits: Dict[str, List[str]] = {}
+        self.peticiones = 0
+        self._lock = threading.RLock()
+
+    # -- resolución de nombres -----------------------------------------
+    def _resolver(self, objetivo: str) -> List[str]:
+        nombres: List[str] = []
+        for parte in unquote(objetivo).split(","):
+            if any(c in parte for c in "*?"):
+                nombres += [i for i in self.indices if fnmatch.fnmatch(i, parte)]
+            elif parte in self.alias:
+                nombres += sorted(self.alias[parte])
+            elif parte in self.indices:
+                nombres.append(parte)
+        return nombres
+
+    @staticmethod
+    def _no_encontrado(objetivo: str) -> Tuple[int, Dict[str, Any]]:
+        return 404, {
+            "error": {"type": "index_not_found_exception", "reason": f"no such index [{objetivo}]"},
+            "status": 404,
+        }
+
+    # -- despacho ------------------------------------------------------
+    def atender(self, metodo: str, ruta: str, cuerpo: Optional[bytes]) -> Tuple[int, Any]:
+        self.peticiones += 1
+        partes = urlsplit(ruta)
+        params = {k: v[0] for k, v in parse_qs(partes.query).items()}
+        segmentos = [s for s in partes.path.split("/") if s]
+        ndjson = segmentos[-1:] in (["_bulk"], ["_msearch"])
+        datos = json.loads(cuerpo) if cuerpo and not ndjson else None
+
+        with self._lock:
+            if not segmentos:
+                return 200, {"version": {"number": "9.2.0"}, "tagline": "You Know, for Search"}
+            if segmentos[0] == "_bulk":
+                return self._bulk(cuerpo or b"", params)
+            if segmentos[0] == "_aliases":
+                return self._actualizar_alias(datos["actions"])
+            if segmentos[0] == "_alias":
+                return self._obtener_alias(segmentos[1])
+            if segmentos[0] == "_pit":
+                self.pits.pop((datos or {}).get("id"), None)
+                return 200, {"succeeded": True, "num_freed": 1}
+            if segmentos[-1] == "_msearch":
+                return self._msearch(cuerpo or b"", segmentos[0] if len(segmentos) > 1 else None)
+            if segmentos[0] == "_search":
+                return self._buscar(self.pits.get(datos["pit"]["id"], []), datos, datos["pit"]["id"])
+
+            objetivo = segmentos[0]
+            accion = segmentos[1] if len(segmentos) > 1 else None
+            if accion is None:
+                return self._indice(metodo, objetivo, datos)
+
+            nombres = self._resolver(objetivo)
+            if not nombres and not any(c in objetivo for c in "*?"):
+                return self._no_encontrado(objetivo)
+            if accion == "_search":
+                return self._buscar(nombres, datos or {})
+            if accion == "_count":
+                excluir = (datos or {}).get("query", {}).get("bool", {}).get("must_not", [])
+                return 200, {"count": sum(
+                    1 for n in nombres for d in self.indices[n].docs.values()
+                    if not any(_cumple_filtro(d, c) for c in excluir)
+                )}
+            if accion == "_delete_by_query":
+                return self._borrar_por_consulta(nombres, datos["query"])
+            if accion == "_mapping":
+                if metodo == "PUT":
+                    # Los campos se añaden y el _meta se sustituye, como en ES
+                    for n in nombres:
+                        mappings = self.indices[n].mappings
+                        mappings.setdefault("properties", {}).update(datos.get("properties", {}))
+                        if "_meta" in datos:
+                            mappings["_meta"] = datos["_meta"]
+                    return 200, {"acknowledged": True}
+                return 200, {n: {"mappings": self.indices[n].mappings} for n in nombres}
+            if accion in ("_refresh", "_forcemerge"):
+                return 200, {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+            if accion == "_settings":
+                for n in nombres:
+                    self.indices[n].settings.update(datos.get("index", datos))
+                return 200, {"acknowledged": True}
+            if accion == "_stats":
+                return self._estadisticas(nombres)
+            if accion == "_pit":
+                pit = f"pit-{len(self.pits) + 1}-{time.monotonic_ns()}"
+                self.pits[pit] = nombres
+                return 200, {"id": pit}
+        return 400, {"error": {"type": "illegal_argument_exception", "reason": ruta}, "status": 400}
+
+    # -- índices y alias -----------------------------------------------
+    def _indice(self, metodo: str, objetivo: str, datos: Optional[Dict]) -> Tuple[int, Any]:
+        nombres = self._resolver(objetivo)
+        if metodo == "PUT":
+            self.indices[objetivo] = _Indice(datos.get("settings"), datos.get("mappings"))
+            return 200, {"acknowledged": True, "index": objetivo}
+        if metodo == "DELETE":
+            if not nombres:
+                return self._no_encontrado(objetivo)
+            for n in nombres:
+                self.indices.pop(n, None)
+                for miembros in self.alias.values():
+                    miembros.discard(n)
+            return 200, {"acknowledged": True}
+        if metodo == "HEAD":
+            return (200 if nombres else 404), None
+        if not nombres and not any(c in objetivo for c in "*?"):
+            return self._no_encontrado(objetivo)
+        return 200, {
+            n: {
+                "aliases": {a: {} for a, m in self.alias.items() if n in m},
+                "mappings": self.indices[n].mappings,
+                "settings": {"index": self.indices[n].settings},
+            }
+            for n in nombres
+        }
+
+    def _obtener_alias(self, nombre: str) -> Tuple[int, Any]:
+        miembros = self.alias.get(unquote(nombre))
+        if not miembros:
+            return 404, {"error": f"alias [{nombre}] missing", "status": 404}
+        return 200, {i: {"aliases": {nombre: {}}} for i in sorted(miembros)}
+
+    def _actualizar_alias(self, acciones: List[Dict[str, Any]]) -> Tuple[int, Any]:
+        for accion in acciones:
+            tipo, args = next(iter(accion.items()))
+            if tipo == "add":
+                self.alias.setdefault(args["alias"], set()).add(args["index"])
+            elif tipo == "remove":
+                self.alias.get(args["alias"], set()).discard(args["index"])
+            elif tipo == "remove_index":
+                self.indices.pop(args["index"], None)
+        return 200, {"acknowledged": True}
+
+    def _estadisticas(self, nombres: List[str]) -> Tuple[int, Any]:
+        docs = sum(len(self.indices[n].docs) for n in nombres)
+        tamano = sum(len(json.dumps(d)) for n in nombres for d in self.indices[n].docs.values())
+        return 200, {
+            "_all": {
+                "primaries": {"docs": {"count": docs}, "segments": {"count": len(nombres)}},
+                "total": {"store": {"size_in_bytes": tamano}},
+            }
+        }
+
+    # -- escritura -----------------------------------------------------
+    def _bulk(self, cuerpo: bytes, params: Dict[str, str]) -> Tuple[int, Any]:
+        lineas = iter(cuerpo.decode("utf-8").splitlines())
+        items = []
+        for linea in lineas:
+            if not linea.strip():
+                continue
+            tipo, meta = next(iter(json.loads(linea).items()))
+            nombre = meta.get("_index") or params.get("index")
+            nombres = self._resolver(nombre)
+            indice = self.indices[nombres[0]] if nombres else self.indices.setdefault(nombre, _Indice())
+            _id = str(meta.get("_id"))
+            if tipo == "delete":
+                existia = indice.docs.pop(_id, None) is not None
+                items.append({"delete": {"_index": nombre, "_id": _id, "status": 200 if existia else 404,
+                                         "result": "deleted" if existia else "not_found"}})
+            else:
+                fuente = json.loads(next(lineas))
+                if tipo == "update":
+                    fuente = {**indice.docs.get(_id, {}), **fuente.get("doc", {})}
+                existia = _id in indice.docs
+                indice.docs[_id] = fuente
+                items.append({tipo: {"_index": nombre, "_id": _id, "status": 200 if existia else 201,
+                                     "result": "updated" if existia else "created"}})
+            indice.modificado()
+        return 200, {"took": 1, "errors": False, "items": items}
+
+    def _borrar_por_consulta(self, nombres: List[str], query: Dict[str, Any]) -> Tuple[int, Any]:
+        filtros = query.get("bool", {}).get("filter", [])
+        # must_not: solo el {"ids": ...} de los pasajes que se conservan
+        conservar = {v for c in query.get("bool", {}).get("must_not", []) for v in c.get("ids", {}).get("values", [])}
+        borrados = 0
+        for nombre in nombres:
+            indice = self.indices[nombre]
+            for _id in [
+                i for i, d in indice.docs.items()
+                if str(i) not in conservar and all(_cumple_filtro(d, f) for f in filtros)
+            ]:
+                del indice.docs[_id]
+                borrados += 1
+            indice.modificado()
+        return 200, {"took": 1, "timed_out": False, "total": borrados, "deleted": borrados, "failures": []}
+
+    # -- búsqueda ------------------------------------------------------
+    def _msearch(self, cuerpo: bytes, objetivo: Optional[str]) -> Tuple[int, Any]:
+        lineas = [json.loads(l) for l in cuerpo.splitlines() if l.strip()]
+        respuestas = []
+        for cabecera, datos in zip(lineas[::2], lineas[1::2]):
+            indice = cabecera.get("index", objetivo)
+            nombres = self._resolver(indice)
+            if nombres:
+                status, respuesta = self._buscar(nombres, datos)
+            else:
+                status, respuesta = self._no_encontrado(indice)
+            respuestas.append({**respuesta, "status": status})
+        return 200, {"took": sum(r.get("took", 0) for r in respuestas), "responses": respuestas}
+
+    @staticmethod
+    def _texto_consulta(query: Dict[str, Any]) -> str:
+        for clausula in query.get("bool", {}).get("must", []):
+            clausula = next(
+                (c for c in clausula.get("bool", {}).get("should", []) if "multi_match" in c), clausula
+            )
+            if "multi_match" in clausula:
+                return clausula["multi_match"].get("query", "")
+        return ""
+
+    @staticmethod
+    def _consulta_pasajes(query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        for clausula in query.get("bool", {}).get("must", []):
+            for c in clausula.get("bool", {}).get("should", []):
+                if "has_child" in c:
+                    return c["has_child"]
+        return None
+
+    def _pasajes_del_hit(self, nombre: str, id_libro: Any, has_child: Dict[str, Any]) -> Dict[str, Any]:
+        # Los pasajes que comparten algún término con la consulta, por número
+        # de términos en común, con el fragmento resaltado alrededor del
+        # primero (sin fvh: basta para pintar la página de resultados)
+        internos = has_child["inner_hits"]
+        terminos = set(tokenizar(has_child["query"]["match"]["texto"]))
+        resaltado = internos["highlight"]
+        campo = resaltado["fields"]["texto"]
+        hits = []
+        for doc in self.indices[nombre].pasajes(id_libro):
+            palabras = re.findall(r"\S+", doc["texto"])
+            marcadas = [bool(terminos.intersection(tokenizar(p))) for p in palabras]
+            if not any(marcadas):
+                continue
+            desde = max(marcadas.index(True) - 5, 0)
+            trozo, largo = [], 0
+            for palabra, marcada in zip(palabras[desde:], marcadas[desde:]):
+                if largo + len(palabra) > campo["fragment_size"] and trozo:
+                    break
+                largo += len(palabra) + 1
+                trozo.append(f"{resaltado['pre_tags'][0]}{palabra}{resaltado['post_tags'][0]}" if marcada else palabra)
+            hits.append({
+                "_id": f"{id_libro}_p{doc['pagina']}",
+                "_score": float(sum(marcadas)),
+                "_source": _filtrar_source(doc, internos.get("_source")),
+                "highlight": {"texto": [" ".join(trozo)]},
+            })
+        hits.sort(key=lambda h: -h["_score"])
+        return {internos["name"]: {"hits": {"total": {"value": len(hits), "relation": "eq"},
+                                            "hits": hits[:internos["size"]]}}}
+
+    def _sugerir(self, nombres: List[str], datos: Dict[str, Any]) -> Tuple[int, Any]:
+        # match sobre titulo.prefijos: cada palabra de la consulta es prefijo
+        # de alguna palabra del título
+        consulta = datos["query"]["match"]["titulo.prefijos"]["query"]
+        palabras = normalizar_titulo(consulta).split()
+        hits = []
+        for nombre in nombres:
+            for _id, fuente in self.indices[nombre].docs.items():
+                titulo = normalizar_titulo(fuente.get("titulo") or "").split()
+                if palabras and all(any(t.startswith(p[:20]) for t in titulo) for p in palabras):
+                    hits.append({"_index": nombre, "_id": _id, "_score": 1.0,
+                                 "_source": _filtrar_source(fuente, datos.get("_source"))})
+        tamano = int(datos.get("size", 10))
+        return 200, {"took": 0, "timed_out": False,
+                     "hits": {"total": {"value": len(hits), "relation": "eq"}, "hits": hits[:tamano]}}
+
+    def _buscar(self, nombres: List[str], datos: Dict[str, Any], pit: Optional[str] = None) -> Tuple[int, Any]:
+        if "titulo.prefijos" in datos.get("query", {}).get("match", {}):
+            return self._sugerir(nombres, datos)
+        inicio = time.monotonic()
+        tamano = int(datos.get("size", 10))
+        texto = self._texto_consulta(datos.get("query", {}))
+
+        filtros = datos.get("query", {}).get("bool", {}).get("filter", [])
+        # Los pasajes ya no entran en el BM25; el resto de must_not (p. ej.
+        # los casi duplicados) se aplica como un filtro negado
+        excluir = [
+            c for c in datos.get("query", {}).get("bool", {}).get("must_not", [])
+            if c != {"term": {"tipo": "pasaje"}}
+        ]
+        agregaciones = None
+        if filtros or datos.get("aggs"):
+            resultados, total, agregaciones = self._buscar_filtrando(nombres, datos, texto, filtros, excluir)
+        else:
+            resultados, total = self._buscar_bm25(nombres, datos, texto, excluir)
+        resultados.sort(key=lambda r: (-r["score"], _clave_id(r["id_libro"])))
+        if datos.get("collapse"):
+            resultados = self._plegar(resultados, datos)
+        resultados = resultados[:tamano]
+
+        track = datos.get("track_total_hits", _TOTAL_EXACTO_POR_DEFECTO)
+        limite = total if track is True else (int(track) if track is not False else 0)
+        total_obj = {"value": min(total, limite), "relation": "eq" if total <= limite else "gte"}
+
+        # Los libros que solo coinciden por el texto de sus pasajes no salen
+        # (el BM25 local no lo ve), pero los que salen traen sus inner_hits
+        has_child = self._consulta_pasajes(datos.get("query", {}))
+        hits = []
+        for r in resultados:
+            nombre = r.pop("_index")
+            score = r.pop("score")
+            fuente = self.indices[nombre].docs.get(str(r["id_libro"]), r)
+            hit = {
+                "_index": nombre,
+                "_id": str(r["id_libro"]),
+                "_score": score,
+                "_source": _filtrar_source(fuente, datos.get("_source")),
+                "sort": [score, r["id_libro"]],
+            }
+            if has_child:
+                hit["inner_hits"] = self._pasajes_del_hit(nombre, r["id_libro"], has_child)
+            hits.append(hit)
+
+        respuesta = {
+            "took": int((time.monotonic() - inicio) * 1000),
+            "timed_out": False,
+            "hits": {"total": total_obj, "max_score": hits[0]["_score"] if hits else None, "hits": hits},
+        }
+        if track is False:
+            # Sin track_total_hits Elasticsearch no devuelve el total
+            del respuesta["hits"]["total"]
+        if agregaciones is not None:
+            respuesta["aggregations"] = agregaciones
+        if pit:
+            respuesta["pit_id"] = pit
+        return 200, respuesta
+
+    def _plegar(self, resultados: List[Dict[str, Any]], datos: Dict[str, Any]) -> List[Dict[str, Any]]:
+        # collapse: el primer documento de cada valor del campo, ordenando
+        # antes por los campos de "sort" que no son _score ni id_libro
+        campo = datos["collapse"]["field"]
+        previos = [
+            next(iter(c)) for c in datos.get("sort", [])
+            if isinstance(c, dict) and next(iter(c)) not in ("_score", "id_libro")
+        ]
+
+        def fuente(r: Dict[str, Any]) -> Dict[str, Any]:
+            return self.indices[r["_index"]].docs.get(str(r["id_libro"]), {})
+
+        resultados = sorted(resultados, key=lambda r: [bool(fuente(r).get(c)) for c in previos])
+        vistos = set()
+        plegados = []
+        for r in resultados:
+            valor = fuente(r).get(campo)
+            if valor not in vistos:
+                vistos.add(valor)
+                plegados.append(r)
+        return plegados
+
+    def _buscar_bm25(
+        self, nombres: List[str], datos: Dict[str, Any], texto: str, excluir: List[Dict[str, Any]]
+    ) -> Tuple[List[Dict], int]:
+        tamano = int(datos.get("size", 10))
+        resultados: List[Dict[str, Any]] = []
+        total = 0
+        for nombre in nombres:
+            bm25, claves = self.indices[nombre].bm25()
+            despues_de = None
+            if datos.get("search_after"):
+                score, id_libro = datos["search_after"][:2]
+                # ES desempata por id_libro; el índice local, por posición
+                # (la del último id <= id_libro, por si ya no existe)
+                despues_de = [score, bisect_right(claves, _clave_id(id_libro)) - 1]
+            # Con exclusiones se piden de más (el total es aproximado)
+            filas, n, _ = bm25.buscar(texto, tamano * 2 if excluir else tamano, despues_de)
+            if excluir:
+                docs = self.indices[nombre].docs
+                filas = [
+                    f for f in filas
+                    if not any(_cumple_filtro(docs.get(str(f["id_libro"]), {}), c) for c in excluir)
+                ]
+            total += n
+            resultados += [{**f, "_index": nombre} for f in filas]
+        return resultados, total
+
+    def _buscar_filtrando(
+        self,
+        nombres: List[str],
+        datos: Dict[str, Any],
+        texto: str,
+        filtros: List[Dict[str, Any]],
+        excluir: List[Dict[str, Any]],
+    ) -> Tuple[List[Dict], int, Optional[Dict]]:
+        # Con filtros o agregaciones se puntúan todos los documentos y se
+        # filtra después (lento, pero los sustitutos no buscan ser rápidos)
+        coinciden = []
+        for nombre in nombres:
+            indice = self.indices[nombre]
+            bm25, _ = indice.bm25()
+            filas, _, _ = bm25.buscar(texto, max(len(bm25), 1), None)
+            for fila in filas:
+                doc = indice.docs.get(str(fila["id_libro"]), {})
+                if all(_cumple_filtro(doc, f) for f in filtros) and not any(_cumple_filtro(doc, c) for c in excluir):
+                    coinciden.append(({**fila, "_index": nombre}, doc))
+
+        resultados = [r for r, _ in coinciden]
+        if datos.get("search_after"):
+            score, id_libro = datos["search_after"][:2]
+            resultados = [
+                r for r in resultados
+                if (-r["score"], _clave_id(r["id_libro"])) > (-score, _clave_id(id_libro))
+            ]
+        agregaciones = None
+        if datos.get("aggs"):
+            agregaciones = {n: _agregar([d for _, d in coinciden], a) for n, a in datos["aggs"].items()}
+        return resultados, len(coinciden), agregaciones
+
+
+def _cumple_filtro(doc: Dict[str, Any], clausula: Dict[str, Any]) -> bool:
+    # term / terms / range del contexto filter (los campos .keyword son el
+    # propio campo)
+    if "term" in clausula:
+        campo, valor = next(iter(clausula["term"].items()))
+        return doc.get(campo.replace(".keyword", "")) == valor
+    if "terms" in clausula:
+        campo, valores = next(iter(clausula["terms"].items()))
+        return doc.get(campo.replace(".keyword", "")) in valores
+    if "range" in clausula:
+        campo, rango = next(iter(clausula["range"].items()))
+        valor = doc.get(campo)
+        if valor is None:
+            return False
+        return rango.get("gte", valor) <= valor <= rango.get("lte", valor)
+    return True
+
+
+def _agregar(docs: List[Dict[str, Any]], agregacion: Dict[str, Any]) -> Dict[str, Any]:
+    # histogram y terms, con las cubetas como las devuelve Elasticsearch
+    if "histogram" in agregacion:
+        campo, ancho = agregacion["histogram"]["field"], agregacion["histogram"]["interval"]
+        cuenta = Counter((d[campo] // ancho) * ancho for d in docs if d.get(campo) is not None)
+        return {"buckets": [{"key": float(k), "doc_count": n} for k, n in sorted(cuenta.items())]}
+    campo = agregacion["terms"]["field"].replace(".keyword", "")
+    cuenta = Counter(d[campo] for d in docs if d.get(campo) is not None)
+    return {"buckets": [{"key": k, "doc_count": n} for k, n in cuenta.most_common(agregacion["terms"].get("size", 10))]}
+
+
+def _filtrar_source(fuente: Dict[str, Any], filtro: Any) -> Dict[str, Any]:
+    if filtro is None or filtro is True:
+        return fuente
+    if filtro is False:
+        return {}
+    incluir = filtro if isinstance(filtro, list) else filtro.get("includes", list(fuente))
+    return {k: v for k, v in fuente.items() if any(fnmatch.fnmatch(k, p) for p in incluir)}
+
+
+def _respuesta(servidor: ElasticFalso, config, metodo: str, ruta: str, cuerpo: Optional[bytes]) -> NodeApiResponse:
+    status, datos = servidor.atender(metodo, ruta, cuerpo)
+    cabeceras = HttpHeaders({"content-type": "application/json", "x-elastic-product": "Elasticsearch"})
+    contenido = b"" if datos is None else json.dumps(datos).encode("utf-8")
+    return NodeApiResponse(ApiResponseMeta(status, "1.1", cabeceras, servidor.latencia, config), contenido)
+
+
+class NodoFalso(BaseNode):
+    servidor: ElasticFalso
+
+    def perform_request(self, method, target, body=None, headers=None, request_timeout=None):
+        if self.servidor.latencia:
+            time.sleep(self.servidor.latencia)
+        return _respuesta(self.servidor, self.config, method, target, body)
+
+    def close(self) -> None:
+        pass
+
+
+class NodoFalsoAsincrono(BaseAsyncNode):
+    servidor: ElasticFalso
+
+    async def perform_request(self, method, target, body=None, headers=None, request_timeout=None):
+        if self.servidor.latencia:
+            await asyncio.sleep(self.servidor.latencia)
+        return _respuesta(self.servidor, self.config, method, target, body)
+
+    async def close(self) -> None:
+        pass
+
+
+# ---------------------------------------------------------------------
+# MongoDB
+# ---------------------------------------------------------------------
+def _cumple(doc: Dict[str, Any], filtro: Dict[str, Any]) -> bool:
+    for campo, condicion in filtro.items():
+        if isinstance(condicion, dict) and "$in" in condicion:
+            if doc.get(campo) not in condicion["$in"]:
+                return False
+        elif isinstance(condicion, dict) and "$ne" in condicion:
+            if doc.get(campo) == condicion["$ne"]:
+                return False
+        elif doc.get(campo) != condicion:
+            return False
+    return True
+
+
+class _Cursor:
+    def __init__(self, docs: List[Dict[str, Any]]):
+        self._docs = docs
+
+    def batch_size(self, _n: int) -> "_Cursor":
+        return self
+
+    def __iter__(self):
+        return iter(self._docs)
+
+    def __aiter__(self):
+        async def _gen():
+            for doc in self._docs:
+                yield doc
+        return _gen()
+
+
+class ColeccionFalsa:
+    """
+    Colección en memoria indexada por id_libro (como el índice único que
+    crea asegurar_indices_mongo).
+    """
+
+    def __init__(self):
+        self.docs: Dict[Any, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def with_options(self, **_opciones) -> "ColeccionFalsa":
+        return self
+
+    def create_index(self, claves, **opciones) -> str:
+        return opciones.get("name", "indice")
+
+    def bulk_write(self, operaciones, ordered: bool = True) -> BulkWriteResult:
+        resultado = {"nUpserted": 0, "nModified": 0, "nMatched": 0}
+        with self._lock:
+            for op in operaciones:
+                id_libro = op._filter["id_libro"]
+                nuevo = op._doc["$set"]
+                actual = self.docs.get(id_libro)
+                if actual is None:
+                    self.docs[id_libro] = dict(nuevo)
+                    resultado["nUpserted"] += 1
+                else:
+                    resultado["nMatched"] += 1
+                    if any(actual.get(k) != v for k, v in nuevo.items()):
+                        actual.update(nuevo)
+                        resultado["nModified"] += 1
+        return BulkWriteResult(resultado, True)
+
+    def find(self, filtro: Optional[Dict] = None, proyeccion: Optional[Dict] = None) -> _Cursor:
+        filtro = filtro or {}
+        campos = [k for k, v in (proyeccion or {}).items() if v and k != "_id"]
+        with self._lock:
+            if set(filtro) == {"id_libro"} and "$in" in filtro["id_libro"]:
+                candidatos = [self.docs[i] for i in filtro["id_libro"]["$in"] if i in self.docs]
+            else:
+                candidatos = [d for d in self.docs.values() if _cumple(d, filtro)]
+        if campos:
+            candidatos = [{k: d[k] for k in campos if k in d} for d in candidatos]
+        return _Cursor(candidatos)
+
+    def find_one(self, filtro: Optional[Dict] = None, proyeccion: Optional[Dict] = None) -> Optional[Dict[str, Any]]:
+        return next(iter(self.find(filtro, proyeccion)), None)
+
+    def update_many(self, filtro: Dict[str, Any], cambios: Dict[str, Any]) -> UpdateResult:
+        with self._lock:
+            if set(filtro) == {"id_libro"} and "$in" in filtro["id_libro"]:
+                docs = [self.docs[i] for i in filtro["id_libro"]["$in"] if i in self.docs]
+            else:
+                docs = [d for d in self.docs.values() if _cumple(d, filtro)]
+            for doc in docs:
+                doc.update(cambios.get("$set", {}))
+                for campo in cambios.get("$unset", {}):
+                    doc.pop(campo, None)
+        return UpdateResult({"n": len(docs), "nModified": len(docs)}, True)
+
+    def delete_many(self, filtro: Dict[str, Any]) -> DeleteResult:
+        with self._lock:
+            borrar = [i for i, d in self.docs.items() if _cumple(d, filtro)]
+            for i in borrar:
+                del self.docs[i]
+        return DeleteResult({"n": len(borrar)}, True)
+
+    def count_documents(self, filtro: Dict[str, Any]) -> int:
+        return sum(1 for d in self.docs.values() if _cumple(d, filtro))
+
+    def estimated_document_count(self) -> int:
+        return len(self.docs)
+
+
+class ColeccionFalsaAsincrona:
+    """
+    La misma colección con la interfaz de AsyncCollection.
+    """
+
+    def __init__(self, coleccion: ColeccionFalsa):
+        self._col = coleccion
+
+    def with_options(self, **_opciones) -> "ColeccionFalsaAsincrona":
+        return self
+
+    async def bulk_write(self, operaciones, ordered: bool = True) -> BulkWriteResult:
+        return self._col.bulk_write(operaciones, ordered)
+
+    def find(self, filtro=None, proyeccion=None) -> _Cursor:
+        return self._col.find(filtro, proyeccion)
+
+    async def update_many(self, filtro, cambios) -> UpdateResult:
+        return self._col.update_many(filtro, cambios)
+
+    async def delete_many(self, filtro) -> DeleteResult:
+        return self._col.delete_many(filtro)
+
+    async def count_documents(self, filtro) -> int:
+        return self._col.count_documents(filtro)
+
+    async def estimated_document_count(self) -> int:
+        return self._col.estimated_document_count()
+
+
+class MongoFalso:
+    """
+    Sustituye a MongoClient: cliente[base][coleccion]. Con `asincrono` las
+    colecciones tienen la interfaz de AsyncMongoClient y comparten los datos.
+    """
+
+    def __init__(self, colecciones: Optional[Dict[str, ColeccionFalsa]] = None, asincrono: bool = False):
+        self._colecciones = colecciones if colecciones is not None else {}
+        self._asincrono = asincrono
+
+    def asincrono(self) -> "MongoFalso":
+        return MongoFalso(self._colecciones, asincrono=True)
+
+    def __getitem__(self, base: str) -> "_BaseFalsa":
+        return _BaseFalsa(self, base)
+
+    def _coleccion(self, base: str, nombre: str):
+        col = self._colecciones.setdefault(f"{base}.{nombre}", ColeccionFalsa())
+        return ColeccionFalsaAsincrona(col) if self._asincrono else col
+
+    async def close(self) -> None:
+        pass
+
+
+class _BaseFalsa:
+    def __init__(self, cliente: MongoFalso, nombre: str):
+        self._cliente = cliente
+        self._nombre = nombre
+
+    def __getitem__(self, coleccion: str):
+        return self._cliente._coleccion(self._nombre, coleccion)
+
+
+# ---------------------------------------------------------------------
+# Instalación en los módulos de Helpers
+# ---------------------------------------------------------------------
+def instalar_sustitutos(latencia_es: float = 0.0) -> ElasticFalso:
+    """
+    Sustituye los clientes compartidos de Helpers (síncronos y asíncronos)
+    por los de memoria. Hay que llamarla antes de importar app.py.
+    """
+    from elasticsearch import AsyncElasticsearch, Elasticsearch
+
+    from Helpers import elastic, elastic_async, mongoDB, mongoDB_async
+    from Helpers.asincrono import ejecutar
+
+    servidor = ElasticFalso(latencia_es)
+    nodo = type("Nodo", (NodoFalso,), {"servidor": servidor})
+    nodo_asincrono = type("NodoAsincrono", (NodoFalsoAsincrono,), {"servidor": servidor})
+
+    elastic._es_client = Elasticsearch("http://elastic-falso:9200", node_class=nodo)
+
+    async def _cliente_asincrono():
+        return AsyncElasticsearch("http://elastic-falso:9200", node_class=nodo_asincrono)
+
+    elastic_async._es_client = ejecutar(_cliente_asincrono())
+
+    mongo = MongoFalso()
+    mongoDB._client = mongo
+    mongoDB_async._client = mongo.asincrono()
+    return servidor
@@ -0,0 +1,19 @@
+# proyecto_bigdata/gunicorn.conf.py
+# Gunicorn lo carga automáticamente si se arranca desde esta carpeta.
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+# Nada de preload: cada worker crea sus clientes (ES / Mongo) después del fork.
+preload_app = False
+
+
+def worker_exit(server, worker):
+    """Cierra los clientes (síncronos y asíncronos) del worker antes de salir."""
+    from Helpers.asincrono import cerrar_loop
+    from Helpers.elastic import cerrar_es_client
+
+    cerrar_es_client()
+    cerrar_loop()
@@ -1,224 +1,421 @@
-from google.colab import drive
-drive.mount('/content/drive')
-
-!pip install PyPDF2
-
-#Conectar elasticsearch desde Colab (usando la NUEVA API key)
-
-!pip install elasticsearch tqdm
-
-from elasticsearch import Elasticsearch
-
-ES_CLOUD_ID = "6a9307eaf924496cab8833fc259c98c9:dXMtY2VudHJhbDEuZ2NwLmNsb3VkLmVzLmlvOjQ0MyQ1NWE3OWY1NzY5YmE0ZTBmYTU4NGY5MDI2MzliOWE5NSQ0N2VlNmQ5M2M1YWM0OGM1YjQyMzAyNDY5MzI5ZWYzNg=="
-ES_API_KEY   = "czl4ZTJKb0JTWHI2NmlYUzFIY286VUhfUmZidjdCQVcwSjdESFEybXl5Zw=="
-
-es = Elasticsearch(
-    ES_CLOUD_ID,
-    api_key=ES_API_KEY,
-    verify_certs=True
-)
-
-print(es.info())
-
+# proyecto_bigdata/scripts/generar_json_libros.py
+#
+# Genera el catálogo (NDJSON) a partir de la carpeta de PDFs y lo carga en
+# Elasticsearch con el motor de indexación de Helpers/elastic.py.
+#
+# Uso (desde proyecto_bigdata/):
+#   python scripts/generar_json_libros.py generar
+#   python scripts/generar_json_libros.py cargar [ruta_json_o_ndjson]
+#   python scripts/generar_json_libros.py indice-local [ruta_json_o_ndjson]
+#   python scripts/generar_json_libros.py similares [ruta_json_o_ndjson]
+#   python scripts/generar_json_libros.py duplicados [ruta_json_o_ndjson]
+#   python scripts/generar_json_libros.py pln [ruta_json_o_ndjson]
+#   python scripts/generar_json_libros.py miniaturas [ruta_json_o_ndjson]
+#   python scripts/generar_json_libros.py mongo-repetidos [--borrar]
+#
+# En Colab: montar Drive (drive.mount('/content/drive')), instalar
+# requirements.txt y ejecutar los mismos comandos.
 import os
-import re
+import sys
 import json
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Helpers.elastic import (  # noqa: E402
+    CONSULTA_SOLO_LIBROS,
+    PASAJES_MAX_CARACTERES,
+    abortar_carga,
+    coleccion_desde_ruta,
+    finalizar_carga,
+    get_es_client,
+    indexar_documentos,
+    iniciar_carga,
+)
+from Helpers.descargas import GeneradorMiniaturas  # noqa: E402
+from Helpers.bm25 import BM25_RUTA, reconstruir_indice_local  # noqa: E402
+from Helpers.duplicados import (  # noqa: E402
+    DUPLICADOS_RUTA,
+    copiar_grupos,
+    informe_duplicados,
+    marcar_catalogo,
+)
+from Helpers.ingesta import iterar_json_libros, iterar_libros_normalizados, iterar_lotes  # noqa: E402
+from Helpers.pdfs import extraer_pdf, huella_archivo  # noqa: E402
+from Helpers.mongoDB import eliminar_repetidos_mongo, informe_repetidos_mongo  # noqa: E402
+from Helpers.PLN import PLN_ACTIVO, TuberiaPLN, dividir_pasajes, procesar_libros  # noqa: E402
+from Helpers.similares import SIMILARES_RUTA, AcumuladorSimilares  # noqa: E402
+
+# ======================================================
+# RUTAS (se pueden cambiar con variables de entorno)
+# ======================================================
 
 # Carpeta donde tienes los PDFs
-CARPETA_PDFS = "/content/drive/MyDrive/Ucentral/2025S2/BigData/Final/Data/minibiblioteca"
+CARPETA_PDFS = os.getenv(
+    "CARPETA_PDFS",
+    "/content/drive/MyDrive/Ucentral/2025S2/BigData/Final/Data/minibiblioteca",
+)
 
 # Carpeta donde quieres guardar el JSON
-CARPETA_SALIDA = "/content/drive/MyDrive/Ucentral/2025S2/BigData/Final/Data"
-
-# Nombre del JSON final
-RUTA_JSON_SALIDA = os.path.join(CARPETA_SALIDA, "libros_minibiblioteca.json")
-
-
-
-
-documentos = []
-errores = []
-
-print("Carpeta PDFs existe:", os.path.exists(CARPETA_PDFS))
-print("Archivos encontrados:", len(os.listdir(CARPETA_PDFS)))
-
-for nombre in os.listdir(CARPETA_PDFS):
-    if not nombre.lower().endswith(".pdf"):
-        continue  # ignorar archivos que no sean PDF
-
-    ruta_pdf = os.path.join(CARPETA_PDFS, nombre)
-    print("Procesando:", nombre)
-
-    try:
-        # título provisional = nombre del archivo sin extensión
-        titulo = os.path.splitext(nombre)[0]
-
-        # intentar extraer año del nombre
-        anio = extraer_anio_desde_nombre(nombre)
-
-        doc = {
-            "id_libro": len(documentos) + 1,
-            "titulo": titulo,
-            "ruta_pdf": ruta_pdf
-        }
+CARPETA_SALIDA = os.getenv(
+    "CARPETA_SALIDA",
+    "/content/drive/MyDrive/Ucentral/2025S2/BigData/Final/Data",
+)
 
-        documentos.append(doc)
+# Catálogo en NDJSON (un libro por línea, con el texto de cada página)
+RUTA_NDJSON_SALIDA = os.path.join(CARPETA_SALIDA, "libros_minibiblioteca.ndjson")
 
-    except Exception as e:
-        print(f"  -> ERROR al procesar {nombre}: {e}")
-        errores.append({"archivo": nombre, "motivo": "error", "detalle": str(e)})
+# Tamaño / fecha / hash de cada PDF ya procesado, para no repetirlo
+RUTA_MANIFIESTO = os.path.join(CARPETA_SALIDA, "manifiesto_libros.json")
 
-print("\nResumen:")
-print("Documentos creados correctamente:", len(documentos))
-print("Archivos con problemas:", len(errores))
+# Archivos que no se pudieron procesar en la última ejecución
+RUTA_ERRORES = os.path.join(CARPETA_SALIDA, "errores_extraccion.json")
 
-# Crear carpeta de salida si no existe
-os.makedirs(CARPETA_SALIDA, exist_ok=True)
+# Grupos de casi duplicados para revisar (un grupo por línea)
+RUTA_INFORME_DUPLICADOS = os.path.join(CARPETA_SALIDA, "duplicados.ndjson")
 
-# Guardar el JSON con todos los libros procesados
-with open(RUTA_JSON_SALIDA, "w", encoding="utf-8") as f:
-    json.dump(documentos, f, ensure_ascii=False, indent=2)
+# Procesos que extraen texto en paralelo
+PROCESOS = int(os.getenv("PROCESOS_EXTRACCION", str(os.cpu_count() or 1)))
 
-print("\nJSON guardado en:", RUTA_JSON_SALIDA)
+# Procesos de la etapa de PLN: aquí no hay más workers, se usan todas las CPUs
+PROCESOS_PLN = int(os.getenv("PLN_PROCESOS", str(os.cpu_count() or 1)))
 
-# Crear el índice
 
-INDEX_NAME = "libros_bigdata"
+# ======================================================
+# 1) Generar el catálogo a partir de los PDFs
+# ======================================================
+def listar_pdfs(carpeta):
+    for raiz, _, archivos in os.walk(carpeta):
+        for nombre in sorted(archivos):
+            if nombre.lower().endswith(".pdf"):  # ignorar archivos que no sean PDF
+                yield os.path.join(raiz, nombre)
+
+
+def cargar_manifiesto():
+    if not os.path.exists(RUTA_MANIFIESTO):
+        return {}
+    with open(RUTA_MANIFIESTO, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def guardar_atomico(ruta, escribir):
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        escribir(f)
+    os.replace(temporal, ruta)
+
+
+def generar_catalogo():
+    """
+    Extrae texto y metadatos de los PDFs nuevos o modificados (en paralelo) y
+    escribe el catálogo NDJSON. Los PDFs sin cambios (mismo tamaño y fecha, o
+    mismo hash) reutilizan su registro de la ejecución anterior.
+    """
+    print("Carpeta PDFs existe:", os.path.exists(CARPETA_PDFS))
+
+    anterior = cargar_manifiesto()
+    manifiesto = {}
+    pendientes = []
+    errores = []
+    siguiente_id = max((m["id_libro"] for m in anterior.values()), default=0) + 1
+
+    for ruta_pdf in listar_pdfs(CARPETA_PDFS):
+        try:
+            st = os.stat(ruta_pdf)
+            previo = anterior.get(ruta_pdf)
+            entrada = {"tamano": st.st_size, "mtime": st.st_mtime}
+
+            if previo and previo["tamano"] == st.st_size and previo["mtime"] == st.st_mtime:
+                manifiesto[ruta_pdf] = previo
+                continue
+
+            entrada["sha256"] = huella_archivo(ruta_pdf)
+            if previo and previo.get("sha256") == entrada["sha256"]:
+                manifiesto[ruta_pdf] = {**previo, **entrada}
+                continue
+
+            entrada["id_libro"] = previo["id_libro"] if previo else siguiente_id
+            if not previo:
+                siguiente_id += 1
+            pendientes.append((ruta_pdf, entrada))
+        except Exception as e:
+            print(f"  -> ERROR al procesar {ruta_pdf}: {e}")
+            errores.append({"archivo": ruta_pdf, "motivo": "lectura", "detalle": str(e)})
+
+    sin_cambios = {m["id_libro"] for m in manifiesto.values()}
+    print("PDFs sin cambios:", len(sin_cambios))
+    print("PDFs nuevos o modificados:", len(pendientes))
+
+    os.makedirs(CARPETA_SALIDA, exist_ok=True)
+
+    def escribir_catalogo(salida):
+        # 1) Registros sin cambios, copiados línea a línea del catálogo anterior
+        if sin_cambios and os.path.exists(RUTA_NDJSON_SALIDA):
+            with open(RUTA_NDJSON_SALIDA, "r", encoding="utf-8") as f:
+                for linea in f:
+                    if linea.strip() and json.loads(linea)["id_libro"] in sin_cambios:
+                        salida.write(linea if linea.endswith("\n") else linea + "\n")
+
+        # 2) PDFs nuevos o modificados, escritos a medida que terminan (como
+        #    mucho 4 por proceso en vuelo, para no acumular textos en memoria)
+        procesados = 0
+        cola = iter(pendientes)
+        with ProcessPoolExecutor(max_workers=max(PROCESOS, 1)) as pool:
+            en_vuelo = {}
+            while True:
+                for ruta_pdf, entrada in cola:
+                    en_vuelo[pool.submit(extraer_pdf, ruta_pdf)] = (ruta_pdf, entrada)
+                    if len(en_vuelo) >= 4 * max(PROCESOS, 1):
+                        break
+                if not en_vuelo:
+                    break
+
+                listos, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                for futuro in listos:
+                    ruta_pdf, entrada = en_vuelo.pop(futuro)
+                    procesados += 1
+                    try:
+                        datos = futuro.result()
+                    except Exception as e:
+                        print(f"  -> ERROR al procesar {ruta_pdf}: {e}")
+                        errores.append({"archivo": ruta_pdf, "motivo": "extraccion", "detalle": str(e)})
+                        continue
+
+                    doc = {"id_libro": entrada["id_libro"], **datos, "ruta_pdf": ruta_pdf}
+                    salida.write(json.dumps(doc, ensure_ascii=False) + "\n")
+                    manifiesto[ruta_pdf] = entrada
+                    print(f"[{procesados}/{len(pendientes)}] Procesado: {os.path.basename(ruta_pdf)}")
+
+    guardar_atomico(RUTA_NDJSON_SALIDA, escribir_catalogo)
+    guardar_atomico(RUTA_MANIFIESTO, lambda f: json.dump(manifiesto, f, ensure_ascii=False, indent=2))
+    guardar_atomico(RUTA_ERRORES, lambda f: json.dump(errores, f, ensure_ascii=False, indent=2))
+
+    print("\nResumen:")
+    print("Libros en el catálogo:", len(manifiesto))
+    print("Archivos con problemas:", len(errores))
+    print("\nCatálogo guardado en:", RUTA_NDJSON_SALIDA)
 
-mapping = {
-    "mappings": {
-        "properties": {
-            "id_libro":  {"type": "integer"},
-            "titulo":    {"type": "text"},
-            "ruta_pdf":  {"type": "keyword"}
-        }
-    }
-}
 
-# Si ya existía, se borra
-if es.indices.exists(index=INDEX_NAME):
-    es.indices.delete(index=INDEX_NAME)
+# ======================================================
+# 2) Cargar el JSON en Elasticsearch
+# ======================================================
+def cargar_json(ruta_json):
+    # Se lee en streaming: sirve igual para JSON y NDJSON de cualquier tamaño
+    with open(ruta_json, "r", encoding="utf-8") as f:
+        for d in iterar_json_libros(f):
+            limpio = {
+                "id_libro": d.get("id_libro"),
+                "titulo": d.get("titulo"),
+                "autor": d.get("autor"),
+                "anio": d.get("anio"),
+                "num_paginas": d.get("num_paginas"),
+                "ruta_pdf": d.get("ruta_pdf"),
+                "coleccion": d.get("coleccion") or coleccion_desde_ruta(d.get("ruta_pdf")),
+            }
+            # El texto va a Elasticsearch como pasajes (hijos del libro)
+            pasajes = dividir_pasajes(d.get("texto_paginas"), PASAJES_MAX_CARACTERES)
+            if pasajes:
+                limpio["pasajes"] = pasajes
+            # quitar campos None
+            yield {k: v for k, v in limpio.items() if v is not None}
 
-es.indices.create(index=INDEX_NAME, body=mapping)
-print("Índice creado:", INDEX_NAME)
 
+def verificar(client, index_name):
+    if not client.indices.exists(index=index_name):
+        print("El índice NO existe.")
+        return
 
-#Cargar tu JSON libros_minibiblioteca.json
+    count = client.count(index=index_name, query=CONSULTA_SOLO_LIBROS)["count"]
+    print(f"Libros en el índice: {count}")
 
-import json
-from tqdm import tqdm
+    if count > 0:
+        print("\nEjemplos:")
+        hits = client.search(index=index_name, query=CONSULTA_SOLO_LIBROS, size=5)["hits"]["hits"]
+        for h in hits:
+            print(h["_source"])
 
-RUTA_JSON = "/content/drive/MyDrive/Ucentral/2025S2/BigData/Final/Data/libros_minibiblioteca.json"
 
-with open(RUTA_JSON, "r", encoding="utf-8") as f:
-    libros = json.load(f)
+def cargar_en_elastic(ruta_json):
+    es = get_es_client()
+    print("Ping Elasticsearch:", es.ping())
 
-print("Libros en JSON:", len(libros))
+    # Nueva generación del índice (settings y mappings de Helpers/elastic.py);
+    # el alias sigue sirviendo la anterior
+    indice = iniciar_carga()
+    print("Índice creado:", indice)
 
-for libro in tqdm(libros):
-    # quitar campos None
-    doc = {k: v for k, v in libro.items() if v is not None}
-    # usar id_libro como ID de documento
-    es.index(index=INDEX_NAME, id=doc["id_libro"], document=doc)
+    try:
+        # Con la etapa de PLN, cada libro llega con palabras clave y resumen
+        libros = cargar_json(ruta_json)
+        if PLN_ACTIVO:
+            with TuberiaPLN(procesos=PROCESOS_PLN) as tuberia:
+                resultado = indexar_documentos(procesar_libros(libros, tuberia=tuberia), indice)
+        else:
+            resultado = indexar_documentos(libros, indice)
+        finalizar_carga(indice)
+    except Exception:
+        abortar_carga(indice)
+        raise
+
+    print(
+        f"✔ Bulk OK: {resultado['indexados']} indexados, "
+        f"{resultado['fallidos']} con error, "
+        f"{resultado['pasajes']} pasajes "
+        f"({resultado['docs_por_segundo']} docs/s)"
+    )
+    for error in resultado["errores"]:
+        print(f"  -> ERROR id_libro={error['id']}: [{error['status']}] {error['error']}")
 
-print("Carga terminada.")
+    verificar(es, indice)
 
-import os
-import json
-from elasticsearch import Elasticsearch, helpers
 
 # ======================================================
-# VARIABLES DESDE RENDER
+# 3) Índice local de búsqueda (sin Elasticsearch)
 # ======================================================
+def generar_indice_local(ruta_json):
+    if not BM25_RUTA:
+        print("Falta BM25_RUTA (archivo donde guardar el índice local).")
+        sys.exit(1)
 
-ES_CLOUD_ID = os.getenv("ES_CLOUD_ID")      # << ESTA ES LA BUENA
-ES_API_KEY  = os.getenv("ES_API_KEY")
-INDEX_NAME  = "libros_bigdata"
-
-RUTA_JSON = "/content/drive/MyDrive/Ucentral/2025S2/BigData/Final/Data/libros_minibiblioteca.json"
+    with open(ruta_json, "r", encoding="utf-8") as f:
+        resultado = reconstruir_indice_local(iterar_libros_normalizados(f))
+    print(f"Índice local: {resultado['libros']} libros en {resultado['segundos']} s -> {BM25_RUTA}")
 
 
 # ======================================================
-def get_es_client():
-    if not ES_CLOUD_ID:
-        raise ValueError("ES_CLOUD_ID no está definido (Render no lo envió).")
+# 4) Libros parecidos (sin Elasticsearch)
+# ======================================================
+def generar_similares(ruta_json):
+    if not SIMILARES_RUTA:
+        print("Falta SIMILARES_RUTA (archivo donde guardar los vecinos).")
+        sys.exit(1)
 
-    client = Elasticsearch(
-        cloud_id=ES_CLOUD_ID,
-        api_key=ES_API_KEY
+    # Los libros que no cambiaron desde la última vez no se vuelven a vectorizar
+    similares = AcumuladorSimilares()
+    with open(ruta_json, "r", encoding="utf-8") as f:
+        for libro in iterar_libros_normalizados(f):
+            similares.anadir_lote([libro])
+    resultado = similares.actualizar(conservar_no_vistos=False)
+    print(
+        f"Similares: {resultado['libros']} libros ({resultado['vectorizados']} vectorizados, "
+        f"vecinos recalculados de {resultado['recalculados']}) en {resultado['segundos']} s -> {SIMILARES_RUTA}"
     )
-    return client
 
 
-def ping_es(client):
-    print("Ping Elasticsearch:", client.ping())
+# ======================================================
+# 5) Informe de casi duplicados
+# ======================================================
+def generar_informe_duplicados(ruta_json=None):
+    if not DUPLICADOS_RUTA:
+        print("Falta DUPLICADOS_RUTA (archivo con las firmas y los grupos).")
+        sys.exit(1)
+
+    # Sin catálogo se informa de los grupos que dejó la última carga. Con
+    # catálogo se agrupa sobre una copia temporal (las firmas que ya estaban
+    # no se recalculan): el archivo de las cargas no se toca
+    with tempfile.TemporaryDirectory() as temporal:
+        ruta = DUPLICADOS_RUTA
+        if ruta_json:
+            ruta = os.path.join(temporal, "duplicados.sqlite")
+            copiar_grupos(ruta)
+            with open(ruta_json, "r", encoding="utf-8") as f:
+                resultado = marcar_catalogo(iterar_libros_normalizados(f), ruta)
+            print(
+                f"Duplicados: {resultado['libros']} libros ({resultado['firmados']} firmados) "
+                f"en {resultado['segundos']} s"
+            )
+        escribir_informe_duplicados(ruta)
+
+
+def escribir_informe_duplicados(ruta):
+    grupos = libros = 0
+
+    def escribir(salida):
+        nonlocal grupos, libros
+        for grupo in informe_duplicados(ruta):
+            salida.write(json.dumps(grupo, ensure_ascii=False) + "\n")
+            grupos += 1
+            libros += len(grupo["libros"])
+            if grupos <= 10:
+                canonico, *otros = grupo["libros"]
+                print(f"\n[{canonico['id_libro']}] {canonico['titulo']}  ({canonico['ruta_pdf']})")
+                for otro in otros:
+                    print(f"   = [{otro['id_libro']}] {otro['titulo']}  ({otro['ruta_pdf']})")
+
+    guardar_atomico(RUTA_INFORME_DUPLICADOS, escribir)
+    print(f"\n{grupos} grupos con {libros} libros -> {RUTA_INFORME_DUPLICADOS}")
 
 
-def cargar_json(ruta_json):
-    with open(ruta_json, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    limpio = []
-    for d in data:
-        limpio.append({
-            "id_libro": d.get("id_libro"),
-            "titulo": d.get("titulo"),
-            "autor": d.get("autor"),
-            "ruta_pdf": d.get("ruta_pdf"),
-        })
-
-    print(f"Se cargaron {len(limpio)} libros (solo metadatos).")
-    return limpio
-
-
-def bulk_index(client, index_name, docs):
-    acciones = (
-        {
-            "_index": index_name,
-            "_id": d["id_libro"],
-            "_source": d
-        }
-        for d in docs
+# ======================================================
+# 6) Etapa de PLN (para medir su velocidad y llenar la caché)
+# ======================================================
+def generar_pln(ruta_json):
+    with TuberiaPLN(procesos=PROCESOS_PLN) as tuberia, open(ruta_json, "r", encoding="utf-8") as f:
+        for _ in procesar_libros(iterar_libros_normalizados(f), tuberia=tuberia):
+            pass
+        resultado = tuberia.resumen()
+    print(
+        f"PLN: {resultado['libros']} libros ({resultado['procesados']} procesados, "
+        f"{resultado['en_cache']} en caché) en {resultado['segundos']} s "
+        f"-> {resultado['docs_por_segundo']} libros/s con {tuberia.procesos} procesos"
     )
 
-    helpers.bulk(client, acciones)
-    print("✔ Bulk OK")
 
+# ======================================================
+# 7) Miniaturas de la primera página (sin pasar por una carga)
+# ======================================================
+def generar_miniaturas(ruta_json):
+    total = {"generadas": 0, "al_dia": 0, "sin_pdf": 0, "fallidas": 0}
+    with GeneradorMiniaturas() as generador, open(ruta_json, "r", encoding="utf-8") as f:
+        if not generador.activo:
+            print("Hacen falta MINIATURAS_DIR, PDFS_RAIZ y pdftoppm (poppler-utils).")
+            sys.exit(1)
+        for lote in iterar_lotes(iterar_libros_normalizados(f), 500):
+            for clave, valor in generador.generar_lote(lote).items():
+                total[clave] += valor
+            print(f"Miniaturas: {total}")
 
-def verificar(client, index_name):
-    if not client.indices.exists(index=index_name):
-        print("El índice NO existe.")
-        return
-
-    count = client.count(index=index_name)["count"]
-    print(f"Documentos en el índice: {count}")
 
-    if count > 0:
-        print("\nEjemplos:")
-        hits = client.search(index=index_name, size=5)["hits"]["hits"]
-        for h in hits:
-            print(h["_source"])
+# ======================================================
+# 8) Libros repetidos por id_libro en MongoDB (cargas antiguas)
+# ======================================================
+def revisar_repetidos_mongo(borrar):
+    informe = informe_repetidos_mongo()
+    print(f"id_libro repetidos: {informe['ids_repetidos']} ({informe['sobrantes']} documentos de sobra)")
+    for ejemplo in informe["ejemplos"]:
+        print(f"   [{ejemplo['id_libro']}] {ejemplo['copias']} copias")
+    if not informe["sobrantes"]:
+        return
+    if not borrar:
+        print("Nada borrado. Para dejar solo la última copia de cada uno: mongo-repetidos --borrar")
+        return
+    print("Documentos borrados:", eliminar_repetidos_mongo())
 
 
 # ======================================================
 if __name__ == "__main__":
-
-    es = get_es_client()
-    ping_es(es)
-
-    libros = cargar_json(RUTA_JSON)
-
-    if es.indices.exists(index=INDEX_NAME):
-        es.indices.delete(index=INDEX_NAME)
-        print("Índice borrado.")
-
-    es.indices.create(index=INDEX_NAME)
-    print("Índice creado.")
-
-    bulk_index(es, INDEX_NAME, libros)
-
-    verificar(es, INDEX_NAME)
-
-
-
-
+    comando = sys.argv[1] if len(sys.argv) > 1 else "cargar"
+
+    if comando == "generar":
+        generar_catalogo()
+    elif comando == "cargar":
+        cargar_en_elastic(sys.argv[2] if len(sys.argv) > 2 else RUTA_NDJSON_SALIDA)
+    elif comando == "indice-local":
+        generar_indice_local(sys.argv[2] if len(sys.argv) > 2 else RUTA_NDJSON_SALIDA)
+    elif comando == "similares":
+        generar_similares(sys.argv[2] if len(sys.argv) > 2 else RUTA_NDJSON_SALIDA)
+    elif comando == "duplicados":
+        generar_informe_duplicados(sys.argv[2] if len(sys.argv) > 2 else None)
+    elif comando == "pln":
+        generar_pln(sys.argv[2] if len(sys.argv) > 2 else RUTA_NDJSON_SALIDA)
+    elif comando == "miniaturas":
+        generar_miniaturas(sys.argv[2] if len(sys.argv) > 2 else RUTA_NDJSON_SALIDA)
+    elif comando == "mongo-repetidos":
+        revisar_repetidos_mongo("--borrar" in sys.argv[2:])
+    else:
+        print(
+            "Uso: generar_json_libros.py "
+            "[generar|cargar|indice-local|similares|duplicados|pln|miniaturas|mongo-repetidos] [ruta_json]"
+        )
+        sys.exit(1)
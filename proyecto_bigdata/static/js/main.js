@@ -13,3 +13,36 @@ document.addEventListener("DOMContentLoaded", function () {
     }, 4000);
   });
 });
+
+// Autocompletado de títulos: los inputs con data-sugerencias consultan esa
+// URL mientras se escribe y rellenan su <datalist>.
+document.addEventListener("DOMContentLoaded", function () {
+  document.querySelectorAll("input[data-sugerencias]").forEach((input) => {
+    const lista = document.getElementById(input.getAttribute("list"));
+    let espera = null;
+    let enCurso = null;
+
+    input.addEventListener("input", () => {
+      clearTimeout(espera);
+      espera = setTimeout(() => {
+        // Solo interesa la respuesta de la última pulsación
+        if (enCurso) enCurso.abort();
+        enCurso = new AbortController();
+
+        const url = input.dataset.sugerencias + "?q=" + encodeURIComponent(input.value);
+        fetch(url, { signal: enCurso.signal })
+          .then((r) => r.json())
+          .then((datos) => {
+            lista.replaceChildren(
+              ...datos.sugerencias.map((s) => {
+                const opcion = document.createElement("option");
+                opcion.value = s.titulo;
+                return opcion;
+              })
+            );
+          })
+          .catch(() => {});
+      }, 80);
+    });
+  });
+});